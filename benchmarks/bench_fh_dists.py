@@ -0,0 +1,164 @@
+"""
+Benchmark the per-frame F-H pair search of Calc_FH_Dists.
+
+Compares the cell-list (capped_distance) search against the previous
+per-frame "around" atom selection, the minimum image search in a ~100k atom
+solvated box (with and without the water hydrogens), the pair table against
+the sums of r^-6 only (sum_only), and the scaling of the parallel backend.
+Written in asv style, but can also be run directly with:
+python -m benchmarks.bench_fh_dists
+"""
+
+import timeit
+
+from MDAnalysis.analysis import distances
+
+from fluorelax.calc_fh_dists import Calc_FH_Dists
+from benchmarks.synthetic import make_universe, make_universe_on_disk, make_solvated_universe
+
+
+def around_selection_search(universe, dist=3):
+    """
+    Previous Calc_FH_Dists._single_frame path, for reference.
+    """
+    fluorine = universe.select_atoms("name F*")
+    for ts in universe.trajectory:
+        protons = universe.select_atoms(f"around {dist} name F*").select_atoms("name H*")
+        distances.distance_array(fluorine.positions, protons.positions)
+
+
+class FH_Search:
+    """
+    Time the F-H search over all frames for increasing system sizes.
+    """
+    params = [1000, 10000, 100000]
+    param_names = ["n_atoms"]
+
+    def setup(self, n_atoms):
+        self.universe = make_universe(n_atoms, n_frames=20)
+
+    def time_around_selection(self, n_atoms):
+        around_selection_search(self.universe)
+
+    def time_capped_distance(self, n_atoms):
+        Calc_FH_Dists(self.universe).run()
+
+
+class FH_Solvated:
+    """
+    Time the periodic F-H search over all frames of a ~100k atom solvated box.
+    """
+    params = [False, True]
+    param_names = ["include_water"]
+
+    def setup(self, include_water):
+        self.universe = make_solvated_universe(100000, n_frames=20)
+
+    def time_run(self, include_water):
+        Calc_FH_Dists(self.universe, include_water=include_water).run()
+
+    def track_n_pairs(self, include_water):
+        return Calc_FH_Dists(self.universe, include_water=include_water).run().results.n_pairs.sum()
+
+
+class FH_Skin:
+    """
+    Time the water F-H search with and without a Verlet neighbor list skin,
+    on a solvated box with MD-like (0.05 A per coordinate and frame) motion.
+    """
+    params = [None, 1.0, 2.0, 3.0]
+    param_names = ["skin"]
+
+    def setup(self, skin):
+        self.universe = make_solvated_universe(100000, n_frames=100, displacement=0.05)
+
+    def time_run(self, skin):
+        Calc_FH_Dists(self.universe, include_water=True, skin=skin).run()
+
+    def track_n_rebuilds(self, skin):
+        return Calc_FH_Dists(self.universe, include_water=True, skin=skin).run().results.n_rebuilds
+
+
+class FH_Sum_Only:
+    """
+    Time, peak memory and result size of the water F-H search at a 6 A cutoff,
+    keeping the pair table, only the sums of r^-6, or also the angular sums.
+    """
+    params = ["pairs", "sum_only", "angular"]
+    param_names = ["mode"]
+    options = {"pairs" : {}, "sum_only" : {"sum_only" : True},
+               "angular" : {"sum_only" : True, "angular" : True}}
+
+    def setup(self, mode):
+        self.universe = make_solvated_universe(100000, n_frames=20)
+
+    def run(self, mode):
+        return Calc_FH_Dists(self.universe, dist=6, include_water=True,
+                             **self.options[mode]).run()
+
+    def time_run(self, mode):
+        self.run(mode)
+
+    def peakmem_run(self, mode):
+        self.run(mode)
+
+    def track_result_bytes(self, mode):
+        return sum(value.nbytes for value in self.run(mode).results.values()
+                   if hasattr(value, "nbytes"))
+
+
+class FH_Parallel:
+    """
+    Time Calc_FH_Dists.run split across worker processes.
+    """
+    params = [1, 2, 4, 8]
+    param_names = ["n_workers"]
+
+    def setup(self, n_workers):
+        self.universe = make_universe_on_disk(100000, n_frames=64)
+
+    def time_run(self, n_workers):
+        backend = "serial" if n_workers == 1 else "multiprocessing"
+        Calc_FH_Dists(self.universe).run(n_workers=n_workers, backend=backend)
+
+
+if __name__ == "__main__":
+    bench = FH_Search()
+    print(f"{'n_atoms':>10} {'around (s)':>12} {'capped (s)':>12} {'speedup':>8}")
+    for n_atoms in FH_Search.params:
+        bench.setup(n_atoms)
+        around = min(timeit.repeat(lambda: bench.time_around_selection(n_atoms), number=1, repeat=3))
+        capped = min(timeit.repeat(lambda: bench.time_capped_distance(n_atoms), number=1, repeat=3))
+        print(f"{n_atoms:>10} {around:>12.4f} {capped:>12.4f} {around / capped:>8.1f}")
+
+    bench = FH_Solvated()
+    bench.setup(True)
+    print(f"\n{'include_water':>14} {'per frame (ms)':>15} {'pairs':>8}")
+    for include_water in FH_Solvated.params:
+        elapsed = min(timeit.repeat(lambda: bench.time_run(include_water), number=1, repeat=3))
+        print(f"{str(include_water):>14} {elapsed / 20 * 1000:>15.2f} "
+              f"{bench.track_n_pairs(include_water):>8}")
+
+    bench = FH_Skin()
+    bench.setup(None)
+    print(f"\n{'skin':>6} {'per frame (ms)':>15} {'rebuilds':>9}")
+    for skin in FH_Skin.params:
+        elapsed = min(timeit.repeat(lambda: bench.time_run(skin), number=1, repeat=3))
+        print(f"{str(skin):>6} {elapsed / 100 * 1000:>15.2f} {bench.track_n_rebuilds(skin):>9}")
+
+    bench = FH_Sum_Only()
+    bench.setup(None)
+    print(f"\n{'mode':>10} {'per frame (ms)':>15} {'result (kB)':>12}")
+    for mode in FH_Sum_Only.params:
+        elapsed = min(timeit.repeat(lambda: bench.time_run(mode), number=1, repeat=3))
+        print(f"{mode:>10} {elapsed / 20 * 1000:>15.2f} "
+              f"{bench.track_result_bytes(mode) / 1024:>12.1f}")
+
+    bench = FH_Parallel()
+    bench.setup(1)
+    print(f"\n{'n_workers':>10} {'run (s)':>12} {'speedup':>8}")
+    for n_workers in FH_Parallel.params:
+        elapsed = min(timeit.repeat(lambda: bench.time_run(n_workers), number=1, repeat=3))
+        if n_workers == 1:
+            serial = elapsed
+        print(f"{n_workers:>10} {elapsed:>12.4f} {serial / elapsed:>8.1f}")
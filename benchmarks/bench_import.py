@@ -0,0 +1,78 @@
+"""
+Benchmark the startup (import) cost of each fluorelax command.
+
+Each command runs in a fresh interpreter. The asv timeraw_* benchmarks track
+the wall time, and running this module directly also reports which heavy
+dependencies each command imported:
+python -m benchmarks.bench_import
+"""
+
+import os
+import subprocess
+import sys
+import time
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                    "fluorelax", "data")
+
+# code run in a fresh interpreter for each command
+COMMANDS = {
+    "import fluorelax" : "import fluorelax",
+    "fluorelax --help" : "from fluorelax.fluorelax import main\n"
+                         "try:\n    main(['--help'])\nexcept SystemExit:\n    pass",
+    "fluorelax-ensemble --help" : "import sys\nsys.argv = ['fluorelax-ensemble', '--help']\n"
+                                  "from fluorelax.ensemble import main\n"
+                                  "try:\n    main()\nexcept SystemExit:\n    pass",
+    "fluorelax --no_plot" : "from fluorelax.fluorelax import main\n"
+                            f"main(['-c', {os.path.join(DATA, '3k0n_w4f_frame_198ns_dry.nc')!r}, "
+                            f"'-p', {os.path.join(DATA, '3k0n_w4f_dry.prmtop')!r}, "
+                            "'--sys', 'w4f', '--step', '50', '--no_plot'])",
+}
+
+HEAVY_MODULES = ["numpy", "MDAnalysis", "matplotlib", "pandas", "scipy"]
+
+
+class Import_Time:
+    """
+    Wall time of each command in a fresh interpreter (asv timeraw benchmarks).
+    """
+
+    def timeraw_import_fluorelax(self):
+        return COMMANDS["import fluorelax"]
+
+    def timeraw_cli_help(self):
+        return COMMANDS["fluorelax --help"]
+
+    def timeraw_ensemble_help(self):
+        return COMMANDS["fluorelax-ensemble --help"]
+
+    def timeraw_cli_headless(self):
+        return COMMANDS["fluorelax --no_plot"]
+
+
+def time_command(code):
+    """
+    Run code in a fresh interpreter.
+
+    Returns
+    -------
+    elapsed : float
+        Wall time in seconds.
+    imported : list of str
+        The HEAVY_MODULES that were imported.
+    """
+    report = ("\nimport sys\nprint('IMPORTED=' + ','.join("
+              f"m for m in {HEAVY_MODULES!r} if m in sys.modules))")
+    start = time.perf_counter()
+    out = subprocess.run([sys.executable, "-c", code + report], capture_output=True,
+                         text=True, check=True).stdout
+    elapsed = time.perf_counter() - start
+    imported = out.rsplit("IMPORTED=", 1)[1].strip()
+    return elapsed, imported.split(",") if imported else []
+
+
+if __name__ == "__main__":
+    print(f"{'command':<28} {'time (s)':>9}  heavy imports")
+    for name, code in COMMANDS.items():
+        elapsed, imported = min(time_command(code) for _ in range(3))
+        print(f"{name:<28} {elapsed:>9.3f}  {', '.join(imported) or '-'}")
@@ -0,0 +1,246 @@
+"""
+Benchmark each stage of the fluorelax pipeline, and the whole pipeline, on
+synthetic trajectories of varying atom, frame and fluorine counts:
+trajectory loading, the F-H search (Calc_FH_Dists.run), the R1 and R2
+calculation, output writing and Plot_Relaxation, with the time (time_*)
+and peak memory (peakmem_*) of each.
+
+Written in asv style (see asv.conf.json, e.g. `asv continuous main HEAD`
+to compare a branch against main), but can also be run directly with:
+python -m benchmarks.bench_pipeline
+"""
+
+import importlib.util
+import os
+import tempfile
+import timeit
+import tracemalloc
+
+import numpy as np
+import MDAnalysis as mda
+
+import fluorelax
+from fluorelax.calc_fh_dists import Calc_FH_Dists, calc_frame_sum_r6, calc_r1_r2_columns
+from fluorelax.relax_io import save_r1_r2
+from benchmarks.synthetic import make_universe, write_universe
+
+# CypA 4F-Trp parameters
+PARAMS = (8.2e-9, 14.1, 11.2, -48.3, -112.8)
+
+
+def make_r1_r2(n_frames, n_fluorine=1, seed=0):
+    """
+    Per-frame (frame, R1, R2, ...) columns with realistic values.
+    """
+    rng = np.random.default_rng(seed)
+    r1_r2 = np.zeros((n_frames, 1 + 2 * n_fluorine))
+    r1_r2[:, 0] = np.arange(n_frames)
+    r1_r2[:, 1::2] = rng.normal(1.5, 0.3, (n_frames, n_fluorine))
+    r1_r2[:, 2::2] = rng.normal(110, 10, (n_frames, n_fluorine))
+    return r1_r2
+
+
+def make_pair_table(n_frames, n_fluorine=1, pairs_per_fluorine=5, seed=0):
+    """
+    CSR-style F-H pair table (see Calc_FH_Dists.get_table()) of random distances.
+    """
+    rng = np.random.default_rng(seed)
+    n_pairs = rng.poisson(pairs_per_fluorine * n_fluorine, n_frames)
+    return {"frames" : np.arange(n_frames),
+            "n_pairs" : n_pairs,
+            "fluorine_index" : rng.integers(0, n_fluorine, n_pairs.sum()),
+            "distances" : rng.uniform(1.8, 3, n_pairs.sum()),
+            "n_fluorine" : n_fluorine}
+
+
+class Load_Trajectory:
+    """
+    Open and read every frame of a DCD trajectory, streamed or into memory.
+    """
+    params = ([10000, 100000], [50, 200])
+    param_names = ["n_atoms", "n_frames"]
+    timeout = 300
+
+    def setup_cache(self):
+        # written once for all the benchmarks of the class
+        files = {}
+        for n_atoms in self.params[0]:
+            for n_frames in self.params[1]:
+                directory = os.path.abspath(f"traj_{n_atoms}_{n_frames}")
+                os.makedirs(directory, exist_ok=True)
+                files[n_atoms, n_frames] = write_universe(make_universe(n_atoms, n_frames),
+                                                          directory)
+        return files
+
+    def time_load_streaming(self, files, n_atoms, n_frames):
+        universe = mda.Universe(*files[n_atoms, n_frames])
+        for ts in universe.trajectory:
+            pass
+
+    def time_load_in_memory(self, files, n_atoms, n_frames):
+        mda.Universe(*files[n_atoms, n_frames], in_memory=True)
+
+    def peakmem_load_in_memory(self, files, n_atoms, n_frames):
+        mda.Universe(*files[n_atoms, n_frames], in_memory=True)
+
+
+class FH_Dists_Run:
+    """
+    The F-H pair search over all frames, for more atoms and fluorines.
+    """
+    params = ([10000, 100000], [1, 8])
+    param_names = ["n_atoms", "n_fluorine"]
+
+    def setup(self, n_atoms, n_fluorine):
+        self.universe = make_universe(n_atoms, n_frames=50, n_fluorine=n_fluorine)
+
+    def time_run(self, n_atoms, n_fluorine):
+        Calc_FH_Dists(self.universe).run()
+
+    def peakmem_run(self, n_atoms, n_fluorine):
+        Calc_FH_Dists(self.universe).run()
+
+
+class Relaxation:
+    """
+    Per-frame R1 and R2 from the F-H pair table (the former per-frame
+    relaxation loop of fluorelax.py), and the relaxation constants.
+    """
+    params = ([1000, 100000], [1, 8])
+    param_names = ["n_frames", "n_fluorine"]
+
+    def setup(self, n_frames, n_fluorine):
+        self.table = make_pair_table(n_frames, n_fluorine)
+        self.kernel = fluorelax.get_relaxation_kernel(*PARAMS)
+
+    def time_calc_r1_r2(self, n_frames, n_fluorine):
+        table = self.table
+        sum_r6 = calc_frame_sum_r6(table["n_pairs"], table["fluorine_index"],
+                                   table["distances"], table["n_fluorine"])
+        calc_r1_r2_columns(table["frames"], sum_r6, self.kernel)
+
+    def peakmem_calc_r1_r2(self, n_frames, n_fluorine):
+        self.time_calc_r1_r2(n_frames, n_fluorine)
+
+    def time_relaxation_constants(self, n_frames, n_fluorine):
+        # uncached, the spectral densities and prefactors
+        fluorelax.Calc_19F_Relaxation(*PARAMS).kernel
+
+
+class Output:
+    """
+    Write the per-frame R1 and R2 columns in each output format.
+    """
+    params = ([1000, 100000], ["tsv", "npz", "hdf5"])
+    param_names = ["n_frames", "fmt"]
+
+    def setup(self, n_frames, fmt):
+        if fmt == "hdf5" and importlib.util.find_spec("h5py") is None:
+            # skipped by asv
+            raise NotImplementedError("h5py is not installed")
+        self.r1_r2 = make_r1_r2(n_frames)
+        self.filename = os.path.join(tempfile.mkdtemp(prefix="fluorelax_bench_"),
+                                     f"r1_r2.{fmt}")
+
+    def time_save(self, n_frames, fmt):
+        save_r1_r2(self.filename, self.r1_r2, metadata={"tc" : PARAMS[0]})
+
+    def peakmem_save(self, n_frames, fmt):
+        save_r1_r2(self.filename, self.r1_r2, metadata={"tc" : PARAMS[0]})
+
+
+class Plot:
+    """
+    Plot_Relaxation R1 and R2 distributions (kde), without a display.
+    """
+    params = [1000, 10000]
+    param_names = ["n_frames"]
+
+    def setup(self, n_frames):
+        import matplotlib
+        matplotlib.use("Agg")
+        self.r1_r2 = make_r1_r2(n_frames)
+
+    def teardown(self, n_frames):
+        import matplotlib.pyplot as plt
+        plt.close("all")
+
+    def time_plot_r1(self, n_frames):
+        from fluorelax.plot_relax import Plot_Relaxation
+        Plot_Relaxation(self.r1_r2, "dist").plot_r1()
+
+    def time_plot_r2(self, n_frames):
+        from fluorelax.plot_relax import Plot_Relaxation
+        Plot_Relaxation(self.r1_r2, "dist").plot_r2()
+
+
+class Pipeline:
+    """
+    The whole run_pipeline() from files, in memory and streamed in chunks.
+    """
+    params = ([10000, 100000], [None, 50])
+    param_names = ["n_atoms", "chunk_size"]
+    timeout = 300
+
+    def setup_cache(self):
+        files = {}
+        for n_atoms in self.params[0]:
+            directory = os.path.abspath(f"pipeline_{n_atoms}")
+            os.makedirs(directory, exist_ok=True)
+            files[n_atoms] = write_universe(make_universe(n_atoms, n_frames=200, n_fluorine=4),
+                                            directory)
+        return files
+
+    def time_run_pipeline(self, files, n_atoms, chunk_size):
+        fluorelax.run_pipeline(*files[n_atoms], system="w4f", chunk_size=chunk_size)
+
+    def peakmem_run_pipeline(self, files, n_atoms, chunk_size):
+        fluorelax.run_pipeline(*files[n_atoms], system="w4f", chunk_size=chunk_size)
+
+
+def run_benchmark(bench_class):
+    """
+    Run every time_* and peakmem_* benchmark of bench_class over its params
+    without asv: best of 3 wall times and the peak Python (incl. NumPy)
+    allocations of tracemalloc, which only approximates the RSS of asv.
+    """
+    import itertools
+
+    bench = bench_class()
+    params = bench_class.params
+    if not isinstance(params, tuple):
+        params = (params,)
+    cache = ()
+    if hasattr(bench, "setup_cache"):
+        cwd = os.getcwd()
+        os.chdir(tempfile.mkdtemp(prefix="fluorelax_bench_"))
+        cache = (bench.setup_cache(),)
+        os.chdir(cwd)
+
+    names = sorted(name for name in dir(bench) if name.startswith(("time_", "peakmem_")))
+    print(f"\n{bench_class.__name__} ({', '.join(bench_class.param_names)})")
+    for param in itertools.product(*params):
+        try:
+            if hasattr(bench, "setup"):
+                bench.setup(*cache, *param)
+        except NotImplementedError as error:
+            print(f"  {param}: skipped, {error}")
+            continue
+        for name in names:
+            func = getattr(bench, name)
+            if name.startswith("time_"):
+                elapsed = min(timeit.repeat(lambda: func(*cache, *param), number=1, repeat=3))
+                result = f"{elapsed * 1000:.1f} ms"
+            else:
+                tracemalloc.start()
+                func(*cache, *param)
+                result = f"{tracemalloc.get_traced_memory()[1] / 1024**2:.1f} MB"
+                tracemalloc.stop()
+            print(f"  {str(param):<16} {name:<28} {result:>12}")
+        if hasattr(bench, "teardown"):
+            bench.teardown(*param)
+
+
+if __name__ == "__main__":
+    for bench_class in (Load_Trajectory, FH_Dists_Run, Relaxation, Output, Plot, Pipeline):
+        run_benchmark(bench_class)
@@ -0,0 +1,99 @@
+"""
+Benchmark the cost and accuracy of the F-H cutoff with and without the
+r^-6 tail correction.
+
+The time per frame is measured on a ~100k atom solvated box (with the water
+hydrogens), and the accuracy of the averaged sum of r^-6 on the shipped
+CypA 4F-Trp trajectory, against a 12 Angstrom cutoff plus its analytic tail.
+Written in asv style, but can also be run directly with:
+python -m benchmarks.bench_tail
+"""
+
+import os
+import timeit
+
+import numpy as np
+import MDAnalysis as mda
+
+from fluorelax.calc_fh_dists import Calc_FH_Dists
+from fluorelax.tail_correction import Calc_FH_RDF, calc_tail_r6
+from benchmarks.synthetic import make_solvated_universe
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                    "fluorelax", "data")
+REFERENCE_CUTOFF = 12
+
+
+def load_cypa():
+    return mda.Universe(os.path.join(DATA, "3k0n_w4f_dry.prmtop"),
+                        os.path.join(DATA, "3k0n_w4f_frame_198ns_dry.nc"))
+
+
+def calc_reference_r6(universe):
+    """
+    Per-frame sum of r^-6 to REFERENCE_CUTOFF, plus the analytic tail beyond it.
+    """
+    tail_r6 = Calc_FH_RDF(universe, r_max=REFERENCE_CUTOFF).run(step=10).calc_tail_r6(
+              REFERENCE_CUTOFF)
+    return Calc_FH_Dists(universe, dist=REFERENCE_CUTOFF, tail_r6=tail_r6).run().calc_sum_r6()
+
+
+class Tail_Cost:
+    """
+    Time the per-frame search at each cutoff and the RDF sampling of the
+    tail correction, in a solvated box with the water hydrogens.
+    """
+    params = [2.5, 3, 4, 6, 8]
+    param_names = ["cutoff"]
+
+    def setup(self, cutoff):
+        self.universe = make_solvated_universe(100000, n_frames=20, displacement=0.05)
+
+    def time_run(self, cutoff):
+        Calc_FH_Dists(self.universe, dist=cutoff, include_water=True).run()
+
+    def time_tail_r6(self, cutoff):
+        calc_tail_r6(self.universe, cutoff, include_water=True, n_samples=5)
+
+
+class Tail_Accuracy:
+    """
+    Relative error (%) of the averaged sum of r^-6 of the CypA fluorine at
+    each cutoff, truncated and tail corrected (RDF of 50 sampled frames),
+    and the per-frame RMS error of the corrected sums, which keep the
+    averaged tail in every frame.
+    """
+    params = [2.5, 3, 4, 6, 8]
+    param_names = ["cutoff"]
+
+    def setup(self, cutoff):
+        self.universe = load_cypa()
+        self.reference = calc_reference_r6(self.universe)
+        self.truncated = Calc_FH_Dists(self.universe, dist=cutoff).run().calc_sum_r6()
+        self.tail_r6 = calc_tail_r6(self.universe, cutoff)
+
+    def track_truncated_error(self, cutoff):
+        return 100 * (self.truncated.mean() / self.reference.mean() - 1)
+
+    def track_corrected_error(self, cutoff):
+        return 100 * ((self.truncated + self.tail_r6).mean() / self.reference.mean() - 1)
+
+    def track_corrected_frame_rms(self, cutoff):
+        error = (self.truncated + self.tail_r6) / self.reference - 1
+        return 100 * np.sqrt(np.mean(error**2))
+
+
+if __name__ == "__main__":
+    cost = Tail_Cost()
+    cost.setup(None)
+    accuracy = Tail_Accuracy()
+    print(f"{'cutoff':>7} {'per frame (ms)':>15} {'tail (ms)':>10} {'truncated (%)':>14} "
+          f"{'corrected (%)':>14} {'frame rms (%)':>14}")
+    for cutoff in Tail_Cost.params:
+        elapsed = min(timeit.repeat(lambda: cost.time_run(cutoff), number=1, repeat=3))
+        tail = min(timeit.repeat(lambda: cost.time_tail_r6(cutoff), number=1, repeat=3))
+        accuracy.setup(cutoff)
+        print(f"{cutoff:>7} {elapsed / 20 * 1000:>15.2f} {tail * 1000:>10.1f} "
+              f"{accuracy.track_truncated_error(cutoff):>14.2f} "
+              f"{accuracy.track_corrected_error(cutoff):>14.2f} "
+              f"{accuracy.track_corrected_frame_rms(cutoff):>14.2f}")
@@ -0,0 +1,172 @@
+"""
+Synthetic MD systems for benchmarking fluorelax without large trajectory files.
+"""
+
+import os
+import tempfile
+import warnings
+
+import numpy as np
+import MDAnalysis as mda
+from MDAnalysis.coordinates.memory import MemoryReader
+
+
+def make_universe(n_atoms=10000, n_frames=10, n_fluorine=1, box=None, seed=0):
+    """
+    Build an in-memory Universe of randomly placed atoms.
+    Half of the atoms are hydrogens ('H*'), the first n_fluorine are fluorines ('F*')
+    and the rest are carbons ('C*'), giving a roughly uniform proton density.
+
+    Parameters
+    ----------
+    n_atoms : int
+        Total number of atoms.
+    n_frames : int
+        Number of trajectory frames.
+    n_fluorine : int
+        Number of 19F atoms.
+    box : float
+        Cubic box length in Angstroms. Default gives ~0.1 atoms / A^3,
+        close to the atom density of a solvated protein.
+    seed : int
+        Seed for the random coordinates.
+
+    Returns
+    -------
+    universe : mda Universe
+    """
+    if box is None:
+        box = (n_atoms / 0.1) ** (1 / 3)
+
+    universe = mda.Universe.empty(n_atoms, trajectory=False)
+    names = np.array(["CA"] * n_atoms, dtype=object)
+    names[::2] = "H1"
+    names[:n_fluorine] = "F1"
+    universe.add_TopologyAttr("names", names)
+
+    rng = np.random.default_rng(seed)
+    coords = rng.uniform(0, box, size=(n_frames, n_atoms, 3)).astype(np.float32)
+    universe.load_new(coords, format=MemoryReader, order="fac",
+                      dimensions=[box, box, box, 90, 90, 90])
+    return universe
+
+
+def make_solvated_universe(n_atoms=100000, n_frames=10, n_fluorine=4, protein_fraction=0.05,
+                           seed=0, displacement=None):
+    """
+    Build an in-memory solvated system: a protein-like cluster of atoms
+    (resname 'PRO', half hydrogens, the first n_fluorine are fluorines) at the
+    center of a periodic box filled with 3-site waters (resname 'WAT', names
+    'OW', 'HW1', 'HW2') at ~0.1 atoms / A^3. Fluorines are placed on the
+    cluster surface and atoms are spread through the periodic images, so
+    minimum image F-H pairs cross the box boundaries.
+
+    Parameters
+    ----------
+    n_atoms : int
+        Approximate total number of atoms (rounded to whole waters).
+    n_frames : int
+        Number of trajectory frames.
+    n_fluorine : int
+        Number of 19F atoms.
+    protein_fraction : float
+        Fraction of the atoms in the protein cluster.
+    seed : int
+        Seed for the random coordinates.
+    displacement : float
+        If given, frames after the first are a random walk from it with
+        this stdev (Angstroms) per coordinate and frame, like the small
+        frame to frame motion of an MD trajectory, instead of independent
+        random frames.
+
+    Returns
+    -------
+    universe : mda Universe
+    """
+    n_protein = int(n_atoms * protein_fraction)
+    n_waters = (n_atoms - n_protein) // 3
+    n_atoms = n_protein + 3 * n_waters
+    box = (n_atoms / 0.1) ** (1 / 3)
+
+    universe = mda.Universe.empty(n_atoms, n_residues=1 + n_waters,
+                                  atom_resindex=np.concatenate([np.zeros(n_protein, dtype=int),
+                                                                np.repeat(np.arange(n_waters) + 1, 3)]),
+                                  trajectory=False)
+    names = np.array(["CA"] * n_protein + ["OW", "HW1", "HW2"] * n_waters, dtype=object)
+    names[:n_protein:2] = "HA"
+    names[:n_fluorine] = "F1"
+    universe.add_TopologyAttr("names", names)
+    universe.add_TopologyAttr("resnames", ["PRO"] + ["WAT"] * n_waters)
+
+    rng = np.random.default_rng(seed)
+    coords = rng.uniform(0, box, size=(n_frames, n_atoms, 3)).astype(np.float32)
+    # protein cluster at the center, with the fluorines on its surface
+    radius = (3 * n_protein / (4 * np.pi * 0.1)) ** (1 / 3)
+    directions = rng.normal(size=(n_frames, n_protein, 3))
+    directions /= np.linalg.norm(directions, axis=-1, keepdims=True)
+    radii = radius * rng.uniform(0, 1, size=(n_frames, n_protein, 1)) ** (1 / 3)
+    radii[:, :n_fluorine] = radius
+    coords[:, :n_protein] = box / 2 + directions * radii
+    # shift the whole system so the cluster straddles the periodic boundary
+    coords = (coords + box / 2 - radius / 2) % box
+    if displacement is not None:
+        steps = rng.normal(scale=displacement, size=(n_frames - 1, n_atoms, 3))
+        coords[1:] = (coords[0] + np.cumsum(steps, axis=0)) % box
+    universe.load_new(coords, format=MemoryReader, order="fac",
+                      dimensions=[box, box, box, 90, 90, 90])
+    return universe
+
+
+def make_universe_on_disk(n_atoms=10000, n_frames=10, n_fluorine=1, box=None, seed=0):
+    """
+    Same system as make_universe(), but with the trajectory written to a
+    temporary DCD file, so it is streamed from disk (and re-opened by parallel
+    workers) like a real simulation instead of being pickled from memory.
+
+    Returns
+    -------
+    universe : mda Universe
+    """
+    universe = make_universe(n_atoms, n_frames, n_fluorine, box, seed)
+    dcd = os.path.join(tempfile.mkdtemp(prefix="fluorelax_bench_"), "traj.dcd")
+    with mda.Writer(dcd, n_atoms) as writer:
+        for ts in universe.trajectory:
+            writer.write(universe.atoms)
+    universe.load_new(dcd)
+    return universe
+
+
+def write_universe(universe, directory=None):
+    """
+    Write a Universe to a PDB topology (first frame) and a DCD trajectory,
+    so the whole pipeline can be run on it from files.
+
+    Parameters
+    ----------
+    universe : mda Universe
+    directory : str
+        Output directory, default a new temporary directory.
+
+    Returns
+    -------
+    parm : str
+        The PDB file.
+    crd : str
+        The DCD file.
+    """
+    if directory is None:
+        directory = tempfile.mkdtemp(prefix="fluorelax_bench_")
+    parm = os.path.join(directory, "top.pdb")
+    crd = os.path.join(directory, "traj.dcd")
+    for attr in ("resnames", "resids", "segids"):
+        if not hasattr(universe.atoms, attr):
+            universe.add_TopologyAttr(attr)
+    universe.trajectory[0]
+    with warnings.catch_warnings():
+        # missing PDB fields (altLocs, occupancies, ...) are written as defaults
+        warnings.simplefilter("ignore")
+        universe.atoms.write(parm)
+    with mda.Writer(crd, universe.atoms.n_atoms) as writer:
+        for ts in universe.trajectory:
+            writer.write(universe.atoms)
+    return parm, crd
@@ -8,4 +8,35 @@ Description:
 
 # Welcome to the fluorelax module! 
 
-from .calc_relax import *
\ No newline at end of file
+import importlib
+import logging
+
+# library logging only, the command line programs add the handlers (see log.py)
+logging.getLogger(__name__).addHandler(logging.NullHandler())
+
+# Public names and the submodule they live in. They are only imported on first
+# access, so `import fluorelax` (and the command line --help) stays cheap and
+# does not pull in NumPy, MDAnalysis or matplotlib until they are needed.
+_lazy_names = {"Calc_19F_Relaxation" : "calc_relax",
+               "Relaxation_Kernel" : "calc_relax",
+               "get_relaxation_kernel" : "calc_relax",
+               "CSA_TENSORS" : "calc_relax",
+               "Rigid_Rotor" : "spectral_density",
+               "Lipari_Szabo" : "spectral_density",
+               "Extended_Model_Free" : "spectral_density",
+               "Anisotropic_Diffusion" : "spectral_density",
+               "run_pipeline" : "fluorelax",
+               }
+
+__all__ = list(_lazy_names)
+
+
+def __getattr__(name):
+    if name in _lazy_names:
+        module = importlib.import_module(f".{_lazy_names[name]}", __name__)
+        return getattr(module, name)
+    raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
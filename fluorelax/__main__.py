@@ -0,0 +1,7 @@
+"""
+Allow running the command line program with: python -m fluorelax
+"""
+
+from .fluorelax import main
+
+main()
@@ -0,0 +1,282 @@
+"""
+Persistent on-disk cache of the F-H pair (distance) tables.
+
+The pair table of a trajectory only depends on the input files, the atom
+selections, the cutoff and the frames analyzed, not on tc, the magnet or
+the CSA tensor. Tables are stored under a content-addressed key (a hash of
+those inputs), so re-analysis with new NMR parameters skips the trajectory
+I/O and neighbor search entirely. The cache directory is bounded in size,
+the least recently used tables are evicted first.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import time
+import zipfile
+
+# bump when the stored table layout changes, so old entries are not reused
+CACHE_VERSION = 1
+DEFAULT_CACHE_SIZE = 2 * 1024**3    # bytes
+
+logger = logging.getLogger(__name__)
+
+
+def get_default_cache_dir():
+    """
+    $FLUORELAX_CACHE_DIR, else $XDG_CACHE_HOME/fluorelax, else ~/.cache/fluorelax.
+    """
+    if "FLUORELAX_CACHE_DIR" in os.environ:
+        return os.environ["FLUORELAX_CACHE_DIR"]
+    cache_home = os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache"))
+    return os.path.join(cache_home, "fluorelax")
+
+
+def _file_signature(filename):
+    """
+    Absolute path, size and modification time of a file. Cheap to compute
+    for large trajectories, and changes whenever the file is rewritten.
+    """
+    stat = os.stat(filename)
+    return [os.path.abspath(filename), stat.st_size, stat.st_mtime_ns]
+
+
+class FH_Dist_Cache:
+    """
+    Size-bounded LRU cache of Calc_FH_Dists pair tables, one compressed
+    npz file per key in cache_dir. Reading an entry marks it as recently
+    used (its mtime is updated), and storing one evicts the least recently
+    used entries until the directory is within max_size.
+    """
+    # seconds after which a temporary file is left over from a killed run,
+    # younger ones may still be written by a concurrent run
+    stale_tmp_age = 3600
+
+    def __init__(self, cache_dir=None, max_size=DEFAULT_CACHE_SIZE):
+        """
+        Parameters
+        ----------
+        cache_dir : str
+            Directory of the cached tables, default get_default_cache_dir().
+        max_size : int
+            Maximum total size of the cached tables in bytes.
+        """
+        self.cache_dir = get_default_cache_dir() if cache_dir is None else cache_dir
+        self.max_size = max_size
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(parm, crd, dist, frames, selections):
+        """
+        Content-addressed key of a pair table.
+
+        Parameters
+        ----------
+        parm : str
+            The MD parameter file or pdb file.
+        crd : str or list of str
+            The MD trajectory file(s) or coordinate file(s).
+        dist : float
+            F-H cutoff distance.
+        frames : dict
+            The frames analyzed, e.g. {"start" : 0, "stop" : None, "step" : 1}.
+        selections : list of str
+            The fluorine and proton atom selections.
+
+        Returns
+        -------
+        key : str
+            sha256 hex digest of the inputs.
+        """
+        crd = [crd] if isinstance(crd, str) else list(crd)
+        inputs = {"version" : CACHE_VERSION,
+                  "parm" : _file_signature(parm),
+                  "crd" : [_file_signature(filename) for filename in crd],
+                  "dist" : float(dist),
+                  "frames" : frames,
+                  "selections" : list(selections)}
+        return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.npz")
+
+    def load(self, key):
+        """
+        Cached table of key, or None if it is not cached.
+
+        Returns
+        -------
+        table : dict
+            See Calc_FH_Dists.get_table().
+        """
+        import numpy as np
+
+        path = self._path(key)
+        try:
+            with np.load(path) as npz:
+                table = {name : npz[name] for name in npz.files}
+            table["n_fluorine"] = int(table["n_fluorine"])
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile):
+            # truncated, foreign or incomplete entry, recalculated and stored again
+            logger.warning("Removing the corrupt cache entry %s", path)
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            return None
+        # mark as recently used for the LRU eviction
+        os.utime(path)
+        return table
+
+    def save(self, key, table):
+        """
+        Store a table under key, then evict the least recently used entries.
+        The entry is written to a temporary file first, so concurrent runs
+        never read a partial entry.
+        """
+        import numpy as np
+
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez_compressed(f, **table)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def entries(self):
+        """
+        (path, size, mtime) of each cached table, least recently used first.
+        """
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".npz"):
+                path = os.path.join(self.cache_dir, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((path, stat.st_size, stat.st_mtime_ns))
+        return sorted(entries, key=lambda entry: entry[2])
+
+    def _sweep_tmp_files(self):
+        """
+        Remove the temporary files of killed runs, older than stale_tmp_age.
+
+        Returns
+        -------
+        size : int
+            Total size in bytes of the temporary files still being written.
+        """
+        size = 0
+        now = time.time()
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".tmp"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+                if now - stat.st_mtime > self.stale_tmp_age:
+                    os.remove(path)
+                    logger.debug("Removed the stale temporary file %s", path)
+                else:
+                    size += stat.st_size
+            except FileNotFoundError:
+                pass
+        return size
+
+    def evict(self):
+        """
+        Remove stale temporary files and the least recently used tables until
+        the cache (including the temporary files in use) is within max_size.
+        """
+        entries = self.entries()
+        total_size = sum(size for _, size, _ in entries) + self._sweep_tmp_files()
+        for path, size, _ in entries:
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+                logger.debug("Evicted %s from the cache", path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+
+    def clear(self):
+        """
+        Remove all cached tables.
+        """
+        for path, _, _ in self.entries():
+            os.remove(path)
+
+
+def get_fh_table(parm, crd, dist=3, step=1, chunk_size=None, cache=None, include_water=False,
+                 skin=None, start=None, stop=None, **kwargs):
+    """
+    The F-H pair table of a trajectory, from the cache when it is there,
+    otherwise streamed from disk (and then stored in the cache).
+
+    Parameters
+    ----------
+    parm : str
+        The MD parameter file or pdb file.
+    crd : str or list of str
+        The MD trajectory file(s) or coordinate file(s).
+    dist : int
+        The distance to calculate F-H distances within, default 3 Angstroms.
+    step : int
+        Step size of the frames being analyzed.
+    chunk_size : int
+        Number of frames analyzed at a time, default all of them.
+    cache : FH_Dist_Cache
+        Optional cache to read and store the table.
+    include_water : bool
+        Include the water hydrogens as protons, default False.
+    skin : float
+        Verlet neighbor list skin in Angstroms, see Calc_FH_Dists. It does not
+        change the table, so it is not part of the cache key.
+    start, stop : int
+        Frame slice to analyze with step, default the whole trajectory.
+    **kwargs
+        Passed on to run(), e.g. n_workers and backend.
+
+    Returns
+    -------
+    table : dict
+        See Calc_FH_Dists.get_table().
+    """
+    from .calc_fh_dists import Calc_FH_Dists, check_frame_range
+
+    if cache is not None:
+        # the default start (None or 0) and stop (None) are left out of the
+        # key, so every run over the whole trajectory shares one cached table
+        frames = {"step" : step}
+        if start not in (None, 0) or stop is not None:
+            frames.update(start=start or 0, stop=stop)
+        key = cache.make_key(parm, crd, dist, frames,
+                             Calc_FH_Dists.get_selections(include_water))
+        table = cache.load(key)
+        if table is not None:
+            logger.info("Using the cached F-H table %s", key)
+            return table
+        logger.info("No cached F-H table, calculating it")
+
+    import numpy as np
+    import MDAnalysis as mda
+
+    fh_dist_base = Calc_FH_Dists(mda.Universe(parm, crd), dist=dist,
+                                 include_water=include_water, skin=skin)
+    check_frame_range(fh_dist_base._trajectory.n_frames, start, stop, step)
+    chunk_size = chunk_size or fh_dist_base._trajectory.n_frames
+    chunks = [chunk.get_table() for chunk in fh_dist_base.iter_chunks(chunk_size, start=start,
+                                                                       stop=stop, step=step,
+                                                                       **kwargs)]
+    table = {name : np.concatenate([chunk[name] for chunk in chunks])
+             for name in ("frames", "n_pairs", "fluorine_index", "proton_index", "distances")}
+    table["n_fluorine"] = len(fh_dist_base.fluorine)
+
+    if cache is not None:
+        cache.save(key, table)
+    return table
@@ -1,19 +1,178 @@
 """
 Load an MD trajectory and find all of the 19F-1H distances.
-Generate an array of size (FRAMES x 1H < 3A of 19F) 
+Generate a sparse (CSR-style) table of every 19F-1H pair < 3A per frame:
+(frame, fluorine index, proton index, distance).
+With sum_only, only the per-frame sum of r^-6 of each fluorine is kept.
 """
 
+import itertools
+import logging
+import time
+
 import numpy as np
-import pandas as pd
-import MDAnalysis as mda
 from MDAnalysis.analysis import distances
+from MDAnalysis.lib.distances import apply_PBC, minimize_vectors
 from MDAnalysis.analysis.base import AnalysisBase
+from MDAnalysis.analysis.results import ResultsGroup
+
+from .log import Progress
+
+logger = logging.getLogger(__name__)
+
+
+def calc_frame_sum_r6(n_pairs, fluorine_index, fh_dists, n_fluorine):
+    """
+    Sum of r^-6 over the close protons of each fluorine and frame,
+    from a CSR-style pair table.
+
+    Parameters
+    ----------
+    n_pairs : ndarray
+        (n_frames) number of F-H pairs of each frame.
+    fluorine_index : ndarray
+        (total pairs) fluorine index of each pair, in frame order.
+    fh_dists : ndarray
+        (total pairs) F-H distance of each pair in Angstroms.
+    n_fluorine : int
+
+    Returns
+    -------
+    sum_r6 : ndarray
+        (n_frames x n_fluorine) array, r in Angstroms.
+    """
+    n_frames = len(n_pairs)
+    rows = np.repeat(np.arange(n_frames), n_pairs)
+    sum_r6 = np.bincount(rows * n_fluorine + fluorine_index,
+                         weights=fh_dists**-6.0,
+                         minlength=n_frames * n_fluorine)
+    return sum_r6.reshape(n_frames, n_fluorine)
+
+
+def calc_r1_r2_columns(frames, sum_r6, calc_relax):
+    """
+    Per-frame R1 and R2 columns from the per-frame sum of r^-6 of each fluorine.
+
+    Returns
+    -------
+    r1_r2 : ndarray
+        Array of size frames x (1 + 2 * n_fluorine) columns:
+        frame, then R1 and R2 of each fluorine.
+    """
+    r1_r2 = np.zeros((len(frames), 1 + 2 * sum_r6.shape[1]))
+    r1_r2[:, 0] = frames
+    r1, r2 = calc_relax.calc_r1_r2_from_r6(sum_r6)
+    r1_r2[:, 1::2] = r1
+    r1_r2[:, 2::2] = r2
+    return r1_r2
+
+
+def check_frame_range(n_frames, start=None, stop=None, step=None):
+    """
+    Raise a ValueError when the frame slice selects no frames of a
+    trajectory with n_frames, e.g. start after stop.
+    """
+    if step is not None and step < 1:
+        raise ValueError(f"The step must be a positive number of frames, not {step}.")
+    if not len(range(*slice(start, stop, step).indices(n_frames))):
+        raise ValueError(f"No frames selected by start={start}, stop={stop}, step={step} "
+                         f"of the {n_frames} trajectory frames.")
+
+
+def get_frame_range(trajectory, start=None, stop=None, step=None, begin_ps=None, end_ps=None,
+                    validate=True):
+    """
+    Frame slice (start, stop, step) of a trajectory, from frame indices or
+    from a time window, e.g. the equilibrated end of a long run. Times are
+    converted with the time of the first frame and the frame spacing dt
+    (a constant dt is assumed), so no other frames are read.
+
+    Parameters
+    ----------
+    trajectory : ProtoReader
+        Trajectory of a Universe, e.g. universe.trajectory.
+    start, stop, step : int
+        Frame slice, as in Calc_FH_Dists.run().
+    begin_ps, end_ps : float
+        Time window in ps, instead of start and stop. end_ps is inclusive.
+    validate : bool
+        Check the frame slice against trajectory.n_frames. Turn off when
+        trajectory is only the first of several concatenated segments, and
+        check the slice against the total number of frames instead.
+
+    Returns
+    -------
+    start, stop, step : int
+        To pass on to run() or iter_chunks(), None when not set.
+
+    Raises
+    ------
+    ValueError
+        If no frames are selected (with validate), see check_frame_range().
+    """
+    if begin_ps is not None or end_ps is not None:
+        if start is not None or stop is not None:
+            raise ValueError("Select the frames with start and stop or with begin_ps and "
+                             "end_ps, not both.")
+        t0, dt = trajectory[0].time, trajectory.dt
+        # small tolerance for times stored in single precision
+        if begin_ps is not None:
+            start = max(0, int(np.ceil((begin_ps - t0) / dt - 1e-6)))
+        if end_ps is not None:
+            stop = max(0, int(np.floor((end_ps - t0) / dt + 1e-6)) + 1)
+
+    if validate:
+        check_frame_range(trajectory.n_frames, start, stop, step)
+    return start, stop, step
 
 
 # subclass of AnalysisBase
 class Calc_FH_Dists(AnalysisBase):
+    """
+    Find the 19F-1H pairs within dist of every fluorine, for each frame.
+
+    Frames are independent, so run() can split the frame range into blocks
+    across a process pool, e.g. run(n_workers=32, backend="multiprocessing").
+    Each worker unpickles its own copy of the Universe (re-opening the files)
+    and only the per-frame results are sent back and merged in frame order.
+
+    Distances are minimum image distances when the trajectory has a periodic
+    box (orthorhombic or triclinic), using the box of each timestep.
+    Water hydrogens are left out unless include_water is set.
+
+    The dd relaxation only needs the sum of r^-6 of each fluorine and frame.
+    With sum_only, those sums are accumulated during the search and the
+    pairs are not kept, so the results are (frames x fluorines) instead of
+    growing with the number of close protons.
+    """
+    _analysis_algorithm_is_parallelizable = True
+
+    # atom selections of the 19F and 1H atoms
+    fluorine_selection = "name F*"
+    proton_selection = "name H*"
+    # residue names of the common water models (Amber, CHARMM, GROMACS, PDB)
+    water_resnames = ("WAT", "HOH", "SOL", "TIP3", "TIP4", "TIP5", "TP3", "T3P", "T4P",
+                      "SPC", "OPC")
+    # largest (fluorine images x protons) distance matrix for the periodic image search
+    max_dense_size = 2**22
+    # periodic cell shifts, no shift first
+    cell_shifts = np.array(list(itertools.product((0, -1, 1), repeat=3)))
+
+    @classmethod
+    def get_selections(cls, include_water=False):
+        """
+        The fluorine and proton atom selections, with or without water.
+        """
+        proton_selection = cls.proton_selection
+        if not include_water:
+            proton_selection += f" and not resname {' '.join(cls.water_resnames)}"
+        return cls.fluorine_selection, proton_selection
+
+    @classmethod
+    def get_supported_backends(cls):
+        return ("serial", "multiprocessing", "dask")
 
-    def __init__(self, atomgroup, verbose=False, dist=3):
+    def __init__(self, atomgroup, verbose=False, dist=3, calc_relax=None, include_water=False,
+                 skin=None, tail_r6=None, time_frames=False, sum_only=False, angular=False):
         """
         Set up the initial analysis parameters.
 
@@ -26,6 +185,35 @@ class Calc_FH_Dists(AnalysisBase):
         dist : int
             The distance to calculate F-H distances within.
             Default 3 Angstroms.
+        calc_relax : Calc_19F_Relaxation or Relaxation_Kernel
+            Optional relaxation calc instance (without fh_dist).
+            When given, the per-frame R1 and R2 of each fluorine are also
+            calculated during the run (by each worker when run in parallel).
+        include_water : bool
+            Include the water hydrogens as protons, default False.
+            Topologies without residue names have no water to leave out.
+        skin : float
+            Keep a Verlet neighbor list of the protons within dist + skin
+            (Angstroms) of the fluorines, only rebuilt when an atom has moved
+            more than skin / 2, e.g. 2. This avoids searching every water
+            each frame with include_water. Default None, search all protons.
+        tail_r6 : float or ndarray
+            Sum of r^-6 (Angstroms^-6) of the protons beyond dist, for each
+            fluorine, added to the sums of every frame, see tail_correction.py.
+            Default None, the sums are truncated at dist.
+        time_frames : bool
+            Record the wall time of each frame (reading it included) in
+            results.frame_times, e.g. for the profiler, default False.
+        sum_only : bool
+            Only keep the per-frame sum of r^-6 of each fluorine (and the
+            number of pairs), in results.sum_r6, instead of the pair table.
+            Default False. get_table() and df are then not available.
+        angular : bool
+            Also keep the per-frame sum over proton pairs i, j of
+            P2(cos theta_ij) r_i^-3 r_j^-3 of each fluorine, in
+            results.sum_p2_r6, with theta_ij the angle between the F-H
+            vectors. The i = j terms are the sum of r^-6, the others are the
+            orientational correlation of the proton dipoles. Default False.
         """
         # must first run AnalysisBase.__init__ and pass the trajectory
         trajectory = atomgroup.universe.trajectory
@@ -34,52 +222,421 @@ class Calc_FH_Dists(AnalysisBase):
         # TODO: this may be redundant with below
         self.atomgroup = atomgroup
         self.dist = dist
+        self.calc_relax = calc_relax
+        self.include_water = include_water
+        self.skin = skin
+        self.tail_r6 = tail_r6
+        self.time_frames = time_frames
+        self.sum_only = sum_only
+        self.angular = angular
+        # run_chunked logs the progress of all chunks instead of each run
+        self._chunked = False
+
+        # select 19F and 1H once, the F-H pairs < dist are found each frame
+        if not hasattr(atomgroup.universe.atoms, "resnames"):
+            include_water = True
+        fluorine_selection, proton_selection = self.get_selections(include_water)
+        self.fluorine = atomgroup.select_atoms(fluorine_selection)
+        self.protons = atomgroup.select_atoms(proton_selection)
+        # atoms whose displacement decides when the neighbor list is rebuilt
+        self._tracked = np.concatenate([self.fluorine.indices, self.protons.indices])
+
+    def _get_fluorine_images(self, fluorine, box, cutoff):
+        """
+        The fluorines wrapped into an orthorhombic cell, plus their periodic
+        images within cutoff of the cell, e.g. one more image for a
+        fluorine near one cell face and up to 7 near a corner.
+
+        Returns
+        -------
+        images : ndarray
+            (n_images x 3) positions, or None for triclinic cells and when
+            cutoff is not below half the cell length (a proton could then
+            be close to two images).
+        image_fluorine : ndarray
+            (n_images) index into self.fluorine of each image.
+        """
+        lengths = box[:3]
+        if np.any(box[3:] != 90) or cutoff >= lengths.min() / 2:
+            return None, None
+
+        fluorine = apply_PBC(fluorine, box)
+        images = (fluorine[:, None, :] + (self.cell_shifts * lengths)[None]).reshape(-1, 3)
+        keep = np.all((images >= -cutoff) & (images < lengths + cutoff), axis=1)
+        image_fluorine = np.repeat(np.arange(len(fluorine)), len(self.cell_shifts))[keep]
+        return images[keep], image_fluorine
+
+    def _search_pairs(self, fluorine, protons, box, cutoff):
+        """
+        F-H pairs within cutoff, minimum image distances when box is given.
+
+        With an orthorhombic box and few fluorines (the usual case), the
+        protons are wrapped into the cell once and compared without minimum
+        image convention to the periodic images of the fluorines near the cell
+        faces, which is much cheaper than a minimum image distance for every
+        F-H pair. Otherwise the cell-list search of capped_distance is used.
 
-        # select 19F and 1H < 3A
-        self.fluorine = atomgroup.select_atoms("name F*")
-        self.protons = atomgroup.select_atoms(f"around {dist} name F*").select_atoms("name H*")
+        Returns
+        -------
+        pairs : ndarray
+            (n_pairs x 2) indices into fluorine and protons, unsorted.
+        dists : ndarray
+            (n_pairs) F-H distances in Angstroms.
+        """
+        images = None
+        if box is not None:
+            images, image_fluorine = self._get_fluorine_images(fluorine, box, cutoff)
+
+        if images is not None and len(images) * len(protons) <= self.max_dense_size:
+            protons = apply_PBC(protons, box)
+            dist_array = distances.distance_array(images, protons)
+            image_index, proton_index = np.nonzero(dist_array <= cutoff)
+            pairs = np.column_stack([image_fluorine[image_index], proton_index])
+            return pairs, dist_array[image_index, proton_index]
+
+        return distances.capped_distance(fluorine, protons, max_cutoff=cutoff,
+                                         box=box, return_distances=True)
+
+    def _update_neighbor_list(self, ts):
+        """
+        Verlet neighbor list: the protons within dist + skin of any fluorine.
+        It is only rebuilt (with a search over all protons) once a fluorine or
+        proton has moved more than half the skin since the last build. Until then no
+        proton outside the list can have come within dist of a fluorine, since
+        every F-H distance changed by less than the skin.
+        """
+        # only the fluorines and protons, not every atom of the system
+        positions = ts.positions[self._tracked]
+        box = ts.dimensions
+        if self._reference is not None:
+            moved = np.subtract(positions, self._reference)
+            if box is None:
+                pass
+            elif np.all(box[3:] == 90):
+                # minimum image, so atoms wrapped across the box do not count as moved
+                np.abs(moved, out=moved)
+                np.minimum(moved, box[:3] - moved, out=moved)
+            else:
+                moved = minimize_vectors(moved, box)
+            # in place, much cheaper than a row-wise norm of every atom
+            np.square(moved, out=moved)
+            moved_sq = moved[:, 0] + moved[:, 1]
+            moved_sq += moved[:, 2]
+            if moved_sq.max(initial=0) < (self.skin / 2)**2:
+                return
+
+        pairs, _ = self._search_pairs(self.fluorine.positions, self.protons.positions, box,
+                                      self.dist + self.skin)
+        self._neighbors = np.unique(pairs[:, 1])
+        self._reference = positions
+        self.results.n_rebuilds += 1
+
+    def _find_fh_pairs(self, ts):
+        """
+        Neighbor search restricted to F-H pairs within self.dist.
+        Uses the periodic box of the timestep when there is one.
+        With a skin, only the protons of the neighbor list are searched.
+
+        Returns
+        -------
+        pairs : ndarray
+            (n_pairs x 2) indices into self.fluorine and self.protons,
+            sorted by fluorine and then proton index (unsorted with sum_only).
+        dists : ndarray
+            (n_pairs) F-H distances in Angstroms.
+        """
+        if self.skin is None:
+            pairs, dists = self._search_pairs(self.fluorine.positions, self.protons.positions,
+                                              ts.dimensions, self.dist)
+        else:
+            self._update_neighbor_list(ts)
+            pairs, dists = self._search_pairs(self.fluorine.positions,
+                                              self.protons[self._neighbors].positions,
+                                              ts.dimensions, self.dist)
+            pairs[:, 1] = self._neighbors[pairs[:, 1]]
+
+        # the sums do not depend on the pair order
+        if self.sum_only:
+            return pairs, dists
+        order = np.lexsort((pairs[:, 1], pairs[:, 0]))
+        return pairs[order], dists[order]
+
+    def _calc_sum_p2_r6(self, ts, pairs, dists):
+        """
+        Sum over proton pairs i, j of P2(cos theta_ij) r_i^-3 r_j^-3 of each
+        fluorine, from the tensor T = sum_i r_i^-3 u_i u_i^T of the F-H unit
+        vectors: 3/2 |T|^2 - 1/2 (sum_i r_i^-3)^2, linear in the pairs.
+        """
+        n_fluorine = len(self.fluorine)
+        vectors = (ts.positions[self.protons.indices[pairs[:, 1]]] -
+                   ts.positions[self.fluorine.indices[pairs[:, 0]]])
+        if ts.dimensions is not None:
+            vectors = minimize_vectors(vectors, ts.dimensions)
+        unit = vectors / dists[:, None]
+        r3 = dists**-3.0
+
+        tensor = np.zeros((n_fluorine, 9))
+        np.add.at(tensor, pairs[:, 0], (r3[:, None, None] * unit[:, :, None] *
+                                         unit[:, None, :]).reshape(-1, 9))
+        sum_r3 = np.bincount(pairs[:, 0], weights=r3, minlength=n_fluorine)
+        return 1.5 * np.sum(tensor**2, axis=1) - 0.5 * sum_r3**2
 
     def _prepare(self):
         """
-        Create array of zeroes as a placeholder for results.
+        Create the per-frame placeholders for results.
         This is run before we begin looping over the trajectory.
         """
         # This must go here, instead of __init__, because
         # it depends on the number of frames specified in run().
-
-        # TODO: is there a better way to account for larger proton lists?
-        # 3+ columns: 1 for the frame index, and X for array of FH distances
-        self.results = np.zeros((self.n_frames, 10 * len(self.protons)))
+        # The number of close protons changes each frame, so the pairs
+        # and distances are kept as one small array per frame.
+        # Clear any results of a previous run (e.g. the last chunk).
+        self.results.clear()
+        self.results.n_pairs = np.zeros(self.n_frames, dtype=int)
+        if self.sum_only:
+            self.results.sum_r6 = np.zeros((self.n_frames, len(self.fluorine)))
+        else:
+            self.results.fh_pairs = []
+            self.results.fh_dists = []
+        if self.angular:
+            self.results.sum_p2_r6 = np.zeros((self.n_frames, len(self.fluorine)))
+        # neighbor list state, rebuilt on the first frame of each run (or worker)
+        self.results.n_rebuilds = 0
+        self._reference = None
+        self._neighbors = None
+        if self.calc_relax is not None:
+            # R1 and R2 columns of each fluorine
+            self.results.r1_r2 = np.zeros((self.n_frames, 2 * len(self.fluorine)))
+        if self.time_frames:
+            self.results.frame_times = np.zeros(self.n_frames)
+            self._last_time = time.perf_counter()
+        # None (no per-frame cost) unless the INFO level is logged,
+        # each parallel worker logs the progress of its own frames
+        self._progress = None if self._chunked else Progress.get(self.n_frames, logger)
 
     def _single_frame(self):
         """
         This function is called for every frame that we choose in run().
         """
-        # TODO: is this the best way to dynamically select protons?
-        self.protons = self.atomgroup.select_atoms(f"around {self.dist} name F*").select_atoms("name H*")
+        # generate multiple 19F-1H distances per frame, for every 19F
+        pairs, fh_dists = self._find_fh_pairs(self._ts)
 
-        # generate multiple 19F-1H distances per frame
-        fh_dists = distances.distance_array(self.fluorine.positions, self.protons.positions)
+        self.results.n_pairs[self._frame_index] = len(fh_dists)
+        if self.sum_only or self.calc_relax is not None:
+            sum_r6 = np.bincount(pairs[:, 0], weights=fh_dists**-6.0,
+                                 minlength=len(self.fluorine))
+        if self.sum_only:
+            self.results.sum_r6[self._frame_index] = sum_r6
+        else:
+            self.results.fh_pairs.append(pairs)
+            self.results.fh_dists.append(fh_dists)
+        if self.angular:
+            self.results.sum_p2_r6[self._frame_index] = self._calc_sum_p2_r6(self._ts, pairs,
+                                                                             fh_dists)
 
-        # the current timestep of the trajectory is self._ts
-        self.results[self._frame_index, 0] = self._ts.frame
-        #self.results[self._frame_index, 0] = self._trajectory.time
+        if self.calc_relax is not None:
+            if self.tail_r6 is not None:
+                sum_r6 += self.tail_r6
+            r1, r2 = self.calc_relax.calc_r1_r2_from_r6(sum_r6)
+            self.results.r1_r2[self._frame_index, 0::2] = r1
+            self.results.r1_r2[self._frame_index, 1::2] = r2
 
-        # save distance arrays to results array
-        #self.results[self._frame_index, 1:] = fh_dists
+        if self.time_frames:
+            now = time.perf_counter()
+            self.results.frame_times[self._frame_index] = now - self._last_time
+            self._last_time = now
+        if self._progress is not None:
+            self._progress.update()
 
-        for num, val in enumerate(fh_dists[0]):
-            #print(val)
-            self.results[self._frame_index, num + 1] = val
-
-        # TODO: should zeros be NaN for the avg?
+    def _get_aggregator(self):
+        """
+        Merge the per-frame results of each parallel worker in frame order.
+        """
+        return ResultsGroup(lookup={"n_pairs" : ResultsGroup.ndarray_hstack,
+                                    "fh_pairs" : ResultsGroup.flatten_sequence,
+                                    "fh_dists" : ResultsGroup.flatten_sequence,
+                                    "sum_r6" : ResultsGroup.ndarray_vstack,
+                                    "sum_p2_r6" : ResultsGroup.ndarray_vstack,
+                                    "n_rebuilds" : ResultsGroup.ndarray_sum,
+                                    "r1_r2" : ResultsGroup.ndarray_vstack,
+                                    "frame_times" : ResultsGroup.ndarray_hstack})
 
     def _conclude(self):
         """
-        Finish up by transforming our results into a DataFrame.
+        Finish up by concatenating the per-frame pairs into a CSR-style table.
+        The pairs of frame i are at indptr[i]:indptr[i + 1] of the pair arrays.
+        """
+        if self.sum_only:
+            return
+        pairs = np.concatenate(self.results.pop("fh_pairs") + [np.zeros((0, 2), dtype=int)])
+        fh_dists = np.concatenate(self.results.pop("fh_dists") + [np.zeros(0)])
+
+        self.results.indptr = np.concatenate([[0], np.cumsum(self.results.n_pairs)])
+        # indices into self.fluorine and self.protons
+        self.results.fluorine_index = pairs[:, 0]
+        self.results.proton_index = pairs[:, 1]
+        self.results.distances = fh_dists
+
+    @property
+    def df(self):
         """
-        # by now self.result is fully populated
-        # self.average = np.mean(self.results[:, 2:], axis=0)
+        Long format DataFrame of all pairs: Frame, Fluorine, Proton, Distance.
+        Built on access, so pandas is only imported when it is used.
+        """
+        self._check_pair_table()
+        import pandas as pd
+        return pd.DataFrame({"Frame" : np.repeat(self.frames, self.results.n_pairs),
+                             "Fluorine" : self.results.fluorine_index,
+                             "Proton" : self.results.proton_index,
+                             "Distance" : self.results.distances})
+
+    def calc_sum_r6(self):
+        """
+        Sum of r^-6 over the close protons of each fluorine and frame,
+        plus tail_r6 when it is set.
+        This is all the distance information the dd relaxation terms need.
+
+        Returns
+        -------
+        sum_r6 : ndarray
+            (n_frames x n_fluorine) array, r in Angstroms.
+        """
+        if self.sum_only:
+            sum_r6 = self.results.sum_r6.copy()
+        else:
+            sum_r6 = calc_frame_sum_r6(self.results.n_pairs, self.results.fluorine_index,
+                                       self.results.distances, len(self.fluorine))
+        if self.tail_r6 is not None:
+            sum_r6 += self.tail_r6
+        return sum_r6
+
+    def _check_pair_table(self):
+        if self.sum_only:
+            raise ValueError("No F-H pair table with sum_only, only the sums of r^-6 "
+                             "(results.sum_r6) are kept.")
+
+    def get_table(self):
+        """
+        The CSR-style pair table of the last run() as plain arrays,
+        e.g. to save or cache it.
+
+        Returns
+        -------
+        table : dict
+            frames, n_pairs (per frame), fluorine_index, proton_index,
+            distances (per pair) and n_fluorine.
+        """
+        self._check_pair_table()
+        return {"frames" : np.asarray(self.frames),
+                "n_pairs" : self.results.n_pairs,
+                "fluorine_index" : self.results.fluorine_index,
+                "proton_index" : self.results.proton_index,
+                "distances" : self.results.distances,
+                "n_fluorine" : len(self.fluorine)}
+
+    def calc_r1_r2(self, calc_relax=None):
+        """
+        Per-frame R1 and R2 of each fluorine from the last run().
+
+        Parameters
+        ----------
+        calc_relax : Calc_19F_Relaxation or Relaxation_Kernel
+            Relaxation calc instance (without fh_dist).
+            Default uses the values calculated during the run with
+            the calc_relax given to __init__.
+
+        Returns
+        -------
+        r1_r2 : ndarray
+            Array of size frames x (1 + 2 * n_fluorine) columns:
+            frame, then R1 and R2 of each fluorine (frame, R1, R2 for one 19F).
+        """
+        if calc_relax is not None:
+            return calc_r1_r2_columns(self.frames, self.calc_sum_r6(), calc_relax)
+        if self.calc_relax is None:
+            raise ValueError("A calc_relax is needed to calculate R1 and R2, pass one "
+                             "here or to Calc_FH_Dists.")
+
+        r1_r2 = np.zeros((self.n_frames, 1 + 2 * len(self.fluorine)))
+        r1_r2[:, 0] = self.frames
+        r1_r2[:, 1:] = self.results.r1_r2
+        return r1_r2
+
+    def iter_chunks(self, chunk_size=1000, start=None, stop=None, step=None, **kwargs):
+        """
+        Stream the trajectory in bounded chunks of frames.
+        Each chunk is a separate run() over at most chunk_size frames,
+        so only one chunk of F-H distances is held in memory at a time.
+
+        Parameters
+        ----------
+        chunk_size : int
+            Maximum number of frames per chunk.
+        start, stop, step : int
+            Frame slice of the trajectory to analyze, as in run().
+        **kwargs
+            Passed on to run(), e.g. n_workers and backend.
+
+        Yields
+        ------
+        self : Calc_FH_Dists
+            With the results of each chunk.
+        """
+        frames = np.arange(self._trajectory.n_frames)[start:stop:step]
+        for chunk_start in range(0, len(frames), chunk_size):
+            self.run(frames=frames[chunk_start:chunk_start + chunk_size], **kwargs)
+            yield self
+
+    def run_chunked(self, calc_relax=None, chunk_size=1000, start=None, stop=None, step=None,
+                    stats=None, **kwargs):
+        """
+        Streaming alternative to run(): calculate the F-H distances and the
+        R1 and R2 values chunk by chunk, keeping only the per-frame summaries.
+        Peak memory is set by chunk_size instead of the trajectory length.
+
+        Parameters
+        ----------
+        calc_relax : Calc_19F_Relaxation or Relaxation_Kernel
+            Relaxation calc instance (without fh_dist) used for each chunk.
+            Default uses the calc_relax given to __init__.
+        chunk_size : int
+            Maximum number of frames per chunk.
+        start, stop, step : int
+            Frame slice of the trajectory to analyze, as in run().
+        stats : Running_Stats
+            Optional running statistics updated with the R1 and R2 columns
+            of each chunk, see stats.py.
+        **kwargs
+            Passed on to run(), e.g. n_workers and backend.
+
+        Returns
+        -------
+        self : Calc_FH_Dists
+            With the r1_r2 attribute, array of size frames x (1 + 2 * n_fluorine)
+            columns (frame, R1, R2 of each fluorine), see calc_r1_r2(),
+            and with time_frames, the frame_times of all chunks.
+        """
+        n_frames = len(range(*slice(start, stop, step).indices(self._trajectory.n_frames)))
+        self.r1_r2 = np.zeros((n_frames, 1 + 2 * len(self.fluorine)))
+
+        n_done = 0
+        frame_times = []
+        progress = Progress.get(n_frames, logger)
+        self._chunked = True
+        try:
+            for chunk in self.iter_chunks(chunk_size, start, stop, step, **kwargs):
+                self.r1_r2[n_done:n_done + chunk.n_frames] = chunk.calc_r1_r2(calc_relax)
+                if stats is not None:
+                    stats.update(self.r1_r2[n_done:n_done + chunk.n_frames, 1:])
+                if self.time_frames:
+                    frame_times.append(chunk.results.frame_times)
+                if progress is not None:
+                    progress.update(chunk.n_frames)
+                n_done += chunk.n_frames
+        finally:
+            self._chunked = False
 
-        #columns = ['Frame', 'FH_Distances']
-        self.df = pd.DataFrame(self.results)
\ No newline at end of file
+        if self.time_frames:
+            # of all chunks, the results otherwise only hold the last one
+            self.frame_times = np.concatenate(frame_times + [np.zeros(0)])
+        return self
@@ -2,8 +2,49 @@
 Fluorelax main relaxation calc.
 """
 
+import functools
+import logging
+import warnings
+
 import numpy as np
 
+from .spectral_density import Rigid_Rotor
+
+logger = logging.getLogger(__name__)
+
+# CSA tensors (sigma11, sigma22, sigma33 in ppm) of the fluorinated Trp systems
+CSA_TENSORS = {"w4f" : (11.2, -48.3, -112.8),
+               "w5f" : (4.8, -60.5, -86.1),
+               "w6f" : (12.9, -51.2, -91.6),
+               "w7f" : (4.6, -48.3, -123.3),
+               }
+
+def calc_csa_params(sigma11, sigma22, sigma33):
+    """
+    Reduced anisotropy and asymmetry parameter of a CSA tensor
+    (Haberlen convention), from the tensor in ppm.
+    """
+    # convert from ppm to MHz, but no need to incorporate omega_F ...
+    sigma11 = np.asarray(sigma11, dtype=float) * 10**-6
+    sigma22 = np.asarray(sigma22, dtype=float) * 10**-6
+    sigma33 = np.asarray(sigma33, dtype=float) * 10**-6
+
+    # isotropic chemical shift
+    iso = ((1 / 3) * (sigma11 + sigma22 + sigma33))
+    # reduced anisotropy
+    aniso = (3 * (sigma33 - iso)) / 2
+    # asymmetry parameter
+    eta = (sigma22 - sigma11) / (sigma33 - iso)
+    return aniso, eta
+
+def calc_csa_constant(omegaF, aniso, eta):
+    """
+    Spectral density independent part of the CSA terms, multiply by
+    J(wF) for the R1csa and by 2/3 J(0) + 1/2 J(wF) for the R2csa.
+    """
+    # from Lu et al. 2019
+    return (2 / 15) * (aniso**2) * (1 + (eta**2) / 3) * (omegaF**2)
+
 class Calc_19F_Relaxation:
     """
     Create a calculation class with attributes X. (constants?) TODO
@@ -17,56 +58,89 @@ class Calc_19F_Relaxation:
     gammaF = 25.17e7                        # rad / sec * Tesla
 
     # arguments here are instance attributes, varying for each instance created
-    def __init__(self, tc, magnet, sigma11, sigma22, sigma33, fh_dist=None):
+    def __init__(self, tc, magnet, sigma11, sigma22, sigma33, fh_dist=None,
+                 spectral_density=None, csa_spectral_density=None):
         """
         Relaxation calculation constants.
 
         Parameters
         ----------
-        tc : float
+        tc : float or ndarray
             Rotational coorelation time (sec) of the protein of interest.
-        magnet : float
+        magnet : float or ndarray
             The magnetic induction value in Tesla. 
             e.g. 14.1 T = 600MHz (1H+ freq), for proton: 42.58MHz/T
-        sigma11 : float
+        sigma11 : float or ndarray
             CSA xx tensor (ppm)
-        sigma22 : float
+        sigma22 : float or ndarray
             CSA yy tensor (ppm)
-        sigma33 : float
+        sigma33 : float or ndarray
             CSA zz tensor (ppm)
         fh_dist : float
             19F-1H distance for a single proton. Input in Angstroms, conveted to meters.
             Specifically needed to calculate dipole-dipole contributions.
+        spectral_density : Spectral_Density
+            Model of the dipolar spectral density J(w), see spectral_density.py.
+            Default Rigid_Rotor(tc), isotropic tumbling. Model parameters can be
+            arrays (e.g. one S^2 per site), the rates then have their shape.
+        csa_spectral_density : Spectral_Density
+            Model of the CSA spectral density, default the same as the dipolar one.
         """
         if fh_dist is not None:
             # convert Angstroms to meters
             self.fh_dist = float(fh_dist) * 10**-10
         
-        self.tc = float(tc)
-        self.magnet = float(magnet)
+        # tc, magnet and the CSA tensor can be arrays that broadcast against each
+        # other (e.g. a tc x magnet grid), all the terms below then have their shape
+        self.tc = np.asarray(tc, dtype=float)
+        self.magnet = np.asarray(magnet, dtype=float)
 
         # omega = resonance frequency = gamma * Bo (static NMR field in Tesla) 
-        self.omegaH = float(self.gammaH * self.magnet)
-        self.omegaF = float(self.gammaF * self.magnet)
-
-        # convert from ppm to MHz, but no need to incorporate omega_F ...
-        sigma11 *= 10**-6
-        sigma22 *= 10**-6
-        sigma33 *= 10**-6
-
-        # calc of aniso and eta from csa tensors using Haberlen convention:
-        # isotropic chemical shift
-        iso = ((1 / 3) * (sigma11 + sigma22 + sigma33))
-        # reduced anisotropy
-        self.aniso = (3 * (sigma33 - iso)) / 2
-        # asymmetry parameter
-        self.eta = (sigma22 - sigma11) / (sigma33 - iso)
-
-        # Calculate spectral density terms.
-        self.J_f = 1 / (1 + (self.omegaF**2 * self.tc**2))
-        self.J_h = 1 / (1 + (self.omegaH**2 * self.tc**2))
-        self.J_HmF = 1 / (1 + ((self.omegaF - self.omegaH)**2 * self.tc**2))
-        self.J_HpF = 1 / (1 + ((self.omegaF + self.omegaH)**2 * self.tc**2))
+        self.omegaH = self.gammaH * self.magnet
+        self.omegaF = self.gammaF * self.magnet
+
+        # calc of aniso and eta from csa tensors using Haberlen convention
+        self.aniso, self.eta = calc_csa_params(sigma11, sigma22, sigma33)
+
+        if spectral_density is None:
+            spectral_density = Rigid_Rotor(self.tc)
+        if csa_spectral_density is None:
+            csa_spectral_density = spectral_density
+        self.spectral_density = spectral_density
+        self.csa_spectral_density = csa_spectral_density
+
+        # Calculate spectral density terms (sec), e.g. tc / (1 + w^2 tc^2) for a rigid rotor.
+        self.J_0 = spectral_density(0)
+        self.J_f = spectral_density(self.omegaF)
+        self.J_h = spectral_density(self.omegaH)
+        self.J_HmF = spectral_density(self.omegaF - self.omegaH)
+        self.J_HpF = spectral_density(self.omegaF + self.omegaH)
+        self.J_csa_0 = csa_spectral_density(0)
+        self.J_csa_f = csa_spectral_density(self.omegaF)
+
+    @classmethod
+    def calc_dd_constant(cls):
+        """
+        Dipole-dipole coupling constant, (mu0 / 4 pi)^2 gammaF^2 gammaH^2 h_bar^2,
+        independent of the spectral density. Divide by r^6 (r in meters).
+        """
+        return (cls.gammaF**2) * (cls.gammaH**2) * (cls.h_bar**2) * (10**-14)
+
+    def calc_dd_r1_prefactor(self):
+        """
+        Distance-independent part of the dipole-dipole R1 term.
+        Divide by r^6 (r in meters) to get the R1dd contribution of one proton.
+        """
+        return (self.calc_dd_constant() / 10
+                ) * (3 * self.J_f + self.J_HmF + 6 * self.J_HpF)
+
+    def calc_dd_r2_prefactor(self):
+        """
+        Distance-independent part of the dipole-dipole R2 term.
+        Divide by r^6 (r in meters) to get the R2dd contribution of one proton.
+        """
+        return (self.calc_dd_constant() / 20
+                ) * (4 * self.J_0 + 3 * self.J_f + 6 * self.J_h + self.J_HmF + 6 * self.J_HpF)
 
     def calc_dd_r1(self):
         """
@@ -81,9 +155,7 @@ class Calc_19F_Relaxation:
         #                )
         #         )
 
-        return ((self.gammaF**2) * (self.gammaH**2) * (self.h_bar**2) * (10**-14) / 
-                (10 * (self.fh_dist**6))
-                ) * self.tc * (3 * self.J_f + self.J_HmF + 6 * self.J_HpF)
+        return self.calc_dd_r1_prefactor() / (self.fh_dist**6)
 
     def calc_dd_r2(self):
         """
@@ -99,9 +171,7 @@ class Calc_19F_Relaxation:
         #                )
         #         )
 
-        return ((self.gammaF**2) * (self.gammaH**2) * (self.h_bar**2) * (10**-14) / 
-                (20 * (self.fh_dist**6))
-                ) * self.tc * (4 + 3 * self.J_f + 6 * self.J_h + self.J_HmF + 6 * self.J_HpF)
+        return self.calc_dd_r2_prefactor() / (self.fh_dist**6)
 
     def calc_csa_r1(self):
         """
@@ -113,10 +183,7 @@ class Calc_19F_Relaxation:
         #     (1 / (1 + ((self.omegaF ** 2) * (self.tc ** 2))))
         #         )
 
-        # from Lu et al. 2019
-        return ((2 / 15) * (self.aniso**2) * (1 + (self.eta**2) / 3) 
-                * (self.omegaF**2) * self.tc * self.J_f
-                )
+        return calc_csa_constant(self.omegaF, self.aniso, self.eta) * self.J_csa_f
 
     def calc_csa_r2(self):
         """
@@ -128,14 +195,20 @@ class Calc_19F_Relaxation:
         #     (4 + (3 / (1 + ((self.omegaF ** 2) * (self.tc ** 2)))))
         #         )
 
-        return ((2 / 15) * self.aniso**2 * (1 + (self.eta**2) / 3) 
-                * self.omegaF**2 * self.tc * (2 / 3 + self.J_f / 2)
-                )
+        return (calc_csa_constant(self.omegaF, self.aniso, self.eta)
+                * (2 / 3 * self.J_csa_0 + self.J_csa_f / 2))
 
-    def calc_overall_r1_r2(self, print=False):
+    def calc_overall_r1_r2(self, *, print=None):
         """
         Overall relaxation: R = R_dd + R_csa.
         Main public method of the Calc_19F_Relaxation class.
+        The dd and csa terms are logged at the DEBUG level.
+
+        Parameters
+        ----------
+        print : bool
+            Deprecated, log the dd and csa terms at the INFO level instead.
+            Configure the "fluorelax" logger to see them.
 
         Returns
         -------
@@ -147,12 +220,15 @@ class Calc_19F_Relaxation:
         r2_dd = self.calc_dd_r2()   
         r2_csa = self.calc_csa_r2()
 
-        # TODO: add this as logger items instead of print
-        if print is True:
-            print(f"\nR1dd: {r1_dd}")
-            print(f"R1csa: {r1_csa}")
-            print(f"R2dd: {r2_dd}")
-            print(f"R2csa: {r2_csa}")
+        level = logging.DEBUG
+        if print is not None:
+            warnings.warn("The print keyword of calc_overall_r1_r2 is deprecated, the dd and "
+                          "csa terms are logged by the fluorelax.calc_relax logger.",
+                          DeprecationWarning, stacklevel=2)
+            if print:
+                level = logging.INFO
+        logger.log(level, "R1dd: %s, R1csa: %s, R2dd: %s, R2csa: %s",
+                   r1_dd, r1_csa, r2_dd, r2_csa)
 
         # according to Rieko
         # R1 = (r1_dd ** 2) + (r1_csa ** 2)
@@ -162,3 +238,142 @@ class Calc_19F_Relaxation:
         R2 = r2_dd + r2_csa
         return R1, R2
 
+    @property
+    def kernel(self):
+        """
+        Relaxation_Kernel of this instance, built on first use.
+        """
+        if not hasattr(self, "_kernel"):
+            self._kernel = Relaxation_Kernel(self)
+        return self._kernel
+
+    def calc_r1_r2_from_r6(self, sum_r6):
+        """
+        Overall relaxation from the per-frame sum of 19F-1H r^-6 terms,
+        see Relaxation_Kernel.calc_r1_r2_from_r6().
+        """
+        return self.kernel.calc_r1_r2_from_r6(sum_r6)
+
+    def calc_r1_r2_array(self, fh_dists, mask=None):
+        """
+        Vectorized overall relaxation for all frames and protons at once,
+        see Relaxation_Kernel.calc_r1_r2_array().
+        The instance does not need a fh_dist.
+        """
+        return self.kernel.calc_r1_r2_array(fh_dists, mask)
+
+
+class Relaxation_Kernel:
+    """
+    Precomputed relaxation terms for a fixed tc, magnet and CSA tensor.
+    The dd contributions only depend on r^-6 times a constant, and the CSA
+    contributions do not depend on the distances at all, so after building
+    the kernel, R1dd/R2dd of any distance array are a single multiply.
+    """
+
+    def __init__(self, calc_relax):
+        """
+        Parameters
+        ----------
+        calc_relax : Calc_19F_Relaxation
+            Relaxation calc instance to take the constant terms from.
+        """
+        # dd constants for r^-6 in Angstroms^-6 (converted from meters^-6)
+        self.r1_dd = calc_relax.calc_dd_r1_prefactor() * 10**60
+        self.r2_dd = calc_relax.calc_dd_r2_prefactor() * 10**60
+        self.r1_csa = calc_relax.calc_csa_r1()
+        self.r2_csa = calc_relax.calc_csa_r2()
+
+    @staticmethod
+    def calc_inv_r6(fh_dists, mask=None):
+        """
+        Element-wise r^-6 of a distance array, with 0 for the padding.
+
+        Parameters
+        ----------
+        fh_dists : ndarray
+            19F-1H distances in Angstroms.
+            Zero or NaN entries are treated as padding.
+        mask : ndarray of bool
+            Optional, same shape as fh_dists, True for the distances to include.
+            Overrides the zero/NaN padding detection.
+        """
+        fh_dists = np.asarray(fh_dists, dtype=float)
+        if mask is None:
+            mask = np.isfinite(fh_dists) & (fh_dists != 0)
+        return np.power(fh_dists, -6, where=mask, out=np.zeros_like(fh_dists))
+
+    def calc_dd_r1(self, fh_dists, mask=None):
+        """
+        Dipole-dipole R1 contribution of each 19F-1H distance (Angstroms).
+        """
+        return self.r1_dd * self.calc_inv_r6(fh_dists, mask)
+
+    def calc_dd_r2(self, fh_dists, mask=None):
+        """
+        Dipole-dipole R2 contribution of each 19F-1H distance (Angstroms).
+        """
+        return self.r2_dd * self.calc_inv_r6(fh_dists, mask)
+
+    def calc_r1_r2_from_r6(self, sum_r6):
+        """
+        Overall relaxation from the per-frame sum of 19F-1H r^-6 terms.
+        The dd contributions are linear in r^-6, so the summed dd rate of all
+        protons is the dd constant times sum(r^-6), plus the constant CSA rate.
+
+        Parameters
+        ----------
+        sum_r6 : float or ndarray
+            Sum of r^-6 over the protons of each frame, with r in Angstroms.
+
+        Returns
+        -------
+        R1 : float or ndarray
+        R2 : float or ndarray
+            Same shape as sum_r6.
+        """
+        sum_r6 = np.asarray(sum_r6, dtype=float)
+        return self.r1_dd * sum_r6 + self.r1_csa, self.r2_dd * sum_r6 + self.r2_csa
+
+    def calc_r1_r2_array(self, fh_dists, mask=None):
+        """
+        Vectorized overall relaxation for all frames and protons at once.
+
+        Parameters
+        ----------
+        fh_dists : ndarray
+            19F-1H distances in Angstroms, shape (n_frames, n_protons).
+            Zero or NaN entries are treated as padding and skipped.
+        mask : ndarray of bool
+            Optional, same shape as fh_dists, True for the distances to include.
+            Overrides the zero/NaN padding detection.
+
+        Returns
+        -------
+        R1 : ndarray
+        R2 : ndarray
+            Per-frame relaxation rates, shape (n_frames,).
+        """
+        return self.calc_r1_r2_from_r6(self.calc_inv_r6(fh_dists, mask).sum(axis=-1))
+
+
+@functools.lru_cache(maxsize=128)
+def get_relaxation_kernel(tc, magnet, sigma11, sigma22, sigma33):
+    """
+    Cached Relaxation_Kernel for a set of parameters, so repeated runs with the
+    same settings (e.g. many trajectories or chunks) reuse the same constants.
+
+    Parameters
+    ----------
+    tc : float
+        Rotational coorelation time (sec).
+    magnet : float
+        The magnetic induction value in Tesla.
+    sigma11, sigma22, sigma33 : float
+        CSA tensor (ppm).
+
+    Returns
+    -------
+    kernel : Relaxation_Kernel
+    """
+    return Relaxation_Kernel(Calc_19F_Relaxation(tc, magnet, sigma11, sigma22, sigma33))
@@ -0,0 +1,269 @@
+"""
+Time correlation function (TCF) based relaxation engine.
+
+Instead of a rigid-rotor Lorentzian with the instantaneous F-H distance of each
+frame, the dipolar and CSA orientational autocorrelation functions are calculated
+directly from the trajectory and integrated to the spectral densities at
+0, wF, wH and wH -/+ wF:
+
+    C_dd(t) = sum_H < r(0)^-3 r(t)^-3 P2(u(0) . u(t)) >     (u: F-H unit vectors)
+    C_csa(t) = < P2(u(0) . u(t)) >                          (u: C-F bond unit vector)
+    J(w) = integral_0^inf C(t) exp(-t / tc) cos(w t) dt
+
+The CSA tensor is approximated as having its unique axis along the C-F bond.
+The autocorrelations are computed with FFTs in O(N log N), so 10^6+ frame
+trajectories do not need the O(N^2) direct sum over time origins.
+"""
+
+import numpy as np
+from MDAnalysis.lib import distances
+from MDAnalysis.analysis.base import AnalysisBase
+
+from .calc_relax import Calc_19F_Relaxation, calc_csa_params, calc_csa_constant
+
+
+def calc_acf_fft(x):
+    """
+    Autocorrelation of each series in x, averaged over all time origins.
+    The series are zero padded to 2N so the FFT correlation is not circular.
+
+    Parameters
+    ----------
+    x : ndarray
+        (n_frames, ...) array, the time axis is first.
+
+    Returns
+    -------
+    acf : ndarray
+        Same shape as x, acf[t] = mean over t0 of x[t0] * x[t0 + t].
+    """
+    n_frames = len(x)
+    x_fft = np.fft.rfft(x, n=2 * n_frames, axis=0)
+    acf = np.fft.irfft(x_fft * x_fft.conj(), n=2 * n_frames, axis=0)[:n_frames]
+    # number of time origins of each lag
+    n_origins = (n_frames - np.arange(n_frames)).reshape((-1,) + (1,) * (x.ndim - 1))
+    return acf / n_origins
+
+
+def calc_p2_tcf(vectors, weights=None):
+    """
+    Second order Legendre TCF of a set of vectors:
+    C(t) = < w(0) w(t) P2(u(0) . u(t)) >, P2(x) = (3x^2 - 1) / 2.
+
+    Uses the addition theorem P2(u0 . ut) = 3/2 sum_ij u0_i u0_j ut_i ut_j - 1/2,
+    so it is the sum of the FFT autocorrelations of the 6 unique w * u_i * u_j
+    components (off-diagonal terms counted twice) and of w.
+
+    Parameters
+    ----------
+    vectors : ndarray
+        (n_frames, n_vectors, 3) array of vectors, normalized internally.
+    weights : ndarray
+        Optional (n_frames, n_vectors) array of weights, default 1.
+
+    Returns
+    -------
+    tcf : ndarray
+        (n_frames, n_vectors) TCF of each vector.
+    """
+    units = vectors / np.linalg.norm(vectors, axis=-1, keepdims=True)
+    if weights is None:
+        weights = np.ones(units.shape[:-1])
+
+    tcf = np.zeros(units.shape[:-1])
+    # one vector at a time keeps the padded FFT arrays small for long trajectories
+    for num in range(units.shape[1]):
+        u = units[:, num]
+        w = weights[:, num]
+        components = np.column_stack([w * u[:, i] * u[:, j]
+                                      for i in range(3) for j in range(i, 3)])
+        acf = calc_acf_fft(components)
+        # diagonal (xx, yy, zz) and off-diagonal (xy, xz, yz) terms
+        diag = acf[:, 0] + acf[:, 3] + acf[:, 5]
+        off_diag = acf[:, 1] + acf[:, 2] + acf[:, 4]
+        tcf[:, num] = 1.5 * (diag + 2 * off_diag) - 0.5 * calc_acf_fft(w)
+    return tcf
+
+
+def calc_spectral_density(tcf, lag_time, omega, tc=None, max_lag=None):
+    """
+    Spectral density J(w) = integral_0^inf C(t) exp(-t / tc) cos(w t) dt,
+    from the trapezoid rule over the TCF up to max_lag.
+
+    With tc, the TCF is taken as the internal motion of a trajectory with the
+    overall tumbling removed. Its plateau (mean of the last 10% of the lags) is
+    then continued analytically to infinity, which gives the exact rigid-rotor
+    result for a constant TCF. Without tc, the TCF must decay within max_lag.
+
+    Parameters
+    ----------
+    tcf : ndarray
+        (n_lags, ...) TCF, the lag axis is first.
+    lag_time : float
+        Time between lags in sec.
+    omega : float or ndarray
+        Frequencies in rad/sec.
+    tc : float
+        Rotational coorelation time (sec) of the overall tumbling.
+    max_lag : int
+        Number of lags to integrate, default half of the TCF,
+        since the longest lags have few time origins.
+
+    Returns
+    -------
+    J : ndarray
+        (n_omega, ...) spectral densities in sec.
+    """
+    max_lag = len(tcf) // 2 if max_lag is None else max_lag
+    tcf = tcf[:max_lag]
+    omega = np.atleast_1d(omega)
+    t = np.arange(max_lag) * lag_time
+    # (n_omega, n_lags)
+    kernel = np.cos(np.outer(omega, t))
+    if tc is not None:
+        kernel *= np.exp(-t / tc)
+
+    # trapezoid rule over the lag axis
+    trapz = np.ones(max_lag)
+    trapz[[0, -1]] = 0.5
+    J = lag_time * np.tensordot(kernel * trapz, tcf, axes=1)
+
+    if tc is not None:
+        # analytic integral of plateau * exp(-t / tc) cos(w t) from the last lag to inf
+        plateau = np.mean(tcf[-max(max_lag // 10, 1):], axis=0)
+        a = 1 / tc
+        t_end = t[-1]
+        tail = np.exp(-a * t_end) * (a * np.cos(omega * t_end) - omega * np.sin(omega * t_end)) \
+               / (a**2 + omega**2)
+        J += np.multiply.outer(tail, plateau)
+    return J
+
+
+# subclass of AnalysisBase
+class Calc_19F_TCF(AnalysisBase):
+    """
+    Collect the F-H and C-F vectors of each frame and calculate the
+    dipolar and CSA TCFs of each fluorine from them.
+
+    The protons of each fluorine are those within dist of it at the frame
+    the trajectory is on when the class is created (as the original
+    Calc_FH_Dists selection), and are followed over the whole trajectory.
+    """
+
+    def __init__(self, atomgroup, verbose=False, dist=3):
+        """
+        Set up the initial analysis parameters.
+
+        Parameters
+        ----------
+        atomgroup : mda Universe
+            Universe object from atom selection, with bonds.
+        verbose : bool
+            Whether to show the progress bar or not.
+        dist : int
+            The distance to select protons within, default 3 Angstroms.
+        """
+        trajectory = atomgroup.universe.trajectory
+        super(Calc_19F_TCF, self).__init__(trajectory, verbose=verbose)
+
+        self.fluorine = atomgroup.select_atoms("name F*")
+        protons = atomgroup.select_atoms("name H*")
+
+        # carbon bonded to each fluorine for the CSA (C-F bond) frame
+        try:
+            self.carbons = atomgroup.universe.atoms[[f.bonded_atoms.select_atoms("name C*")[0].ix
+                                                     for f in self.fluorine]]
+        except (IndexError, AttributeError):
+            raise ValueError("The C-F bond of each fluorine is needed: "
+                             "the topology must have bonds (e.g. a prmtop).")
+
+        # fixed F-H pairs followed over the trajectory
+        pairs = distances.capped_distance(self.fluorine.positions, protons.positions,
+                                          max_cutoff=dist, box=trajectory.ts.dimensions,
+                                          return_distances=False)
+        pairs = pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
+        self.pair_fluorine = pairs[:, 0]
+        self.pair_protons = protons[pairs[:, 1]]
+
+    def _prepare(self):
+        """
+        Create the vector placeholders for results.
+        """
+        self.results.fh_vectors = np.zeros((self.n_frames, len(self.pair_protons), 3),
+                                           dtype=np.float32)
+        self.results.cf_vectors = np.zeros((self.n_frames, len(self.fluorine), 3),
+                                           dtype=np.float32)
+
+    def _single_frame(self):
+        """
+        Minimum image F-H and C-F vectors of this frame.
+        """
+        fh_vectors = self.pair_protons.positions - self.fluorine.positions[self.pair_fluorine]
+        cf_vectors = self.fluorine.positions - self.carbons.positions
+        if self._ts.dimensions is not None:
+            fh_vectors = distances.minimize_vectors(fh_vectors, self._ts.dimensions)
+            cf_vectors = distances.minimize_vectors(cf_vectors, self._ts.dimensions)
+
+        self.results.fh_vectors[self._frame_index] = fh_vectors
+        self.results.cf_vectors[self._frame_index] = cf_vectors
+
+    def _conclude(self):
+        """
+        Calculate the TCFs of each fluorine.
+        results.dd_tcf is in Angstroms^-6 and results.csa_tcf is unitless,
+        both (n_frames x n_fluorine), with the lag times in results.lag_times (ps).
+        """
+        fh_vectors = self.results.fh_vectors.astype(float)
+        r3 = np.linalg.norm(fh_vectors, axis=-1)**-3
+        pair_tcf = calc_p2_tcf(fh_vectors, r3)
+
+        # sum the auto-correlation of each proton of a fluorine
+        self.results.dd_tcf = np.zeros((self.n_frames, len(self.fluorine)))
+        np.add.at(self.results.dd_tcf.T, self.pair_fluorine, pair_tcf.T)
+
+        self.results.csa_tcf = calc_p2_tcf(self.results.cf_vectors.astype(float))
+
+        # time between analyzed frames
+        lag_time = np.mean(np.diff(self.times)) if self.n_frames > 1 else 0
+        self.results.lag_times = np.arange(self.n_frames) * lag_time
+
+    def calc_r1_r2(self, magnet, sigma11, sigma22, sigma33, tc=None, max_lag=None):
+        """
+        R1 and R2 of each fluorine from the TCFs, see calc_spectral_density().
+
+        Parameters
+        ----------
+        magnet : float
+            The magnetic induction value in Tesla.
+        sigma11, sigma22, sigma33 : float
+            CSA tensor (ppm).
+        tc : float
+            Rotational coorelation time (sec) of the overall tumbling, for
+            trajectories with the overall rotation removed (e.g. RMSD fit).
+        max_lag : int
+            Number of lags to integrate, default half of the trajectory.
+
+        Returns
+        -------
+        R1 : ndarray
+        R2 : ndarray
+            (n_fluorine) relaxation rates.
+        """
+        wF = Calc_19F_Relaxation.gammaF * magnet
+        wH = Calc_19F_Relaxation.gammaH * magnet
+        # lag times in ps to sec
+        lag_time = self.results.lag_times[1] * 10**-12 if self.n_frames > 1 else 1
+
+        J_0, J_f, J_h, J_HmF, J_HpF = calc_spectral_density(
+            self.results.dd_tcf, lag_time, [0, wF, wH, wH - wF, wH + wF], tc, max_lag)
+        # dd constant for r^-6 in Angstroms^-6 (converted from meters^-6)
+        dd = Calc_19F_Relaxation.calc_dd_constant() * 10**60
+        r1_dd = dd / 10 * (3 * J_f + J_HmF + 6 * J_HpF)
+        r2_dd = dd / 20 * (4 * J_0 + 3 * J_f + 6 * J_h + J_HmF + 6 * J_HpF)
+
+        J_0, J_f = calc_spectral_density(self.results.csa_tcf, lag_time, [0, wF], tc, max_lag)
+        csa = calc_csa_constant(wF, *calc_csa_params(sigma11, sigma22, sigma33))
+        r1_csa = csa * J_f
+        r2_csa = csa * (2 / 3 * J_0 + J_f / 2)
+
+        return r1_dd + r1_csa, r2_dd + r2_csa
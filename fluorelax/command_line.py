@@ -21,7 +21,8 @@ def create_cmd_arguments():
     """
 
     # create argument parser 
-    parser = argparse.ArgumentParser(description = " ")
+    parser = argparse.ArgumentParser(prog="fluorelax", description = "Calculate 19F R1 and R2 "
+                                     "relaxation rates from MD trajectories.")
 
     ###########################################################
     ############### OPTIONAL ARGUMENTS ########################
@@ -31,19 +32,105 @@ def create_cmd_arguments():
                         help="The filename to which the data will be saved.",
                         type=str)
 
-    parser.add_argument("--step", default=1, nargs="?",
-                        dest="step_size",
-                        help="Step size of the coordinates being loaded, default 1.",
+    parser.add_argument("--format", default=None,
+                        dest="output_format", choices=["tsv", "npz", "hdf5"],
+                        help="Format of the output file: 'tsv', or compressed binary "
+                             "columns with metadata 'npz', 'hdf5' (requires h5py). "
+                             "Default inferred from the output file extension, else 'tsv'.",
+                        type=str)
+
+    add_frame_arguments(parser)
+
+    add_search_arguments(parser)
+
+    parser.add_argument("--tail", default=False,
+                        dest="tail_correction", action="store_true",
+                        help="Add the averaged r^-6 contribution of the protons beyond --dist, "
+                             "from the F-H radial distribution of a sample of frames, so a "
+                             "small cutoff gives the averages of a large one.")
+
+    parser.add_argument("--chunk", default=None,
+                        dest="chunk_size",
+                        help="Stream the trajectory in chunks of this many frames "
+                             "instead of loading it all in memory, default None.",
+                        type=int)
+
+    parser.add_argument("--workers", default=1,
+                        dest="n_workers",
+                        help="Number of processes to split the trajectory analysis "
+                             "across, default 1.",
                         type=int)
 
+    parser.add_argument("--cache_dir", default=None,
+                        dest="cache_dir",
+                        help="Directory to cache the F-H distance tables in, so runs on the "
+                             "same trajectory, cutoff and step only with new tc, magnet or "
+                             "CSA values skip the trajectory. Default None (no cache).",
+                        type=str)
+
+    parser.add_argument("--cache_size", default=None,
+                        dest="cache_size",
+                        help="Maximum size of the cache directory in bytes, least recently "
+                             "used tables are removed first, default 2 GB.",
+                        type=int)
+
+    parser.add_argument("--convergence", default=None,
+                        dest="convergence_file",
+                        help="Save the convergence trace to this tsv file: the cumulative "
+                             "R1 and R2 averages and their block averaged standard error "
+                             "after each chunk of frames (see --chunk), or each 1% of "
+                             "the frames without --chunk.",
+                        type=str)
+
+    parser.add_argument("--append", default=False,
+                        dest="append", action="store_true",
+                        help="Incremental mode for growing trajectories: only process the "
+                             "frames added since the last run (checkpointed next to the tsv "
+                             "output file) and append them to the output file.")
+
+    parser.add_argument("--segments", default=None,
+                        dest="segments_dir",
+                        help="Segment mode for trajectories split over many files: analyze "
+                             "each -c file separately (--workers at a time), keeping its R1 "
+                             "and R2 and a checkpoint in this directory, then stitch them into "
+                             "one time series. Segments already done are skipped on reruns.",
+                        type=str)
+
+    parser.add_argument("--profile", default=False,
+                        dest="profile", action="store_true",
+                        help="Print the wall time, frames/s and peak memory of each stage "
+                             "(loading, F-H search, output, plot) and a per-frame latency "
+                             "histogram of the F-H search.")
+
+    parser.add_argument("--profile_json", default=None,
+                        dest="profile_json",
+                        help="Also save the --profile report to this JSON file.",
+                        type=str)
+
+    parser.add_argument("--no_plot", default=True,
+                        dest="plot", action="store_false",
+                        help="Do not plot the R1 and R2 data, e.g. for headless runs.")
+
     parser.add_argument("--sys", default=None,
                         dest="system",
                         help="Systems with CSA definitons included: "
                              "'w4f', 'w5f', 'w6f', 'w7f'.",
                         type=str)
 
+    parser.add_argument("--tc", default=8.2e-9,
+                        dest="tc",
+                        help="Rotational coorelation time in sec, default 8.2e-9 (CypA).",
+                        type=float)
+
+    parser.add_argument("--magnet", default=14.1,
+                        dest="magnet",
+                        help="Magnetic induction in Tesla, default 14.1 (600 MHz of 1H+).",
+                        type=float)
+
     # TODO: maybe have a mutually exclusive group for sigma11/22/33 or aniso and eta
 
+    add_logging_arguments(parser)
+
     ##########################################################
     ############### REQUIRED ARGUMENTS #######################
     ##########################################################
@@ -63,13 +150,253 @@ def create_cmd_arguments():
     return parser 
 
 
-def handle_command_line(argument_parser): 
+def create_ensemble_arguments():
+    """
+    Use the `argparse` module to make the command-line arguments for
+    running `fluorelax` over an ensemble of systems and replicates.
+
+    Returns
+    -------
+    `argparse.ArgumentParser`: 
+        An ArgumentParser that is used to retrieve command line arguments. 
+    """
+    parser = argparse.ArgumentParser(description = "Calculate per-frame R1 and R2 "
+                                     "for many replicates and aggregate them per system.")
+
+    ###########################################################
+    ############### OPTIONAL ARGUMENTS ########################
+    ###########################################################
+    parser.add_argument("-o", "--output_dir", default=".",
+                        dest="output_dir",
+                        help="Directory for the per-replicate and aggregated data, "
+                             "default current directory.",
+                        type=str)
+
+    add_frame_arguments(parser)
+
+    parser.add_argument("--chunk", default=1000,
+                        dest="chunk_size",
+                        help="Number of frames streamed and written at a time, default 1000.",
+                        type=int)
+
+    parser.add_argument("--workers", default=1,
+                        dest="n_workers",
+                        help="Number of replicates to run concurrently, default 1.",
+                        type=int)
+
+    add_search_arguments(parser)
+
+    parser.add_argument("--tc", default=8.2e-9,
+                        dest="tc",
+                        help="Rotational coorelation time in sec, default 8.2e-9 (CypA).",
+                        type=float)
+
+    parser.add_argument("--magnet", default=14.1,
+                        dest="magnet",
+                        help="Magnetic induction in Tesla, default 14.1 (600 MHz of 1H+).",
+                        type=float)
+
+    add_logging_arguments(parser)
+
+    ##########################################################
+    ############### REQUIRED ARGUMENTS #######################
+    ##########################################################
+    required_args = parser.add_argument_group("Required Arguments") 
+
+    required_args.add_argument("-e", "--ensemble", required = True,
+        help = "Text file with one replicate per line: "
+               "'system parm coord [coord ...]', e.g. 'w4f w4f.prmtop v00/prod.nc'.",
+        action = "store", dest = "ensemble", type=str)
+
+    return parser
+
+
+def create_sweep_arguments():
+    """
+    Use the `argparse` module to make the command-line arguments for
+    sweeping R1 and R2 over systems, tc values and magnet strengths.
+
+    Returns
+    -------
+    `argparse.ArgumentParser`: 
+        An ArgumentParser that is used to retrieve command line arguments. 
+    """
+    parser = argparse.ArgumentParser(prog="fluorelax-sweep", description = "Calculate R1 "
+                                     "and R2 over a grid of systems, tc and magnet values "
+                                     "from one pass over the trajectory.")
+
+    ###########################################################
+    ############### OPTIONAL ARGUMENTS ########################
+    ###########################################################
+    parser.add_argument("-o", "--output_file", default=None,
+                        dest="output_file",
+                        help="The filename to which the labeled R1 and R2 cube will be saved.",
+                        type=str)
+
+    parser.add_argument("--format", default=None,
+                        dest="output_format", choices=["tsv", "npz", "hdf5"],
+                        help="Format of the output file: long format 'tsv' table, or "
+                             "'npz', 'hdf5' (requires h5py) cubes. "
+                             "Default inferred from the output file extension, else 'tsv'.",
+                        type=str)
+
+    parser.add_argument("--sys", default=None, nargs="+",
+                        dest="systems",
+                        help="Systems with CSA definitons included: "
+                             "'w4f', 'w5f', 'w6f', 'w7f'. Default all of them.",
+                        type=str)
+
+    parser.add_argument("--tc", default=[8.2e-9], nargs="+",
+                        dest="tc",
+                        help="Rotational coorelation time(s) in sec, default 8.2e-9 (CypA).",
+                        type=float)
+
+    parser.add_argument("--magnet", default=[14.1], nargs="+",
+                        dest="magnet",
+                        help="Magnetic induction value(s) in Tesla, default 14.1.",
+                        type=float)
+
+    parser.add_argument("--per_frame", default=False,
+                        dest="per_frame", action="store_true",
+                        help="Keep the R1 and R2 of each frame instead of the time average.")
+
+    add_frame_arguments(parser)
+
+    add_search_arguments(parser)
+
+    parser.add_argument("--chunk", default=1000,
+                        dest="chunk_size",
+                        help="Number of frames streamed at a time, default 1000.",
+                        type=int)
+
+    parser.add_argument("--workers", default=1,
+                        dest="n_workers",
+                        help="Number of processes to split the trajectory analysis "
+                             "across, default 1.",
+                        type=int)
+
+    parser.add_argument("--cache_dir", default=None,
+                        dest="cache_dir",
+                        help="Directory to cache the F-H distance tables in, so runs on the "
+                             "same trajectory, cutoff and step only with new tc, magnet or "
+                             "CSA values skip the trajectory. Default None (no cache).",
+                        type=str)
+
+    parser.add_argument("--cache_size", default=None,
+                        dest="cache_size",
+                        help="Maximum size of the cache directory in bytes, least recently "
+                             "used tables are removed first, default 2 GB.",
+                        type=int)
+
+    add_logging_arguments(parser)
+
+    ##########################################################
+    ############### REQUIRED ARGUMENTS #######################
+    ##########################################################
+    required_args = parser.add_argument_group("Required Arguments") 
+
+    required_args.add_argument("-c", "--coord", required = True, nargs="+",
+        help = "The MD trajectory file(s) or coordinate file(s).", action = "store", 
+        dest = "crd", type=str)
+
+    required_args.add_argument("-p", "--parm", required = True, 
+        help = "The MD parameter file or pdb file.", action = "store", 
+        dest = "parm", type=str)
+
+    return parser
+
+
+def add_frame_arguments(parser):
+    """
+    Frame selection options shared by the command line programs. Only the
+    selected frames are read, see calc_fh_dists.get_frame_range().
+    """
+    parser.add_argument("--step", "--stride", default=1, nargs="?",
+                        dest="step_size",
+                        help="Step size of the coordinates being loaded, default 1.",
+                        type=int)
+
+    parser.add_argument("--start", default=None,
+                        dest="start",
+                        help="First frame index to analyze, default 0.",
+                        type=int)
+
+    parser.add_argument("--stop", default=None,
+                        dest="stop",
+                        help="Frame index to stop before, default the end of the trajectory.",
+                        type=int)
+
+    parser.add_argument("--begin_ps", default=None,
+                        dest="begin_ps",
+                        help="Time in ps of the first frame to analyze, instead of --start, "
+                             "e.g. to skip the equilibration.",
+                        type=float)
+
+    parser.add_argument("--end_ps", default=None,
+                        dest="end_ps",
+                        help="Time in ps of the last frame to analyze (inclusive), "
+                             "instead of --stop.",
+                        type=float)
+
+
+def add_search_arguments(parser):
+    """
+    F-H search options shared by the command line programs, see Calc_FH_Dists.
+    """
+    parser.add_argument("--dist", default=3,
+                        dest="dist",
+                        help="Cutoff distance of the F-H dipolar sums in Angstroms, default 3.",
+                        type=float)
+
+    parser.add_argument("--water", default=False,
+                        dest="include_water", action="store_true",
+                        help="Include water hydrogens in the F-H distances, e.g. for "
+                             "solvated trajectories. Default only the solute protons.")
+
+    parser.add_argument("--skin", default=None,
+                        dest="skin",
+                        help="Verlet neighbor list skin in Angstroms, e.g. 2: only the protons "
+                             "within the cutoff plus skin of a fluorine are searched, and that "
+                             "list is rebuilt once an atom has moved more than half the skin. "
+                             "Speeds up --water. Default search all protons every frame.",
+                        type=float)
+
+
+def add_logging_arguments(parser):
+    """
+    Logging options shared by the command line programs, see log.setup_logging().
+    """
+    parser.add_argument("--log_level", default="INFO",
+                        dest="log_level", choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+                        help="Lowest level of the log messages (on stderr), default INFO, "
+                             "which includes the progress of the F-H distance calculation.",
+                        type=str)
+
+    parser.add_argument("--log_format", default="text",
+                        dest="log_format", choices=["text", "json"],
+                        help="Log as text or as one JSON object per line, default text.",
+                        type=str)
+
+    parser.add_argument("--log_file", default=None,
+                        dest="log_file",
+                        help="Log to this file instead of stderr.",
+                        type=str)
+
+    parser.add_argument("--progress_interval", default=10,
+                        dest="progress_interval",
+                        help="Seconds between progress messages (frames processed, "
+                             "frames/s and ETA), default 10.",
+                        type=float)
+
+
+def handle_command_line(argument_parser, argv=None): 
     """
     Take command line arguments, check for issues, return the arguments. 
 
     Args: 
         `argument_parser` (`argparse.ArgumentParser`): The argument parser that is \
         returned in `create_cmd_arguments()`.
+        `argv` (`list`): The arguments to parse, default `sys.argv`.
     
     Returns: 
         (`argparse.NameSpace`): contains all arguments passed into EnsembleOptimizer.
@@ -78,7 +405,21 @@ def handle_command_line(argument_parser):
         Prints specific issues to terminal.
     """
     # retrieve args
-    args = argument_parser.parse_args() 
+    args = argument_parser.parse_args(argv) 
 
+    # frames or times, see add_frame_arguments()
+    if args.step_size is not None and args.step_size < 1:
+        argument_parser.error("--step must be a positive number of frames.")
+    if args.start is not None and args.stop is not None and \
+       0 <= args.stop <= args.start:
+        argument_parser.error(f"No frames selected, --stop {args.stop} is not after "
+                              f"--start {args.start}.")
+    if args.begin_ps is not None and args.end_ps is not None and args.end_ps < args.begin_ps:
+        argument_parser.error(f"No frames selected, --end_ps {args.end_ps} is before "
+                              f"--begin_ps {args.begin_ps}.")
+    if (args.start is not None or args.stop is not None) and \
+       (args.begin_ps is not None or args.end_ps is not None):
+        argument_parser.error("Select the frames with --start/--stop or with "
+                              "--begin_ps/--end_ps, not both.")
 
     return args # return statement 
\ No newline at end of file
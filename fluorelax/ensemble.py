@@ -0,0 +1,247 @@
+"""
+Ensemble mode: calculate per-frame R1 and R2 for many (parm, trajectory) sets,
+e.g. 4 systems x 5 replicates, and aggregate the mean, stdev and standard error
+of each system in one invocation.
+
+Usage: python -m fluorelax.ensemble -e ensemble.txt -o results --workers 8
+"""
+
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from .command_line import create_ensemble_arguments, handle_command_line
+
+logger = logging.getLogger(__name__)
+
+
+def read_ensemble_file(filename):
+    """
+    Parse the ensemble definition file.
+
+    Parameters
+    ----------
+    filename : str
+        Text file with one replicate per line: 'system parm coord [coord ...]'.
+        Blank lines and lines starting with '#' are skipped.
+
+    Returns
+    -------
+    ensemble : dict
+        Replicates of each system, {system : [(parm, [coord, ...]), ...]}.
+
+    Raises
+    ------
+    ValueError
+        If a line is incomplete or a system has no CSA tensor, so nothing
+        is scheduled for an ensemble file with a typo.
+    """
+    from .calc_relax import CSA_TENSORS
+
+    ensemble = {}
+    with open(filename) as f:
+        for line in f:
+            fields = line.split()
+            if not fields or fields[0].startswith("#"):
+                continue
+            if len(fields) < 3:
+                raise ValueError(f"Ensemble line needs 'system parm coord': {line.strip()}")
+            if fields[0] not in CSA_TENSORS:
+                raise ValueError(f"No CSA tensor for system '{fields[0]}', options are: "
+                                 f"{', '.join(CSA_TENSORS)}.")
+            ensemble.setdefault(fields[0], []).append((fields[1], fields[2:]))
+    return ensemble
+
+
+def calc_replicate(system, parm, crd, output_file, tc=8.2e-9, magnet=14.1,
+                   step=1, chunk_size=1000, dist=3, start=None, stop=None, begin_ps=None,
+                   end_ps=None, include_water=False, skin=None):
+    """
+    Stream one replicate trajectory and write its per-frame R1 and R2 to disk
+    chunk by chunk, so only one chunk of frames is held in memory.
+
+    Parameters
+    ----------
+    system : str
+        System with CSA definitions, see CSA_TENSORS.
+    parm : str
+        The MD parameter file or pdb file.
+    crd : list of str
+        The MD trajectory file(s) or coordinate file(s).
+    output_file : str
+        The tsv file to write the frame, R1, R2 columns to.
+    tc : float
+        Rotational coorelation time (sec).
+    magnet : float
+        The magnetic induction value in Tesla.
+    step : int
+        Step size of the frames being analyzed.
+    chunk_size : int
+        Number of frames calculated and written at a time.
+    dist : int
+        The distance to calculate F-H distances within.
+    start, stop : int
+        Frame slice to analyze with step, default the whole trajectory.
+    begin_ps, end_ps : float
+        Time window in ps (end inclusive) instead of start and stop,
+        e.g. the same equilibrated window of every replicate.
+    include_water : bool
+        Include the water hydrogens as protons.
+    skin : float
+        Verlet neighbor list skin in Angstroms, see Calc_FH_Dists.
+
+    Returns
+    -------
+    output_file : str
+    """
+    # only imported in the workers that run the trajectory analysis
+    import numpy as np
+    import MDAnalysis as mda
+    from .calc_relax import get_relaxation_kernel, CSA_TENSORS
+    from .calc_fh_dists import Calc_FH_Dists, get_frame_range
+
+    calc_relax = get_relaxation_kernel(tc, magnet, *CSA_TENSORS[system])
+    traj = mda.Universe(parm, crd)
+    fh_dist_base = Calc_FH_Dists(traj, dist=dist, calc_relax=calc_relax,
+                                 include_water=include_water, skin=skin, sum_only=True)
+    start, stop, step = get_frame_range(traj.trajectory, start, stop, step, begin_ps, end_ps)
+
+    with open(output_file, "w") as f:
+        for chunk in fh_dist_base.iter_chunks(chunk_size, start=start, stop=stop, step=step):
+            np.savetxt(f, chunk.calc_r1_r2(), delimiter="\t")
+
+    return output_file
+
+
+def calc_ensemble_stats(r1_r2_files):
+    """
+    Aggregate the per-frame R1 and R2 of the replicates of one system.
+    The time average of each replicate is over all of its frames, only the
+    per-frame table is truncated to the shortest replicate.
+
+    Parameters
+    ----------
+    r1_r2_files : list of str
+        Per-replicate tsv files with frame, R1, R2 (, R1, R2 ...) columns.
+
+    Returns
+    -------
+    per_frame : ndarray
+        Array of size frames x (1 + 3 * n_rates) columns: frame, then the mean,
+        stdev and standard error across replicates of each R1/R2 column.
+    overall : ndarray
+        Array of size 3 x n_rates: the mean, stdev and standard error
+        of the time averaged R1/R2 of each replicate.
+    """
+    import numpy as np
+
+    data = [np.loadtxt(filename, ndmin=2) for filename in r1_r2_files]
+    rep_avgs = np.array([np.mean(rep[:, 1:], axis=0) for rep in data])
+    n_frames = min(len(rep) for rep in data)
+    if any(len(rep) != n_frames for rep in data):
+        logger.warning("Replicates of %s frames, the per-frame statistics only cover "
+                       "the first %d", ", ".join(str(len(rep)) for rep in data), n_frames)
+    # replicates x frames x columns
+    data = np.stack([rep[:n_frames] for rep in data])
+    n_reps = len(data)
+
+    # ddof=0 so a single replicate gives a stdev of 0 instead of NaN
+    ddof = 1 if n_reps > 1 else 0
+
+    per_frame_stdev = np.std(data[:, :, 1:], axis=0, ddof=ddof)
+    per_frame = np.column_stack([data[0, :, 0],
+                                 np.mean(data[:, :, 1:], axis=0),
+                                 per_frame_stdev,
+                                 per_frame_stdev / np.sqrt(n_reps)])
+
+    rep_stdev = np.std(rep_avgs, axis=0, ddof=ddof)
+    overall = np.vstack([np.mean(rep_avgs, axis=0), rep_stdev, rep_stdev / np.sqrt(n_reps)])
+
+    return per_frame, overall
+
+
+def run_ensemble(ensemble, output_dir=".", n_workers=1, **kwargs):
+    """
+    Run every replicate of every system concurrently, then aggregate per system.
+
+    Parameters
+    ----------
+    ensemble : dict
+        Replicates of each system, {system : [(parm, [coord, ...]), ...]},
+        see read_ensemble_file().
+    output_dir : str
+        Directory for the per-replicate '{system}_v{XX}_R1_R2.tsv' files and the
+        aggregated '{system}_R1_R2_avg.tsv' and 'ensemble_summary.tsv' files.
+    n_workers : int
+        Number of replicates to run concurrently.
+    **kwargs
+        Passed on to calc_replicate(), e.g. tc, magnet, step, chunk_size.
+
+    Returns
+    -------
+    summary : dict
+        The overall (mean, stdev, sem) x n_rates array of each system.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        futures = {}
+        for system, replicates in ensemble.items():
+            futures[system] = [executor.submit(calc_replicate, system, parm, crd,
+                                    os.path.join(output_dir, f"{system}_v{num:02d}_R1_R2.tsv"),
+                                    **kwargs)
+                               for num, (parm, crd) in enumerate(replicates)]
+        # replicates done, frames/s and ETA
+        from .log import Progress
+        progress = Progress.get(sum(map(len, futures.values())), logger, label="replicates")
+        for future in as_completed([future for system_futures in futures.values()
+                                    for future in system_futures]):
+            logger.debug("Finished %s", future.result())
+            if progress is not None:
+                progress.update()
+        r1_r2_files = {system : [future.result() for future in system_futures]
+                       for system, system_futures in futures.items()}
+
+    import numpy as np
+    from .relax_io import get_column_names
+
+    summary = {}
+    with open(os.path.join(output_dir, "ensemble_summary.tsv"), "w") as f:
+        f.write("# system\tn_reps\tR1\tR1_stdev\tR1_sem\tR2\tR2_stdev\tR2_sem\n")
+        for system, files in r1_r2_files.items():
+            per_frame, overall = calc_ensemble_stats(files)
+            # R1, R2 (R1_1, R2_1 ...) of each fluorine, named as in the per-frame files
+            rates = get_column_names(1 + overall.shape[1])[1:]
+            header = ["frame"] + rates + [f"{rate}_stdev" for rate in rates] + \
+                     [f"{rate}_sem" for rate in rates]
+            np.savetxt(os.path.join(output_dir, f"{system}_R1_R2_avg.tsv"), per_frame,
+                       delimiter="\t", header="\t".join(header))
+            summary[system] = overall
+            # first fluorine R1 and R2
+            f.write(f"{system}\t{len(files)}\t" +
+                    "\t".join(f"{val}" for val in overall[:, :2].T.ravel()) + "\n")
+
+    return summary
+
+
+def main(argv=None):
+    """
+    Command line entry point of the ensemble mode.
+    """
+    args = handle_command_line(create_ensemble_arguments(), argv)
+    from .log import setup_logging
+    setup_logging(args.log_level, args.log_format, args.log_file, args.progress_interval)
+    ensemble = read_ensemble_file(args.ensemble)
+    summary = run_ensemble(ensemble, output_dir=args.output_dir, n_workers=args.n_workers,
+                           step=args.step_size, chunk_size=args.chunk_size,
+                           start=args.start, stop=args.stop, begin_ps=args.begin_ps,
+                           end_ps=args.end_ps, tc=args.tc, magnet=args.magnet,
+                           dist=args.dist, include_water=args.include_water, skin=args.skin)
+
+    for system, overall in summary.items():
+        print(f"{system}: R1-AVG={overall[0, 0]} +/- {overall[2, 0]} "
+              f"R2-AVG={overall[0, 1]} +/- {overall[2, 1]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,122 +1,344 @@
 """
 Main call.
 
-TODO:
-- parallize the mda processing portion? (dask)
+The full calculation is available in-process with run_pipeline(), and on the
+command line with the `fluorelax` console script (or python -m fluorelax).
 """
 
-import numpy as np
-import matplotlib.pyplot as plt
-import MDAnalysis as mda
+import logging
 
-from command_line import create_cmd_arguments, handle_command_line
-from calc_relax import Calc_19F_Relaxation
-from calc_fh_dists import Calc_FH_Dists
-from plot_relax import Plot_Relaxation
+# heavy dependencies (NumPy, MDAnalysis, matplotlib) are imported where they are
+# first needed, so --help and headless runs do not pay for unused imports
+from .command_line import create_cmd_arguments, handle_command_line
 
-# if python file is being used 
-if __name__ == '__main__': 
-    
-    # args_list to save time for now (TODO)
-    magnet = 14.1                   # Tesla (600 MHz of 1H+)
-    tc = 8.2e-9                     # 8.2ns for CypA, tc in sec
+logger = logging.getLogger(__name__)
 
+
+def run_pipeline(parm, crd, system=None, csa=None, tc=8.2e-9, magnet=14.1, dist=3,
+                 step=1, chunk_size=None, n_workers=1, output_file=None, output_format=None,
+                 cache_dir=None, cache_size=None, stats=None, include_water=False,
+                 skin=None, tail_correction=False, profiler=None, start=None, stop=None,
+                 begin_ps=None, end_ps=None):
     """
-    Command line
-    """
-    # Create command line arguments with argparse
-    argument_parser = create_cmd_arguments()
-    # Retrieve list of args
-    args = handle_command_line(argument_parser)
-
-    # TODO: hack for now, later put as seperate args?
-    # CSA tensors for 4F-Trp
-    if args.system == "w4f":
-        sgm11 = 11.2
-        sgm22 = -48.3
-        sgm33 = -112.8
-    elif args.system == "w5f":
-        sgm11 = 4.8
-        sgm22 = -60.5
-        sgm33 = -86.1
-    elif args.system == "w6f":
-        sgm11 = 12.9
-        sgm22 = -51.2
-        sgm33 = -91.6
-    elif args.system == "w7f":
-        sgm11 = 4.6
-        sgm22 = -48.3
-        sgm33 = -123.3
-    
-    """
-    Load trajectory or pdb data and calc all F-H distances.
-    # TODO: do for each frame, also test with water
+    Load trajectory or pdb data, calc all F-H distances and, for each frame,
+    calculate the R1 and R2 value from all F-H distances.
+
+    Parameters
+    ----------
+    parm : str
+        The MD parameter file or pdb file.
+    crd : str or list of str
+        The MD trajectory file(s) or coordinate file(s).
+    system : str
+        System with CSA definitions included: 'w4f', 'w5f', 'w6f', 'w7f'.
+    csa : tuple
+        CSA tensor (sigma11, sigma22, sigma33) in ppm, overrides system.
+    tc : float
+        Rotational coorelation time (sec), default 8.2ns for CypA.
+    magnet : float
+        The magnetic induction value in Tesla, default 14.1 T (600 MHz of 1H+).
+    dist : int
+        The distance to calculate F-H distances within, default 3 Angstroms.
+    step : int
+        Step size of the coordinates being loaded, default 1.
+    chunk_size : int
+        Analyze the trajectory in chunks of this many frames instead of
+        holding all F-H distances in memory, default None.
+    n_workers : int
+        Number of processes to split the trajectory analysis across, default 1.
+    output_file : str
+        Optional file to save the per-frame data to.
+    output_format : str
+        Format of the output_file: 'tsv', 'npz' or 'hdf5', default
+        inferred from the output_file extension.
+    cache_dir : str
+        Directory of the on-disk F-H pair table cache, default None (no cache).
+        Runs on the same files, cutoff and step then skip the trajectory
+        entirely, e.g. when only tc, magnet or the CSA tensor change.
+    cache_size : int
+        Maximum size of the cache directory in bytes, default 2 GB.
+    stats : Running_Stats
+        Optional running statistics (mean, stdev, block averaged sem and
+        convergence trace) updated with the R1 and R2 columns, chunk by
+        chunk when streaming and otherwise in blocks of frames, see stats.py.
+    include_water : bool
+        Include the water hydrogens as protons, default False.
+    skin : float
+        Verlet neighbor list skin in Angstroms, default None (no neighbor list).
+        Only the protons within dist + skin of a fluorine are searched each
+        frame, which mostly helps with include_water, see Calc_FH_Dists.
+    tail_correction : bool
+        Add the time averaged r^-6 sum of the protons beyond dist, from the
+        F-H radial distribution of a sample of frames, see tail_correction.py.
+        A small dist then gives the averages of a large one, default False.
+    profiler : Profiler
+        Optional profiler recording the time, frames and peak memory of each
+        stage, see profiling.py.
+    start, stop : int
+        Frame slice to analyze with step, default the whole trajectory.
+        Frames outside of it are not read.
+    begin_ps, end_ps : float
+        Time window in ps (end inclusive) instead of start and stop,
+        see get_frame_range().
+
+    Returns
+    -------
+    r1_r2 : ndarray
+        Array of size frames x 3 columns (frame, R1, R2),
+        with 2 more columns (R1, R2) for each additional 19F.
     """
-    # TODO: for big trajectories, can't load in_memory, must stream it but this can be slow
-    traj = mda.Universe(args.parm, args.crd, in_memory=True, in_memory_step=args.step_size)
-    fh_dist_base = Calc_FH_Dists(traj, dist=3).run()
+    import MDAnalysis as mda
+    from .calc_relax import get_relaxation_kernel, CSA_TENSORS
+    from .calc_fh_dists import Calc_FH_Dists, get_frame_range
+    from .profiling import Profiler
+
+    # a disabled profiler records nothing
+    profiler = Profiler(enabled=False) if profiler is None else profiler
+
+    if csa is None:
+        if system not in CSA_TENSORS:
+            raise ValueError(f"No CSA tensor for system '{system}', options are: "
+                             f"{', '.join(CSA_TENSORS)}. Otherwise pass csa.")
+        csa = CSA_TENSORS[system]
+    sgm11, sgm22, sgm33 = csa
+
+    # the spectral densities, csa and dd prefactors are only computed once here,
+    # dd contributions are then the sum of r^-6 of each frame times a constant
+    with profiler.stage("kernel"):
+        calc_relax = get_relaxation_kernel(tc, magnet, sgm11, sgm22, sgm33)
+
+    # for multiple replicates and their stdev, see ensemble.py (python -m fluorelax.ensemble)
+
+    # a time window only needs the first frame time and dt of the trajectory,
+    # an empty selection is an error before any frames are read
+    if any(value is not None for value in (start, stop, begin_ps, end_ps)) or step != 1:
+        start, stop, step = get_frame_range(mda.Universe(parm, crd).trajectory, start, stop,
+                                            step, begin_ps, end_ps)
+
+    # frame blocks are split across a process pool when using multiple workers
+    backend = "serial" if n_workers == 1 else "multiprocessing"
+
+    # constant sum of r^-6 of the protons beyond dist, added to every frame
+    tail_r6 = None
+    if tail_correction:
+        from .tail_correction import calc_tail_r6
+        with profiler.stage("tail_correction"):
+            tail_r6 = calc_tail_r6(mda.Universe(parm, crd), dist, include_water=include_water,
+                                   skin=skin, start=start, stop=stop, step=step,
+                                   n_workers=n_workers, backend=backend)
+
+    if cache_dir is not None:
+        from .cache import FH_Dist_Cache, DEFAULT_CACHE_SIZE, get_fh_table
+        from .calc_fh_dists import calc_frame_sum_r6, calc_r1_r2_columns
+        cache = FH_Dist_Cache(cache_dir, cache_size or DEFAULT_CACHE_SIZE)
+        # loading, search and caching, or only reading the cached table
+        with profiler.stage("fh_table"):
+            table = get_fh_table(parm, crd, dist=dist, start=start, stop=stop, step=step,
+                                 chunk_size=chunk_size,
+                                 cache=cache, include_water=include_water, skin=skin,
+                                 n_workers=n_workers, backend=backend)
+        with profiler.stage("relaxation", n_frames=len(table["frames"])):
+            sum_r6 = calc_frame_sum_r6(table["n_pairs"], table["fluorine_index"],
+                                       table["distances"], table["n_fluorine"])
+            if tail_r6 is not None:
+                sum_r6 += tail_r6
+            r1_r2 = calc_r1_r2_columns(table["frames"], sum_r6, calc_relax)
+        # in blocks of frames, for the convergence trace
+        if stats is not None:
+            with profiler.stage("stats"):
+                stats.update_blocks(r1_r2[:, 1:], chunk_size)
+
+    elif chunk_size is None:
+        logger.info("Opening %s", crd)
+        with profiler.stage("load"):
+            traj = mda.Universe(parm, crd)
+        # the per-frame R1 and R2 are calculated along with the sums of r^-6,
+        # the F-H pairs are not kept, only the selected frames are read from disk
+        with profiler.stage("fh_dists"):
+            fh_dist_base = Calc_FH_Dists(traj, dist=dist, calc_relax=calc_relax,
+                                         include_water=include_water, skin=skin,
+                                         tail_r6=tail_r6, time_frames=profiler.enabled,
+                                         sum_only=True).run(
+                                         start=start, stop=stop, step=step,
+                                         n_workers=n_workers, backend=backend)
+        profiler.add_frames("fh_dists", fh_dist_base.n_frames,
+                            fh_dist_base.results.get("frame_times"))
+
+        # array of size frames x 3 columns (frame, R1, R2)
+        # with 2 more columns (R1, R2) for each additional 19F
+        r1_r2 = fh_dist_base.calc_r1_r2()
+        # in blocks of frames, for the convergence trace
+        if stats is not None:
+            with profiler.stage("stats"):
+                stats.update_blocks(r1_r2[:, 1:])
+
+    # for big trajectories, stream from disk and only keep the per-frame R1 and R2
+    else:
+        logger.info("Streaming %s in chunks of %d frames", crd, chunk_size)
+        with profiler.stage("load"):
+            traj = mda.Universe(parm, crd)
+        # frames are read from disk during the search, chunk by chunk
+        with profiler.stage("fh_dists"):
+            fh_dist_base = Calc_FH_Dists(traj, dist=dist, calc_relax=calc_relax,
+                                         include_water=include_water, skin=skin,
+                                         tail_r6=tail_r6, time_frames=profiler.enabled,
+                                         sum_only=True).run_chunked(
+                                         chunk_size=chunk_size, start=start, stop=stop,
+                                         step=step, stats=stats,
+                                         n_workers=n_workers, backend=backend)
+        r1_r2 = fh_dist_base.r1_r2
+        profiler.add_frames("fh_dists", len(r1_r2), getattr(fh_dist_base, "frame_times", None))
 
     """
-    For each distance value, calculate the R1 and R2 value.
+    Save the frame, R1 and R2 data as a tsv or binary columns with metadata.
     """
+    if output_file is not None:
+        from .relax_io import save_r1_r2
+        metadata = {"tc" : tc, "magnet" : magnet, "system" : system,
+                    "sigma11" : sgm11, "sigma22" : sgm22, "sigma33" : sgm33,
+                    "dist" : dist, "start" : start, "stop" : stop, "step" : step,
+                    "include_water" : include_water,
+                    "tail_r6" : None if tail_r6 is None else tail_r6.tolist()}
+        with profiler.stage("output", n_frames=len(r1_r2)):
+            save_r1_r2(output_file, r1_r2, metadata=metadata, fmt=output_format)
+        logger.info("Saved the R1 and R2 of %d frames to %s", len(r1_r2), output_file)
 
-    # TODO: update to ndarrays, maybe make into function, seperate script?
-    # test speed and optimize
-    
-    # TODO: make this able to take multiple files and find stdev, maybe a seperate proc function
-
-    # array of size frames x 3 columns (frame, avg R1, avg R2) # TODO: add stdev?
-    r1_r2 = np.zeros(shape=(len(fh_dist_base.results[:,1:]), 3))
-    r1_r2[:, 0] = fh_dist_base.results[:,0]
-
-    # Here: calling each calc class seperately and only sum the dd contributions, csa is not dependent
-    # note this new implementation is alot slower... (compared to having just one calc_relax and averaging later)
-        # but not sure, didn't test the difference
-    for num, dists in enumerate(fh_dist_base.results[:,1:]):
-        calc_relax = Calc_19F_Relaxation(tc, magnet, sgm11, sgm22, sgm33)
-        r1_csa = calc_relax.calc_csa_r1()
-        r2_csa = calc_relax.calc_csa_r2()
-        # TODO: these are relatively small lists, may not need to change to ndarray
-            # but if I do, then I need to cut out the NaN or zero values before the np.mean step
-        r1_dd = 0
-        r2_dd = 0
-        for fh_dist in dists:
-            if fh_dist == 0:
-                continue # TODO: is there a better way to do this?
-            # instantiate the calc_relax class and then call individual class methods
-            calc_relax = Calc_19F_Relaxation(tc, magnet, sgm11, sgm22, sgm33, fh_dist)
-            # sum each dd contribution
-            r1_dd += calc_relax.calc_dd_r1()
-            r2_dd += calc_relax.calc_dd_r2()
-
-        # fill in col 1 (R1), col 2 (R2)
-        r1_r2[num, 1] = r1_dd + r1_csa
-        r1_r2[num, 2] = r2_dd + r2_csa
-    
-    # test seperate values
-    print(r1_dd, r1_csa)
-    print(r2_dd, r2_csa)
+    return r1_r2
 
+
+def main(argv=None):
     """
-    Save the frame, avg and stdev R1 and R2 data as a tsv?
+    Command line entry point of the `fluorelax` console script.
+
+    Parameters
+    ----------
+    argv : list of str
+        Command line arguments, default sys.argv.
     """
-    if args.output_file is not None:
-        np.savetxt(args.output_file, r1_r2, delimiter="\t")
+    # Create command line arguments with argparse
+    argument_parser = create_cmd_arguments()
+    # Retrieve list of args
+    args = handle_command_line(argument_parser, argv)
+
+    from .log import setup_logging
+    setup_logging(args.log_level, args.log_format, args.log_file, args.progress_interval)
+
+    from .stats import Running_Stats
+    from .profiling import Profiler
+    from .calc_relax import CSA_TENSORS
+
+    if args.system not in CSA_TENSORS:
+        argument_parser.error(f"--sys needs one of the systems with a CSA tensor: "
+                              f"{', '.join(CSA_TENSORS)}.")
+
+    # --profile_json implies --profile, otherwise nothing is recorded
+    profiler = Profiler(enabled=args.profile or args.profile_json is not None)
+
+    if args.append:
+        if args.output_file is None:
+            argument_parser.error("--append needs an output file (-o).")
+        if args.tail_correction:
+            argument_parser.error("--tail is not supported with --append.")
+        if args.cache_dir is not None:
+            argument_parser.error("--cache_dir is not supported with --append, the frames "
+                                  "are only processed once.")
+        if args.output_format not in (None, "tsv"):
+            argument_parser.error("--append writes a tsv output file, --format "
+                                  f"{args.output_format} is not supported.")
+        if args.segments_dir is not None:
+            argument_parser.error("--append and --segments can not be combined, --segments "
+                                  "already skips the segments processed before.")
+        if any(value is not None for value in (args.start, args.stop, args.begin_ps,
+                                               args.end_ps)):
+            argument_parser.error("--append continues from the last processed frame, "
+                                  "--start/--stop/--begin_ps/--end_ps are not supported.")
+        from .incremental import run_incremental
+        with profiler.stage("incremental"):
+            r1_r2, stats = run_incremental(args.parm, args.crd, args.output_file,
+                                           system=args.system, tc=args.tc, magnet=args.magnet,
+                                           dist=args.dist, step=args.step_size,
+                                           chunk_size=args.chunk_size or 1000,
+                                           n_workers=args.n_workers,
+                                           include_water=args.include_water, skin=args.skin)
+        profiler.add_frames("incremental", len(r1_r2))
+        # statistics over all frames so far, not only the new ones
+        print(f"{len(r1_r2)} new frames, {stats.n} total")
+
+    elif args.segments_dir is not None:
+        if args.cache_dir is not None:
+            argument_parser.error("--cache_dir is not supported with --segments, "
+                                  "the segment results are kept in the --segments directory.")
+        from .segments import run_segments
+        stats = Running_Stats()
+        with profiler.stage("segments"):
+            r1_r2 = run_segments(args.parm, args.crd, args.segments_dir, system=args.system,
+                                 tc=args.tc, magnet=args.magnet, dist=args.dist,
+                                 step=args.step_size, start=args.start, stop=args.stop,
+                                 begin_ps=args.begin_ps, end_ps=args.end_ps,
+                                 chunk_size=args.chunk_size or 1000, n_workers=args.n_workers,
+                                 include_water=args.include_water, skin=args.skin,
+                                 tail_correction=args.tail_correction,
+                                 output_file=args.output_file,
+                                 output_format=args.output_format, stats=stats)
+        profiler.add_frames("segments", len(r1_r2))
+
+    else:
+        stats = Running_Stats()
+        r1_r2 = run_pipeline(args.parm, args.crd, system=args.system, tc=args.tc,
+                             magnet=args.magnet, dist=args.dist, step=args.step_size,
+                             chunk_size=args.chunk_size,
+                             n_workers=args.n_workers, output_file=args.output_file,
+                             output_format=args.output_format, cache_dir=args.cache_dir,
+                             cache_size=args.cache_size, stats=stats,
+                             include_water=args.include_water, skin=args.skin,
+                             tail_correction=args.tail_correction, profiler=profiler,
+                             start=args.start, stop=args.stop, begin_ps=args.begin_ps,
+                             end_ps=args.end_ps)
+
+    if stats.n == 0:
+        argument_parser.error("No frames were analyzed, check the trajectory and the "
+                              "frame selection.")
+
+    # first fluorine, the sem is block averaged for the frame to frame correlation
+    print(f"R1-AVG={stats.mean[0]}\nR2-AVG={stats.mean[1]}")
+    print(f"R1-STDEV={stats.stdev[0]}\nR2-STDEV={stats.stdev[1]}")
+    print(f"R1-SEM={stats.sem[0]}\nR2-SEM={stats.sem[1]}")
+    # also as a structured record, e.g. for --log_format json
+    logger.info("%d frames, R1-AVG=%s R2-AVG=%s", stats.n, stats.mean[0], stats.mean[1],
+                extra={"n_frames" : stats.n, "mean" : stats.mean.tolist(),
+                       "stdev" : stats.stdev.tolist(), "sem" : stats.sem.tolist()})
+
+    if args.convergence_file is not None:
+        import numpy as np
+        from .relax_io import get_column_names
+        names = get_column_names(1 + len(stats.mean))[1:]
+        np.savetxt(args.convergence_file, np.array(stats.trace), delimiter="\t",
+                   header="\t".join(stats.trace_columns(names)))
 
     """
     Plot the R1 and R2 data.
     """
-    # plt.plot(fh_dist_base.results[:,0], r1_r2[:,0])
-    # plt.plot(fh_dist_base.results[:,0], r1_r2[:,1])
-    plt.plot(r1_r2[:, 0], r1_r2[:, 1])
-    plt.plot(r1_r2[:, 0], r1_r2[:, 2])
-    print(f"R1-AVG={np.mean(r1_r2[:,1])}\nR2-AVG={np.mean(r1_r2[:,2])}")
-    #plt.hlines(1.99, xmin=0, xmax=fh_dist_base.results[-1,0])    # R1
-    #plt.hlines(109.1, xmin=0, xmax=fh_dist_base.results[-1,0])   # R2
-    plt.show()
-
-    # plotter class
+    if args.plot:
+        # includes the time the plot window is open
+        with profiler.stage("plot"):
+            import matplotlib.pyplot as plt
+            plt.plot(r1_r2[:, 0], r1_r2[:, 1])
+            plt.plot(r1_r2[:, 0], r1_r2[:, 2])
+            #plt.hlines(1.99, xmin=0, xmax=r1_r2[-1,0])    # R1
+            #plt.hlines(109.1, xmin=0, xmax=r1_r2[-1,0])   # R2
+            plt.show()
+
+    if profiler.enabled:
+        print(profiler.summary())
+        if args.profile_json is not None:
+            profiler.save_json(args.profile_json)
+
+    # plotter class (from .plot_relax import Plot_Relaxation)
     # plotter = Plot_Relaxation(r1_r2, "dist")
     # plotter.plot_r2()
-    # plt.show()    
+    # plt.show()
+
 
+# if python file is being used
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+"""
+Incremental (append) mode for growing trajectories.
+
+A checkpoint next to the output file ('{output_file}.ckpt.json') records the
+next frame to process, the size of the output written so far and the running
+R1/R2 statistics. Rerunning with the same parameters only processes the frames
+added since (a longer trajectory file, or new segment files appended to the
+coordinate list) and appends them to the output.
+"""
+
+import json
+import logging
+import os
+
+CHECKPOINT_VERSION = 1
+
+logger = logging.getLogger(__name__)
+
+
+def get_checkpoint_file(output_file):
+    return f"{output_file}.ckpt.json"
+
+
+def read_checkpoint(output_file):
+    """
+    Checkpoint of output_file, or None if there is none yet.
+    """
+    try:
+        with open(get_checkpoint_file(output_file)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def write_checkpoint(output_file, checkpoint):
+    """
+    Write the checkpoint atomically, so an interrupted run keeps the last one.
+    """
+    checkpoint_file = get_checkpoint_file(output_file)
+    tmp_file = f"{checkpoint_file}.tmp"
+    with open(tmp_file, "w") as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(tmp_file, checkpoint_file)
+
+
+def run_incremental(parm, crd, output_file, system=None, csa=None, tc=8.2e-9, magnet=14.1,
+                    dist=3, step=1, chunk_size=1000, n_workers=1, include_water=False,
+                    skin=None):
+    """
+    Process only the frames not yet in output_file and append their R1 and R2.
+    Without a checkpoint, the output is started from frame 0.
+
+    Parameters
+    ----------
+    parm : str
+        The MD parameter file or pdb file.
+    crd : str or list of str
+        The MD trajectory file(s) or coordinate file(s). Segments can be added
+        to the end of the list between runs.
+    output_file : str
+        The tsv file the frame, R1, R2 columns are appended to.
+    system, csa, tc, magnet, dist, step, chunk_size, n_workers, include_water
+        As in run_pipeline(), these must not change between runs.
+    skin : float
+        Verlet neighbor list skin in Angstroms, see Calc_FH_Dists. It does not
+        change the results, so it can change between runs.
+
+    Returns
+    -------
+    r1_r2 : ndarray
+        The rows of the newly processed frames.
+    stats : Running_Stats
+        Running mean and stdev of the R1, R2 columns of all frames so far.
+
+    Raises
+    ------
+    ValueError
+        If the checkpoint does not match the parameters or the trajectory,
+        e.g. the trajectory got shorter or the earlier segments changed, or
+        if output_file already has results but no checkpoint.
+    """
+    import numpy as np
+    import MDAnalysis as mda
+    from .calc_relax import get_relaxation_kernel, CSA_TENSORS
+    from .calc_fh_dists import Calc_FH_Dists
+    from .relax_io import get_format
+    from .stats import Running_Stats
+
+    if get_format(output_file) != "tsv":
+        raise ValueError("Incremental mode appends to a tsv output file.")
+    if csa is None:
+        if system not in CSA_TENSORS:
+            raise ValueError(f"No CSA tensor for system '{system}', options are: "
+                             f"{', '.join(CSA_TENSORS)}. Otherwise pass csa.")
+        csa = CSA_TENSORS[system]
+    crd = [crd] if isinstance(crd, str) else list(crd)
+
+    params = {"tc" : tc, "magnet" : magnet, "csa" : list(csa), "dist" : dist, "step" : step,
+              "include_water" : include_water}
+    segments = [os.path.abspath(filename) for filename in crd]
+
+    traj = mda.Universe(parm, crd)
+    n_frames = int(traj.trajectory.n_frames)
+
+    checkpoint = read_checkpoint(output_file)
+    if checkpoint is None or not os.path.exists(output_file):
+        # without a checkpoint it is unknown which frames an existing output has
+        if os.path.exists(output_file) and os.path.getsize(output_file) > 0:
+            raise ValueError(f"{output_file} has no checkpoint "
+                             f"({get_checkpoint_file(output_file)}) to append to, "
+                             f"remove or move it to start over.")
+        checkpoint = {"version" : CHECKPOINT_VERSION, "parm" : os.path.abspath(parm),
+                      "crd" : segments, "params" : params, "next_frame" : 0,
+                      "n_frames" : 0, "output_size" : 0, "stats" : Running_Stats().to_dict()}
+        # start a new output
+        open(output_file, "w").close()
+    else:
+        if checkpoint["params"] != params or checkpoint["parm"] != os.path.abspath(parm):
+            raise ValueError(f"The parameters of {output_file} were {checkpoint['params']}, "
+                             f"remove {get_checkpoint_file(output_file)} to start over.")
+        if segments[:len(checkpoint["crd"])] != checkpoint["crd"] \
+                or n_frames < checkpoint["n_frames"]:
+            raise ValueError(f"The trajectory of {output_file} is not an extension of "
+                             f"{checkpoint['crd']} ({checkpoint['n_frames']} frames), "
+                             f"remove {get_checkpoint_file(output_file)} to start over.")
+        # drop rows written after the last checkpoint (an interrupted run)
+        with open(output_file, "r+") as f:
+            f.truncate(checkpoint["output_size"])
+
+    logger.info("Processing frames %d to %d of %s", checkpoint["next_frame"], n_frames,
+                output_file)
+    calc_relax = get_relaxation_kernel(tc, magnet, *csa)
+    backend = "serial" if n_workers == 1 else "multiprocessing"
+    fh_dist_base = Calc_FH_Dists(traj, dist=dist, calc_relax=calc_relax,
+                                 include_water=include_water, skin=skin,
+                                 sum_only=True).run_chunked(
+                                 chunk_size=chunk_size, start=checkpoint["next_frame"],
+                                 step=step, n_workers=n_workers, backend=backend)
+    r1_r2 = fh_dist_base.r1_r2
+
+    with open(output_file, "a") as f:
+        np.savetxt(f, r1_r2, delimiter="\t")
+
+    stats = Running_Stats.from_dict(checkpoint["stats"]).update(r1_r2[:, 1:])
+    if len(r1_r2):
+        checkpoint["next_frame"] = int(r1_r2[-1, 0]) + step
+    checkpoint.update(crd=segments, n_frames=n_frames, stats=stats.to_dict(),
+                      output_size=os.path.getsize(output_file))
+    write_checkpoint(output_file, checkpoint)
+
+    return r1_r2, stats
@@ -0,0 +1,130 @@
+"""
+Logging for the fluorelax library and command line programs.
+
+The library modules log to the "fluorelax" logger hierarchy and do not
+configure any handlers, so by default only warnings are shown. The command
+line programs call setup_logging(), which logs to stderr (or a file) as text
+or as one JSON object per line, e.g. for monitoring cluster jobs.
+
+During Calc_FH_Dists runs, Progress logs the frames processed, frames/s and
+the ETA every progress_interval seconds at the INFO level. When INFO is not
+enabled (the library default) no progress is tracked at all.
+"""
+
+import datetime
+import json
+import logging
+import sys
+import time
+
+logger = logging.getLogger(__name__.rpartition(".")[0])
+
+# seconds between progress messages
+progress_interval = 10.
+
+# attributes of every LogRecord, anything else was passed as extra fields
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+class JSON_Formatter(logging.Formatter):
+    """
+    One JSON object per record: time, level, logger, message and any
+    extra fields, e.g. logger.info("...", extra={"frames_per_s" : 10.}).
+    """
+
+    def format(self, record):
+        entry = {"time" : datetime.datetime.fromtimestamp(record.created).isoformat(),
+                 "level" : record.levelname,
+                 "logger" : record.name,
+                 "message" : record.getMessage()}
+        entry.update({key : value for key, value in vars(record).items()
+                      if key not in _RECORD_ATTRS})
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def setup_logging(level="INFO", fmt="text", filename=None, interval=None):
+    """
+    Configure the fluorelax logger for a command line program.
+
+    Parameters
+    ----------
+    level : str
+        Lowest level logged: 'DEBUG', 'INFO', 'WARNING' or 'ERROR'.
+    fmt : str
+        'text' or 'json' (one JSON object per line).
+    filename : str
+        Log to this file instead of stderr.
+    interval : float
+        Seconds between progress messages, default progress_interval.
+    """
+    global progress_interval
+    if interval is not None:
+        progress_interval = interval
+
+    handler = logging.StreamHandler(sys.stderr) if filename is None \
+              else logging.FileHandler(filename)
+    if fmt == "json":
+        handler.setFormatter(JSON_Formatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+
+    # replace the handlers of an earlier call, e.g. main() run twice in-process
+    for old_handler in list(logger.handlers):
+        if not isinstance(old_handler, logging.NullHandler):
+            logger.removeHandler(old_handler)
+            old_handler.close()
+    logger.addHandler(handler)
+    logger.setLevel(level)
+
+
+class Progress:
+    """
+    Periodic progress messages of a frame loop: frames processed,
+    frames/s and the estimated time left.
+    """
+
+    def __init__(self, total, log=logger, interval=None, label="frames"):
+        """
+        Parameters
+        ----------
+        total : int
+            Number of frames (or other units) of the loop.
+        log : logging.Logger
+            Logger of the messages, at the INFO level.
+        interval : float
+            Seconds between messages, default progress_interval.
+        label : str
+            Name of the units in the messages.
+        """
+        self.total = total
+        self.log = log
+        self.interval = progress_interval if interval is None else interval
+        self.label = label
+        self.n_done = 0
+        self.start = self.last = time.perf_counter()
+
+    @classmethod
+    def get(cls, total, log=logger, **kwargs):
+        """
+        A Progress, or None when the INFO level is not enabled for log.
+        """
+        return cls(total, log, **kwargs) if log.isEnabledFor(logging.INFO) else None
+
+    def update(self, n=1):
+        self.n_done += n
+        now = time.perf_counter()
+        if now - self.last >= self.interval or self.n_done >= self.total:
+            self.last = now
+            self.report(now)
+
+    def report(self, now=None):
+        elapsed = (time.perf_counter() if now is None else now) - self.start
+        rate = self.n_done / elapsed if elapsed > 0 else 0.
+        eta = (self.total - self.n_done) / rate if rate > 0 else None
+        eta_text = "?" if eta is None else str(datetime.timedelta(seconds=round(eta)))
+        self.log.info(f"{self.n_done}/{self.total} {self.label}, {rate:.1f} {self.label}/s, "
+                      f"ETA {eta_text}",
+                      extra={"n_done" : self.n_done, "total" : self.total,
+                             "per_s" : rate, "eta_s" : eta})
@@ -5,7 +5,8 @@ import matplotlib.cm as cm
 from matplotlib.colors import Normalize
 
 import matplotlib.gridspec as gridspec
-import scipy.stats
+
+from .relax_io import load_r1_r2, Relax_Data
 
 # TODO: multiple plot types: line plot with dist, just dist, maybe just line?
 # also have option for horizontal
@@ -16,26 +17,46 @@ class Plot_Relaxation:
     """
     # any class attributes?
 
-    def __init__(self, data, plot_type, data_from_file=False):
+    def __init__(self, data, plot_type, data_from_file=False, data_format=None):
         """
         Parameters
         ----------
-        data : ndarray
+        data : ndarray or str
             Array of dataset to load. Cols : Frame, R1, R2.
         plot_type : str
             Plot output, options are 'plot', 'dist'.
         data_from_file : bool
-            When True, load the data arg as a filepath.
+            When True, load the data arg as a filepath (tsv, npz or hdf5).
+            Binary files are read lazily, only the plotted columns are loaded,
+            and stay open until close() (or the end of a with block).
+        data_format : str
+            Format of the data file, by default from its extension,
+            see relax_io.get_format().
         """ 
         if data_from_file is True:
-            self.data = np.genfromtxt(data)
+            self.data = load_r1_r2(data, fmt=data_format)
         else:
             self.data = data
+        # kept to close the file after self.data is replaced in pre_processing()
+        self._store = self.data if isinstance(self.data, Relax_Data) else None
         self.fig, self.ax = plt.subplots()
         self.plot_type = plot_type
         self.cmap = cm.Dark2 # TODO: add as arg?
         self.norm = Normalize(vmin=0, vmax=3)
 
+    def close(self):
+        """
+        Close the npz or hdf5 file of the data, if it was loaded from one.
+        """
+        if self._store is not None:
+            self._store.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
     def pre_processing(self, time_units=10**6):
         """
         Processes raw time series data to appropriate units of time.
@@ -69,6 +90,9 @@ class Plot_Relaxation:
         """
         Plot just the distribution of R1 or R2 values.
         """
+        # only needed for the kde, scipy is slow to import
+        import scipy.stats
+
         ax = self.ax
         # secondary kde distribution plot
         grid = np.arange(self.ylim[0], self.ylim[1], .01, dtype=float)
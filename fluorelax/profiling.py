@@ -0,0 +1,154 @@
+"""
+Per-stage timing and memory instrumentation of the pipeline.
+
+run_pipeline(profiler=Profiler()) records the wall time, the frames and
+frames/s, and the peak RSS of the process after each stage (e.g. trajectory
+loading, the F-H search, the output), plus a per-frame latency histogram of
+the F-H search (frame reading included). A disabled Profiler (the default)
+records nothing: its stages are a no-op context and the per-frame timing of
+Calc_FH_Dists is off.
+
+Usage: fluorelax -c prod.nc -p w4f.prmtop --sys w4f --profile --profile_json profile.json
+"""
+
+import json
+import sys
+import time
+from contextlib import contextmanager, nullcontext
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows
+    resource = None
+
+
+def get_peak_rss():
+    """
+    Peak resident set size of this process so far in MB, None if unknown.
+    Worker processes of a parallel run are not included.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kB on Linux, bytes on macOS
+    return peak / 1024**2 if sys.platform == "darwin" else peak / 1024
+
+
+class Profiler:
+    """
+    Wall time, frames and peak RSS of each named pipeline stage, in order,
+    and per-frame latencies of the frame by frame stages.
+    """
+    # per-frame latency histogram bins, log spaced in seconds
+    latency_bins = np.logspace(-6, 1, 29)
+
+    def __init__(self, enabled=True):
+        """
+        Parameters
+        ----------
+        enabled : bool
+            Record the stages, default True. A disabled profiler records
+            nothing and adds no per-frame timing.
+        """
+        self.enabled = enabled
+        self.stages = {}
+
+    def stage(self, name, n_frames=None):
+        """
+        Context manager timing a stage, e.g. `with profiler.stage("load"):`.
+        The frames can also be set later with add_frames().
+        """
+        if not self.enabled:
+            return nullcontext()
+        return self._stage(name, n_frames)
+
+    @contextmanager
+    def _stage(self, name, n_frames):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            stage = self.stages.setdefault(name, {"time" : 0., "n_frames" : None,
+                                                  "frame_times" : None})
+            stage["time"] += time.perf_counter() - start
+            stage["peak_rss"] = get_peak_rss()
+            if n_frames is not None:
+                self.add_frames(name, n_frames)
+
+    def add_frames(self, name, n_frames, frame_times=None):
+        """
+        Number of frames (and optionally the per-frame latencies in seconds)
+        processed in a recorded stage.
+        """
+        if not self.enabled:
+            return
+        stage = self.stages[name]
+        stage["n_frames"] = (stage["n_frames"] or 0) + int(n_frames)
+        if frame_times is not None:
+            frame_times = np.asarray(frame_times, dtype=float)
+            if stage["frame_times"] is not None:
+                frame_times = np.concatenate([stage["frame_times"], frame_times])
+            stage["frame_times"] = frame_times
+
+    def to_dict(self):
+        """
+        JSON serializable report: per stage time (s), n_frames, frames_per_s,
+        peak_rss (MB), and for the per-frame latencies, their percentiles (s)
+        and a histogram (counts of the latency_bins edges).
+        """
+        report = {"stages" : {}, "peak_rss" : get_peak_rss()}
+        for name, stage in self.stages.items():
+            entry = {"time" : stage["time"], "n_frames" : stage["n_frames"],
+                     "frames_per_s" : None, "peak_rss" : stage.get("peak_rss")}
+            if stage["n_frames"] and stage["time"] > 0:
+                entry["frames_per_s"] = stage["n_frames"] / stage["time"]
+            frame_times = stage["frame_times"]
+            if frame_times is not None and len(frame_times):
+                percentiles = np.percentile(frame_times, [50, 90, 99, 100])
+                counts, _ = np.histogram(np.clip(frame_times, self.latency_bins[0],
+                                                 self.latency_bins[-1]),
+                                         bins=self.latency_bins)
+                entry["latency"] = {"p50" : percentiles[0], "p90" : percentiles[1],
+                                    "p99" : percentiles[2], "max" : percentiles[3],
+                                    "bins" : self.latency_bins.tolist(),
+                                    "counts" : counts.tolist()}
+            report["stages"][name] = entry
+        return report
+
+    def save_json(self, filename):
+        with open(filename, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def summary(self):
+        """
+        Human readable table of the stages and the latency histograms.
+        """
+        report = self.to_dict()
+        total = sum(stage["time"] for stage in report["stages"].values())
+        lines = [f"{'stage':<16} {'time (s)':>10} {'%':>6} {'frames':>8} {'frames/s':>10} "
+                 f"{'peak RSS (MB)':>14}"]
+        for name, stage in report["stages"].items():
+            frames = "" if stage["n_frames"] is None else stage["n_frames"]
+            rate = "" if stage["frames_per_s"] is None else f"{stage['frames_per_s']:.1f}"
+            rss = "" if stage["peak_rss"] is None else f"{stage['peak_rss']:.1f}"
+            share = 100 * stage["time"] / total if total > 0 else 0
+            lines.append(f"{name:<16} {stage['time']:>10.3f} {share:>6.1f} {frames:>8} "
+                         f"{rate:>10} {rss:>14}")
+
+        for name, stage in report["stages"].items():
+            latency = stage.get("latency")
+            if latency is None:
+                continue
+            lines.append(f"\n{name} per-frame latency (ms): p50={latency['p50'] * 1e3:.3f} "
+                         f"p90={latency['p90'] * 1e3:.3f} p99={latency['p99'] * 1e3:.3f} "
+                         f"max={latency['max'] * 1e3:.3f}")
+            counts = np.array(latency["counts"])
+            scale = 40 / counts.max()
+            for low, high, count in zip(latency["bins"][:-1], latency["bins"][1:], counts):
+                if count:
+                    lines.append(f"  {low * 1e3:>9.3f} - {high * 1e3:<9.3f} {count:>7} "
+                                 f"{'#' * max(1, int(count * scale))}")
+        return "\n".join(lines)
@@ -0,0 +1,202 @@
+"""
+Save and load per-frame R1 and R2 data.
+
+Besides the plain tsv output, results can be saved as compressed binary
+columnar files (npz or hdf5) with the calculation metadata (tc, magnet, CSA,
+cutoff, ...) stored alongside. Binary files are loaded lazily: each column is
+only read from disk when it is first accessed. Neither is memory-mapped: an npz
+column is decompressed in full on first access and then kept, while hdf5
+datasets are chunked, so row slices only read the chunks they need. Use hdf5
+for large runs.
+"""
+
+import json
+
+import numpy as np
+
+FORMATS = ("tsv", "npz", "hdf5")
+
+
+def get_format(filename, fmt=None):
+    """
+    Output format from the fmt argument or else from the file extension.
+
+    Parameters
+    ----------
+    filename : str
+    fmt : str
+        One of 'tsv', 'npz', 'hdf5'. Default None, inferred from filename
+        ('.npz', '.h5' or '.hdf5'), otherwise 'tsv'.
+    """
+    if fmt is None:
+        if filename.endswith(".npz"):
+            fmt = "npz"
+        elif filename.endswith((".h5", ".hdf5")):
+            fmt = "hdf5"
+        else:
+            fmt = "tsv"
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format '{fmt}', options are: {', '.join(FORMATS)}.")
+    return fmt
+
+
+def get_column_names(n_columns):
+    """
+    Names of the frame, R1, R2 (, R1, R2 ...) columns.
+    The R1 and R2 columns of each additional 19F are numbered, e.g. R1_1, R2_1.
+    """
+    names = ["frame"]
+    for num in range((n_columns - 1) // 2):
+        suffix = "" if num == 0 else f"_{num}"
+        names += [f"R1{suffix}", f"R2{suffix}"]
+    return names
+
+
+def _import_h5py():
+    try:
+        import h5py
+    except ImportError:
+        raise ImportError("The hdf5 format requires the h5py package: pip install h5py")
+    return h5py
+
+
+def save_r1_r2(filename, r1_r2, metadata=None, fmt=None):
+    """
+    Save per-frame R1 and R2 data.
+
+    Parameters
+    ----------
+    filename : str
+    r1_r2 : ndarray
+        Array of size frames x (1 + 2 * n_fluorine) columns (frame, R1, R2, ...).
+    metadata : dict
+        JSON serializable calculation parameters, e.g. tc, magnet, CSA tensor
+        and cutoff. Not stored in the tsv format.
+    fmt : str
+        One of 'tsv', 'npz', 'hdf5', see get_format().
+    """
+    fmt = get_format(filename, fmt)
+    r1_r2 = np.asarray(r1_r2)
+    columns = get_column_names(r1_r2.shape[1])
+    metadata = {} if metadata is None else metadata
+
+    if fmt == "tsv":
+        np.savetxt(filename, r1_r2, delimiter="\t")
+
+    elif fmt == "npz":
+        # through a file object, or numpy appends .npz to the filename
+        with open(filename, "wb") as f:
+            np.savez_compressed(f, __metadata__=json.dumps(metadata),
+                                **{name : r1_r2[:, num] for num, name in enumerate(columns)})
+
+    elif fmt == "hdf5":
+        h5py = _import_h5py()
+        with h5py.File(filename, "w") as f:
+            f.attrs["metadata"] = json.dumps(metadata)
+            f.attrs["columns"] = columns
+            for num, name in enumerate(columns):
+                f.create_dataset(name, data=r1_r2[:, num], compression="gzip",
+                                 chunks=True)
+
+
+def load_r1_r2(filename, fmt=None):
+    """
+    Load per-frame R1 and R2 data.
+
+    Parameters
+    ----------
+    filename : str
+    fmt : str
+        One of 'tsv', 'npz', 'hdf5', see get_format().
+
+    Returns
+    -------
+    data : ndarray or Relax_Data
+        The tsv format is read into an ndarray, binary formats into
+        a lazily loaded Relax_Data with the same 2D column indexing,
+        which keeps the file open until it is closed, e.g.
+        `with load_r1_r2("r1_r2.npz") as data:`.
+    """
+    fmt = get_format(filename, fmt)
+
+    if fmt == "tsv":
+        return np.genfromtxt(filename)
+
+    elif fmt == "npz":
+        # NpzFile only reads and decompresses a column when it is accessed,
+        # compressed members cannot be memory-mapped (mmap_mode is ignored)
+        npz = np.load(filename)
+        columns = [name for name in npz.files if name != "__metadata__"]
+        return Relax_Data(npz, columns, json.loads(str(npz["__metadata__"])))
+
+    elif fmt == "hdf5":
+        h5py = _import_h5py()
+        # datasets are only read from disk when sliced
+        h5 = h5py.File(filename, "r")
+        return Relax_Data(h5, list(h5.attrs["columns"]), json.loads(h5.attrs["metadata"]))
+
+
+class Relax_Data:
+    """
+    Lazily loaded columnar R1 and R2 data.
+    Supports the 2D indexing used on the tsv arrays, e.g. data[:, 1] or
+    data[:, 1:], reading only the requested columns (and rows for hdf5).
+    The file stays open until close(), or the end of a with block.
+    """
+
+    def __init__(self, store, columns, metadata):
+        """
+        Parameters
+        ----------
+        store : NpzFile or h5py File
+            Mapping of column name to column data.
+        columns : list of str
+            Column names in order (frame, R1, R2, ...).
+        metadata : dict
+            Calculation parameters saved with the data.
+        """
+        self.store = store
+        self.columns = columns
+        self.metadata = metadata
+        self._cache = {}
+
+    def column(self, name, rows=slice(None)):
+        """
+        Rows of a single column, by name.
+        """
+        # NpzFile reads the whole member on every access, so keep it after the first
+        if isinstance(self.store, np.lib.npyio.NpzFile):
+            if name not in self._cache:
+                self._cache[name] = self.store[name]
+            return self._cache[name][rows]
+        return self.store[name][rows]
+
+    @property
+    def shape(self):
+        return (len(self.store[self.columns[0]]), len(self.columns))
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        rows, cols = key if isinstance(key, tuple) else (key, slice(None))
+        if isinstance(cols, (int, np.integer)):
+            return self.column(self.columns[cols], rows)
+        names = np.array(self.columns)[cols]
+        return np.column_stack([self.column(name, rows) for name in names])
+
+    def __array__(self, dtype=None, copy=None):
+        return np.asarray(self[:, :], dtype=dtype)
+
+    def close(self):
+        """
+        Close the npz or hdf5 file, the columns can no longer be read.
+        """
+        self._cache.clear()
+        self.store.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,232 @@
+"""
+Segment mode for production runs split over many trajectory files.
+
+Each segment file is analyzed on its own, in parallel across processes, and
+its per-frame R1 and R2 are saved with a checkpoint in a work directory
+('{work_dir}/segment_XXXX.npz' and '.npz.ckpt.json'). The frame offset of
+each segment in the concatenated trajectory is kept, so the segments are
+stitched back into one continuous series with the same frames (and values)
+as one Universe over all the files. Segments with a matching checkpoint are
+skipped, so a rerun after an interruption, or with more segments added to
+the end, only processes the rest.
+"""
+
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from .incremental import read_checkpoint, write_checkpoint
+
+CHECKPOINT_VERSION = 1
+
+logger = logging.getLogger(__name__)
+
+
+def get_segments(parm, crd):
+    """
+    Frame offset, number of frames, first frame time and dt of each segment.
+    The topology is only read once, the segments are then opened in turn.
+
+    Parameters
+    ----------
+    parm : str
+        The MD parameter file or pdb file.
+    crd : list of str
+        The trajectory segment files, in order.
+
+    Returns
+    -------
+    segments : list of dict
+        With the keys crd, frame_offset, n_frames, time and dt.
+    """
+    import MDAnalysis as mda
+
+    universe = mda.Universe(parm, crd[0])
+    segments = []
+    frame_offset = 0
+    for filename in crd:
+        universe.load_new(filename)
+        trajectory = universe.trajectory
+        segments.append({"crd" : os.path.abspath(filename), "frame_offset" : frame_offset,
+                         "n_frames" : int(trajectory.n_frames),
+                         "time" : float(trajectory[0].time), "dt" : float(trajectory.dt)})
+        frame_offset += trajectory.n_frames
+    return segments
+
+
+def get_local_frames(segment, start, stop, step):
+    """
+    The frames of one segment that are in the global range(start, stop, step)
+    of the concatenated trajectory, as a local (start, stop, step) slice.
+    """
+    offset, n_frames = segment["frame_offset"], segment["n_frames"]
+    first = max(start, offset)
+    # next frame of the global stride
+    first += -(first - start) % step
+    return first - offset, max(first, min(stop, offset + n_frames)) - offset, step
+
+
+def calc_segment(parm, segment, output_file, checkpoint, calc_relax, dist=3, chunk_size=1000,
+                 include_water=False, skin=None, tail_r6=None):
+    """
+    Calculate the per-frame R1 and R2 of one segment, with the frame column
+    of the concatenated trajectory, and save them and their checkpoint.
+
+    Parameters
+    ----------
+    parm : str
+        The MD parameter file or pdb file.
+    segment : dict
+        See get_segments().
+    output_file : str
+        The npz file of the segment's frame, R1, R2 columns.
+    checkpoint : dict
+        Written next to output_file once it is complete, see run_segments().
+    calc_relax : Relaxation_Kernel
+    dist, chunk_size, include_water, skin, tail_r6
+        As in Calc_FH_Dists and run_chunked().
+
+    Returns
+    -------
+    output_file : str
+    """
+    # only imported in the workers that run the trajectory analysis
+    import MDAnalysis as mda
+    from .calc_fh_dists import Calc_FH_Dists
+    from .relax_io import save_r1_r2
+
+    fh_dist_base = Calc_FH_Dists(mda.Universe(parm, segment["crd"]), dist=dist,
+                                 calc_relax=calc_relax, include_water=include_water,
+                                 skin=skin, tail_r6=tail_r6, sum_only=True)
+    start, stop, step = checkpoint["frames"]
+    r1_r2 = fh_dist_base.run_chunked(chunk_size=chunk_size, start=start, stop=stop,
+                                     step=step).r1_r2
+    r1_r2[:, 0] += segment["frame_offset"]
+
+    save_r1_r2(output_file, r1_r2, metadata=segment, fmt="npz")
+    write_checkpoint(output_file, checkpoint)
+    return output_file
+
+
+def run_segments(parm, crd, work_dir, system=None, csa=None, tc=8.2e-9, magnet=14.1, dist=3,
+                 step=1, start=None, stop=None, begin_ps=None, end_ps=None, chunk_size=1000,
+                 n_workers=1, include_water=False, skin=None, tail_correction=False,
+                 output_file=None, output_format=None, stats=None):
+    """
+    Analyze each trajectory segment separately in a process pool, skipping
+    the segments already done, and stitch the results in frame order.
+
+    Parameters
+    ----------
+    parm : str
+        The MD parameter file or pdb file.
+    crd : list of str
+        The trajectory segment files, in order.
+    work_dir : str
+        Directory of the per-segment results and checkpoints.
+    system, csa, tc, magnet, dist, step, start, stop, begin_ps, end_ps
+        As in run_pipeline(), the frames are selected over the concatenated
+        trajectory.
+    chunk_size : int
+        Number of frames held in memory at a time in each worker.
+    n_workers : int
+        Number of segments analyzed concurrently.
+    include_water, skin, tail_correction
+        As in run_pipeline(), the tail correction is sampled over all segments.
+    output_file : str
+        Optional file to save the stitched per-frame data to.
+    output_format : str
+        Format of the output_file, see save_r1_r2().
+    stats : Running_Stats
+        Optional running statistics updated with the stitched R1 and R2.
+
+    Returns
+    -------
+    r1_r2 : ndarray
+        Array of size frames x 3 columns (frame, R1, R2), with 2 more
+        columns for each additional 19F, frames of the concatenated trajectory.
+    """
+    import numpy as np
+    from .cache import _file_signature
+    from .calc_relax import get_relaxation_kernel, CSA_TENSORS
+    from .calc_fh_dists import get_frame_range, check_frame_range
+    from .relax_io import load_r1_r2, save_r1_r2
+    from .log import Progress
+
+    if csa is None:
+        if system not in CSA_TENSORS:
+            raise ValueError(f"No CSA tensor for system '{system}', options are: "
+                             f"{', '.join(CSA_TENSORS)}. Otherwise pass csa.")
+        csa = CSA_TENSORS[system]
+    crd = [crd] if isinstance(crd, str) else list(crd)
+    os.makedirs(work_dir, exist_ok=True)
+
+    segments = get_segments(parm, crd)
+    n_frames = segments[-1]["frame_offset"] + segments[-1]["n_frames"]
+    # a time window from the first frame time and dt, as for one Universe,
+    # checked against the frames of all segments below
+    if begin_ps is not None or end_ps is not None:
+        import MDAnalysis as mda
+        start, stop, step = get_frame_range(mda.Universe(parm, crd[0]).trajectory, start,
+                                            stop, step, begin_ps, end_ps, validate=False)
+    check_frame_range(n_frames, start, stop, step)
+    start, stop, step = slice(start, stop, step).indices(n_frames)
+
+    tail_r6 = None
+    if tail_correction:
+        import MDAnalysis as mda
+        from .tail_correction import calc_tail_r6
+        tail_r6 = calc_tail_r6(mda.Universe(parm, crd), dist, include_water=include_water,
+                               skin=skin, start=start, stop=stop, step=step)
+
+    calc_relax = get_relaxation_kernel(tc, magnet, *csa)
+    params = {"tc" : tc, "magnet" : magnet, "csa" : list(csa), "dist" : dist,
+              "include_water" : include_water,
+              "tail_r6" : None if tail_r6 is None else tail_r6.tolist()}
+
+    output_files = []
+    todo = []
+    for num, segment in enumerate(segments):
+        segment_file = os.path.join(work_dir, f"segment_{num:04d}.npz")
+        output_files.append(segment_file)
+        checkpoint = {"version" : CHECKPOINT_VERSION, "parm" : _file_signature(parm),
+                      "crd" : _file_signature(segment["crd"]),
+                      "frame_offset" : segment["frame_offset"], "params" : params,
+                      "frames" : list(get_local_frames(segment, start, stop, step))}
+        # the checkpoint is only written once the segment output is complete
+        if read_checkpoint(segment_file) == checkpoint and os.path.exists(segment_file):
+            logger.debug("Skipping %s, already done", segment["crd"])
+        else:
+            todo.append((segment, segment_file, checkpoint))
+    logger.info("%d of %d segments to process", len(todo), len(segments))
+
+    progress = Progress.get(len(todo), logger, label="segments")
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        futures = [executor.submit(calc_segment, parm, segment, segment_file, checkpoint,
+                                   calc_relax, dist=dist, chunk_size=chunk_size,
+                                   include_water=include_water, skin=skin, tail_r6=tail_r6)
+                   for segment, segment_file, checkpoint in todo]
+        for future in as_completed(futures):
+            logger.debug("Finished %s", future.result())
+            if progress is not None:
+                progress.update()
+
+    r1_r2 = []
+    for segment_file in output_files:
+        with load_r1_r2(segment_file) as data:
+            r1_r2.append(np.asarray(data))
+        # in order, in chunks of frames as when streaming, for the convergence trace
+        if stats is not None:
+            stats.update_blocks(r1_r2[-1][:, 1:], chunk_size)
+    r1_r2 = np.concatenate(r1_r2)
+
+    if output_file is not None:
+        metadata = {"tc" : tc, "magnet" : magnet, "system" : system,
+                    "sigma11" : csa[0], "sigma22" : csa[1], "sigma33" : csa[2],
+                    "dist" : dist, "start" : start, "stop" : stop, "step" : step,
+                    "include_water" : include_water, "tail_r6" : params["tail_r6"],
+                    "segments" : segments}
+        save_r1_r2(output_file, r1_r2, metadata=metadata, fmt=output_format)
+        logger.info("Saved the R1 and R2 of %d frames to %s", len(r1_r2), output_file)
+
+    return r1_r2
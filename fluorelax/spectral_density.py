@@ -0,0 +1,174 @@
+"""
+Spectral density models J(w) for the relaxation calc.
+
+Each model takes its parameters as floats or arrays and J(w) broadcasts over
+them, so one model instance can hold many frames, sites or parameter sets
+(e.g. an (n_sites,) array of order parameters) and is evaluated without
+Python loops. J(w) is in sec, e.g. tc / (1 + w^2 tc^2) for a rigid rotor.
+
+Any of these can be passed to Calc_19F_Relaxation(spectral_density=...),
+the default is the isotropic Rigid_Rotor.
+"""
+
+import abc
+
+import numpy as np
+
+
+def lorentzian(omega, tau):
+    """
+    tau / (1 + w^2 tau^2), the spectral density of a single exponential TCF.
+    """
+    return tau / (1 + (omega * tau)**2)
+
+
+class Spectral_Density(abc.ABC):
+    """
+    Common interface of the spectral density models: calc_j(omega) or
+    calling the model returns J(omega) broadcast over the model parameters.
+    Models must implement calc_j.
+    """
+
+    @abc.abstractmethod
+    def calc_j(self, omega):
+        """
+        Spectral density at omega.
+
+        Parameters
+        ----------
+        omega : float or ndarray
+            Frequency in rad/sec, broadcast against the model parameters.
+
+        Returns
+        -------
+        J : float or ndarray
+            Spectral density in sec.
+        """
+
+    def __call__(self, omega):
+        return self.calc_j(omega)
+
+
+class Rigid_Rotor(Spectral_Density):
+    """
+    Isotropic tumbling of a rigid molecule: J(w) = tc / (1 + w^2 tc^2).
+    """
+
+    def __init__(self, tc):
+        """
+        Parameters
+        ----------
+        tc : float or ndarray
+            Rotational coorelation time (sec).
+        """
+        self.tc = np.asarray(tc, dtype=float)
+
+    def calc_j(self, omega):
+        return lorentzian(omega, self.tc)
+
+
+class Lipari_Szabo(Spectral_Density):
+    """
+    Lipari-Szabo model-free spectral density, isotropic tumbling with one
+    fast internal motion:
+    J(w) = S^2 tc / (1 + w^2 tc^2) + (1 - S^2) t / (1 + w^2 t^2),
+    with 1 / t = 1 / tc + 1 / te.
+    """
+
+    def __init__(self, tc, s2, te):
+        """
+        Parameters
+        ----------
+        tc : float or ndarray
+            Rotational coorelation time (sec) of the overall tumbling.
+        s2 : float or ndarray
+            Generalized order parameter S^2 of the internal motion.
+        te : float or ndarray
+            Effective correlation time (sec) of the internal motion.
+        """
+        self.tc = np.asarray(tc, dtype=float)
+        self.s2 = np.asarray(s2, dtype=float)
+        self.te = np.asarray(te, dtype=float)
+
+    def calc_j(self, omega):
+        tau = 1 / (1 / self.tc + 1 / self.te)
+        return self.s2 * lorentzian(omega, self.tc) + (1 - self.s2) * lorentzian(omega, tau)
+
+
+class Extended_Model_Free(Spectral_Density):
+    """
+    Extended model-free spectral density (Clore et al. 1990), isotropic
+    tumbling with fast and slow internal motions, S^2 = S2f * S2s:
+    J(w) = S^2 tc / (1 + w^2 tc^2) + (1 - S2f) tf' / (1 + w^2 tf'^2)
+           + (S2f - S^2) ts' / (1 + w^2 ts'^2),
+    with 1 / t' = 1 / tc + 1 / t for the fast and slow times.
+    """
+
+    def __init__(self, tc, s2f, s2s, tf, ts):
+        """
+        Parameters
+        ----------
+        tc : float or ndarray
+            Rotational coorelation time (sec) of the overall tumbling.
+        s2f, s2s : float or ndarray
+            Order parameters of the fast and slow internal motions.
+        tf, ts : float or ndarray
+            Correlation times (sec) of the fast and slow internal motions.
+        """
+        self.tc = np.asarray(tc, dtype=float)
+        self.s2f = np.asarray(s2f, dtype=float)
+        self.s2s = np.asarray(s2s, dtype=float)
+        self.tf = np.asarray(tf, dtype=float)
+        self.ts = np.asarray(ts, dtype=float)
+
+    def calc_j(self, omega):
+        s2 = self.s2f * self.s2s
+        tau_f = 1 / (1 / self.tc + 1 / self.tf)
+        tau_s = 1 / (1 / self.tc + 1 / self.ts)
+        return (s2 * lorentzian(omega, self.tc)
+                + (1 - self.s2f) * lorentzian(omega, tau_f)
+                + (self.s2f - s2) * lorentzian(omega, tau_s))
+
+
+class Anisotropic_Diffusion(Spectral_Density):
+    """
+    Rigid axially symmetric rotational diffusion (Woessner 1962):
+    J(w) = sum_k A_k t_k / (1 + w^2 t_k^2), with
+    t_0 = 1 / 6D_perp, t_1 = 1 / (5D_perp + D_par), t_2 = 1 / (2D_perp + 4D_par),
+    A_0 = (3 cos^2 a - 1)^2 / 4, A_1 = 3 sin^2 a cos^2 a, A_2 = 3/4 sin^4 a,
+    where a is the angle between the interaction vector and the diffusion axis.
+    """
+
+    def __init__(self, d_par, d_perp, theta):
+        """
+        Parameters
+        ----------
+        d_par : float or ndarray
+            Rotational diffusion coefficient (rad^2/sec) about the unique axis.
+        d_perp : float or ndarray
+            Rotational diffusion coefficient (rad^2/sec) perpendicular to it.
+        theta : float or ndarray
+            Angle (rad) of the F-H (or C-F for the CSA) vector to the unique axis.
+        """
+        self.d_par = np.asarray(d_par, dtype=float)
+        self.d_perp = np.asarray(d_perp, dtype=float)
+        self.theta = np.asarray(theta, dtype=float)
+
+    @classmethod
+    def from_tc(cls, tc, anisotropy, theta):
+        """
+        Build from the isotropic tc = 1 / 6D_iso and D_par / D_perp,
+        with D_iso = (D_par + 2D_perp) / 3.
+        """
+        d_iso = 1 / (6 * np.asarray(tc, dtype=float))
+        d_perp = 3 * d_iso / (anisotropy + 2)
+        return cls(anisotropy * d_perp, d_perp, theta)
+
+    def calc_j(self, omega):
+        cos2 = np.cos(self.theta)**2
+        sin2 = 1 - cos2
+        taus = (1 / (6 * self.d_perp),
+                1 / (5 * self.d_perp + self.d_par),
+                1 / (2 * self.d_perp + 4 * self.d_par))
+        amps = ((3 * cos2 - 1)**2 / 4, 3 * sin2 * cos2, 3 / 4 * sin2**2)
+        return sum(amp * lorentzian(omega, tau) for amp, tau in zip(amps, taus))
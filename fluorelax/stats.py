@@ -0,0 +1,196 @@
+"""
+Running statistics of per-frame R1 and R2 data.
+
+Frames of an MD trajectory are correlated, so the naive standard error of
+the mean (stdev / sqrt(n)) is too small. Running_Stats also keeps the
+block averages of Flyvbjerg & Petersen (1989) on the fly: level k holds the
+means of blocks of 2^k frames, and the standard error of the block means
+grows with k until the blocks are longer than the correlation time, where
+it plateaus at the correlated standard error.
+"""
+
+import numpy as np
+
+
+class Running_Stats:
+    """
+    Mean and variance of each column, updated batch by batch (e.g. per chunk
+    of frames) without keeping the data, with the Welford / Chan et al.
+    pairwise update, which stays accurate for long trajectories.
+    With blocking, the block averaging levels are updated as well, and each
+    update adds the cumulative averages so far to a convergence trace.
+    """
+    # only levels with at least this many blocks are used for the block sem
+    min_blocks = 16
+    # default number of convergence trace rows of update_blocks()
+    trace_points = 100
+
+    def __init__(self, n=0, mean=None, m2=None, blocking=True, levels=None, trace=None):
+        """
+        Parameters
+        ----------
+        n : int
+            Number of rows seen so far.
+        mean : ndarray
+            Mean of each column.
+        m2 : ndarray
+            Sum of squared differences from the mean of each column.
+        blocking : bool
+            Keep the block averaging levels and the convergence trace.
+        levels : list of dict
+            Block averaging state, see to_dict().
+        trace : list of list
+            Convergence trace rows, see trace_columns().
+        """
+        self.n = n
+        self.mean = None if mean is None else np.asarray(mean, dtype=float)
+        self.m2 = None if m2 is None else np.asarray(m2, dtype=float)
+        self.blocking = blocking
+        # level k: Running_Stats of the 2^(k+1) frame block means, and the
+        # last unpaired block mean of level k - 1 (None when there is none)
+        self.levels = []
+        self.carries = []
+        for level in levels or []:
+            self.levels.append(Running_Stats(level["n"], level["mean"], level["m2"],
+                                             blocking=False))
+            carry = level["carry"]
+            self.carries.append(None if carry is None else np.asarray(carry, dtype=float))
+        self.trace = [] if trace is None else [list(row) for row in trace]
+
+    def _update_moments(self, data):
+        n_batch = len(data)
+        batch_mean = data.mean(axis=0)
+        batch_m2 = ((data - batch_mean)**2).sum(axis=0)
+
+        if self.n == 0:
+            self.mean, self.m2 = batch_mean, batch_m2
+        else:
+            n_total = self.n + n_batch
+            delta = batch_mean - self.mean
+            self.mean = self.mean + delta * n_batch / n_total
+            self.m2 = self.m2 + batch_m2 + delta**2 * self.n * n_batch / n_total
+        self.n += n_batch
+
+    def _update_blocks(self, data):
+        """
+        Pair up the rows (with the unpaired row left from the last update)
+        into the block means of the next level, for every level.
+        """
+        level = 0
+        while len(data) > 0:
+            if level == len(self.levels):
+                self.levels.append(Running_Stats(blocking=False))
+                self.carries.append(None)
+            if self.carries[level] is not None:
+                data = np.vstack([self.carries[level], data])
+            n_pairs = len(data) // 2
+            self.carries[level] = data[-1] if len(data) % 2 else None
+            data = (data[0:2 * n_pairs:2] + data[1:2 * n_pairs:2]) / 2
+            if n_pairs:
+                self.levels[level].update(data)
+            level += 1
+
+    def update(self, data):
+        """
+        Add a batch of rows.
+
+        Parameters
+        ----------
+        data : ndarray
+            (n_rows x n_columns) array.
+        """
+        data = np.asarray(data, dtype=float)
+        if len(data) == 0:
+            return self
+        self._update_moments(data)
+        if self.blocking:
+            self._update_blocks(data)
+            self.trace.append([self.n] + self.mean.tolist() + self.sem.tolist())
+        return self
+
+    def update_blocks(self, data, block_size=None):
+        """
+        Add the rows of an array already in memory block by block, as when
+        streaming chunks of frames, with a convergence trace row per block.
+
+        Parameters
+        ----------
+        data : ndarray
+            (n_rows x n_columns) array.
+        block_size : int
+            Rows per block, default about n_rows / trace_points.
+        """
+        if block_size is None:
+            block_size = max(1, -(-len(data) // self.trace_points))
+        for start in range(0, len(data), block_size):
+            self.update(data[start:start + block_size])
+        return self
+
+    @property
+    def variance(self):
+        """
+        Sample variance (ddof=1) of each column, 0 for a single row.
+        """
+        return self.m2 / (self.n - 1) if self.n > 1 else np.zeros_like(self.m2)
+
+    @property
+    def stdev(self):
+        return np.sqrt(self.variance)
+
+    @property
+    def naive_sem(self):
+        """
+        Standard error of the mean assuming uncorrelated rows.
+        """
+        return self.stdev / np.sqrt(max(self.n, 1))
+
+    @property
+    def block_sems(self):
+        """
+        Standard error of the mean estimated at each blocking level,
+        (n_levels x n_columns), starting with the unblocked rows.
+        Only levels with at least 2 blocks are included.
+        """
+        sems = [self.naive_sem]
+        for level in self.levels:
+            if level.n > 1:
+                sems.append(level.naive_sem)
+        return np.array(sems)
+
+    @property
+    def sem(self):
+        """
+        Standard error of the mean corrected for correlation: the largest
+        block sem of the levels with at least min_blocks blocks.
+        """
+        if not self.blocking:
+            return self.naive_sem
+        sems = [self.naive_sem] + [level.naive_sem for level in self.levels
+                                   if level.n >= self.min_blocks]
+        return np.max(sems, axis=0)
+
+    def trace_columns(self, names):
+        """
+        Column names of the convergence trace for the data column names,
+        e.g. ["R1", "R2"]: n, the cumulative mean and then sem of each column.
+        """
+        return ["n"] + list(names) + [f"{name}_sem" for name in names]
+
+    def to_dict(self):
+        """
+        JSON serializable state, e.g. for a checkpoint.
+        """
+        return {"n" : self.n,
+                "mean" : None if self.mean is None else self.mean.tolist(),
+                "m2" : None if self.m2 is None else self.m2.tolist(),
+                "blocking" : self.blocking,
+                "levels" : [dict(level.to_dict(),
+                                 carry=None if carry is None else carry.tolist())
+                            for level, carry in zip(self.levels, self.carries)],
+                "trace" : self.trace}
+
+    @classmethod
+    def from_dict(cls, state):
+        return cls(state["n"], state["mean"], state["m2"],
+                   blocking=state.get("blocking", True),
+                   levels=state.get("levels"), trace=state.get("trace"))
@@ -0,0 +1,327 @@
+"""
+Parameter sweep mode: R1 and R2 over a grid of systems (CSA tensors), tc
+values and magnet strengths from a single pass over the trajectory.
+
+The dd rates only depend on the trajectory through the per-frame sum of
+r^-6 of each fluorine, so that is calculated once, and the whole grid is
+then one broadcast of the relaxation constants against it. The time
+averaged rates only need the mean sum of r^-6, the per-frame rates are
+optional since the cube grows with the trajectory length.
+
+Usage: fluorelax-sweep -c prod.nc -p w4f.prmtop --sys w4f w5f --tc 6e-9 8.2e-9
+       --magnet 11.7 14.1 18.8 23.5 -o sweep.npz
+"""
+
+import json
+
+from .command_line import create_sweep_arguments, handle_command_line
+
+
+def calc_sum_r6(parm, crd, dist=3, step=1, chunk_size=1000, cache=None, **kwargs):
+    """
+    Stream the trajectory and collect the per-frame sum of r^-6 of each fluorine.
+    Without a cache only these sums are kept (Calc_FH_Dists sum_only), with
+    one the F-H pair table is built (or read) so later sweeps can reuse it.
+
+    Parameters
+    ----------
+    parm : str
+        The MD parameter file or pdb file.
+    crd : str or list of str
+        The MD trajectory file(s) or coordinate file(s).
+    dist : int
+        The distance to calculate F-H distances within, default 3 Angstroms.
+    step : int
+        Step size of the frames being analyzed.
+    chunk_size : int
+        Number of frames held in memory at a time.
+    cache : FH_Dist_Cache
+        Optional on-disk cache of the F-H pair table.
+    **kwargs
+        Passed on to get_fh_table(), e.g. start, stop, include_water, skin,
+        n_workers and backend.
+
+    Returns
+    -------
+    frames : ndarray
+        (n_frames) frame indices.
+    sum_r6 : ndarray
+        (n_frames x n_fluorine) array, r in Angstroms.
+    """
+    import numpy as np
+    from .cache import get_fh_table
+    from .calc_fh_dists import Calc_FH_Dists, calc_frame_sum_r6, check_frame_range
+
+    if cache is None:
+        import MDAnalysis as mda
+        start, stop = kwargs.pop("start", None), kwargs.pop("stop", None)
+        fh_dist_base = Calc_FH_Dists(mda.Universe(parm, crd), dist=dist, sum_only=True,
+                                     include_water=kwargs.pop("include_water", False),
+                                     skin=kwargs.pop("skin", None))
+        check_frame_range(fh_dist_base._trajectory.n_frames, start, stop, step)
+        frames, sum_r6 = [], []
+        for chunk in fh_dist_base.iter_chunks(chunk_size, start=start, stop=stop, step=step,
+                                              **kwargs):
+            frames.append(np.asarray(chunk.frames))
+            sum_r6.append(chunk.calc_sum_r6())
+        return np.concatenate(frames), np.concatenate(sum_r6)
+
+    table = get_fh_table(parm, crd, dist=dist, step=step, chunk_size=chunk_size,
+                         cache=cache, **kwargs)
+    return table["frames"], calc_frame_sum_r6(table["n_pairs"], table["fluorine_index"],
+                                              table["distances"], table["n_fluorine"])
+
+
+def calc_sweep(sum_r6, tc, magnet, systems=None, csa=None, frames=None, per_frame=False):
+    """
+    R1 and R2 of every (system, tc, magnet) combination in one broadcast.
+
+    Parameters
+    ----------
+    sum_r6 : ndarray
+        (n_frames x n_fluorine) sum of r^-6 of each fluorine, see calc_sum_r6().
+    tc : list of float
+        Rotational coorelation times (sec).
+    magnet : list of float
+        Magnetic induction values in Tesla.
+    systems : list of str
+        Systems with CSA definitions, see CSA_TENSORS. Default all of them.
+    csa : dict
+        CSA tensors {label : (sigma11, sigma22, sigma33)} in ppm, overrides systems.
+    frames : ndarray
+        Frame labels of the sum_r6 rows, default 0 to n_frames.
+    per_frame : bool
+        Keep the rate of each frame instead of the time average.
+
+    Returns
+    -------
+    sweep : Relax_Sweep
+        Dims (system, tc, magnet, fluorine), with frame before fluorine
+        when per_frame.
+    """
+    import numpy as np
+    from .calc_relax import Calc_19F_Relaxation, CSA_TENSORS
+
+    if csa is None:
+        systems = list(CSA_TENSORS) if systems is None else list(systems)
+        unknown = [system for system in systems if system not in CSA_TENSORS]
+        if unknown:
+            raise ValueError(f"No CSA tensor for system(s) {', '.join(unknown)}, "
+                             f"options are: {', '.join(CSA_TENSORS)}. Otherwise pass csa.")
+        csa = {system : CSA_TENSORS[system] for system in systems}
+
+    sum_r6 = np.asarray(sum_r6, dtype=float)
+    if frames is None:
+        frames = np.arange(len(sum_r6))
+    tc = np.asarray(tc, dtype=float)
+    magnet = np.asarray(magnet, dtype=float)
+    # system x tc x magnet grid of the relaxation constants
+    sigmas = np.array(list(csa.values()), dtype=float).reshape(-1, 1, 1, 3)
+    kernel = Calc_19F_Relaxation(tc.reshape(1, -1, 1), magnet.reshape(1, 1, -1),
+                                 sigmas[..., 0], sigmas[..., 1], sigmas[..., 2]).kernel
+
+    coords = {"system" : list(csa), "tc" : tc, "magnet" : magnet}
+    if per_frame:
+        coords["frame"] = np.asarray(frames)
+        grid_r6 = sum_r6
+    else:
+        # the dd rates are linear in sum(r^-6), so their time average is the
+        # rate of the time averaged sum(r^-6)
+        grid_r6 = sum_r6.mean(axis=0)
+    coords["fluorine"] = np.arange(sum_r6.shape[1])
+
+    # (system, tc, magnet, 1 ...) constants against the ([frame,] fluorine) sums
+    expand = (...,) + (None,) * grid_r6.ndim
+    r1 = kernel.r1_dd[expand] * grid_r6 + kernel.r1_csa[expand]
+    r2 = kernel.r2_dd[expand] * grid_r6 + kernel.r2_csa[expand]
+    return Relax_Sweep(r1, r2, coords)
+
+
+class Relax_Sweep:
+    """
+    Labeled R1 and R2 cubes of a parameter sweep.
+    The axes are named in dims and labeled by the coords of each dim.
+    """
+
+    def __init__(self, r1, r2, coords, metadata=None):
+        """
+        Parameters
+        ----------
+        r1, r2 : ndarray
+            Rates with one axis per coords entry.
+        coords : dict
+            Labels of each axis in order, {dim : values}.
+        metadata : dict
+            JSON serializable calculation parameters saved with the cube.
+        """
+        self.r1 = r1
+        self.r2 = r2
+        self.coords = dict(coords)
+        self.dims = list(self.coords)
+        self.metadata = {} if metadata is None else metadata
+
+    def sel(self, **labels):
+        """
+        R1 and R2 at the given labels, e.g. sel(system="w4f", magnet=14.1).
+        Selected dims are dropped, the others are kept whole.
+
+        Returns
+        -------
+        R1 : ndarray
+        R2 : ndarray
+        """
+        import numpy as np
+        index = []
+        for dim in self.dims:
+            if dim in labels:
+                label = labels.pop(dim)
+                matches = np.flatnonzero(np.asarray(self.coords[dim]) == label)
+                if len(matches) == 0:
+                    raise KeyError(f"No {dim} label {label} in the sweep.")
+                index.append(matches[0])
+            else:
+                index.append(slice(None))
+        if labels:
+            raise KeyError(f"Unknown dims {', '.join(labels)}, the dims are: "
+                           f"{', '.join(self.dims)}.")
+        return self.r1[tuple(index)], self.r2[tuple(index)]
+
+    def to_table(self):
+        """
+        Long format table with one row per grid point: the index of each
+        dim, then R1 and R2.
+        """
+        import numpy as np
+        index = np.indices(self.r1.shape).reshape(len(self.dims), -1).T
+        return np.column_stack([index, self.r1.ravel(), self.r2.ravel()])
+
+    def save(self, filename, fmt=None):
+        """
+        Save the cube with its labels and metadata as npz or hdf5, or as a
+        long format tsv table (labels in the header), see relax_io.get_format().
+        """
+        import numpy as np
+        from .relax_io import get_format, _import_h5py
+
+        fmt = get_format(filename, fmt)
+        header = {"dims" : self.dims, "metadata" : self.metadata,
+                  "coords" : {dim : np.asarray(values).tolist()
+                              for dim, values in self.coords.items()}}
+
+        if fmt == "tsv":
+            np.savetxt(filename, self.to_table(), delimiter="\t",
+                       header=json.dumps(header) + "\n" + "\t".join(self.dims + ["R1", "R2"]))
+
+        elif fmt == "npz":
+            # through a file object, or numpy appends .npz to the filename
+            with open(filename, "wb") as f:
+                np.savez_compressed(f, r1=self.r1, r2=self.r2, __header__=json.dumps(header))
+
+        elif fmt == "hdf5":
+            h5py = _import_h5py()
+            with h5py.File(filename, "w") as f:
+                f.attrs["header"] = json.dumps(header)
+                f.create_dataset("r1", data=self.r1, compression="gzip")
+                f.create_dataset("r2", data=self.r2, compression="gzip")
+
+    @classmethod
+    def load(cls, filename, fmt=None):
+        """
+        Load a cube saved with save().
+        """
+        import numpy as np
+        from .relax_io import get_format, _import_h5py
+
+        fmt = get_format(filename, fmt)
+        if fmt == "tsv":
+            with open(filename) as f:
+                header = json.loads(f.readline()[2:])
+            table = np.loadtxt(filename, ndmin=2)
+            shape = [len(header["coords"][dim]) for dim in header["dims"]]
+            r1 = table[:, -2].reshape(shape)
+            r2 = table[:, -1].reshape(shape)
+
+        elif fmt == "npz":
+            with np.load(filename) as npz:
+                header = json.loads(str(npz["__header__"]))
+                r1, r2 = npz["r1"], npz["r2"]
+
+        elif fmt == "hdf5":
+            h5py = _import_h5py()
+            with h5py.File(filename, "r") as f:
+                header = json.loads(f.attrs["header"])
+                r1, r2 = f["r1"][()], f["r2"][()]
+
+        coords = {dim : header["coords"][dim] for dim in header["dims"]}
+        return cls(r1, r2, coords, header["metadata"])
+
+
+def run_sweep(parm, crd, tc, magnet, systems=None, dist=3, step=1, chunk_size=1000,
+              n_workers=1, per_frame=False, output_file=None, output_format=None,
+              cache_dir=None, cache_size=None, include_water=False, start=None, stop=None,
+              begin_ps=None, end_ps=None, skin=None):
+    """
+    One pass over the trajectory, then the R1 and R2 of the whole
+    (system, tc, magnet) grid, see calc_sum_r6() and calc_sweep().
+    With cache_dir, the F-H pair table is cached on disk (see cache.py)
+    and later sweeps of the same trajectory skip it entirely.
+    The frames are selected with start, stop and step, or with the time
+    window begin_ps to end_ps, see get_frame_range().
+
+    Returns
+    -------
+    sweep : Relax_Sweep
+    """
+    backend = "serial" if n_workers == 1 else "multiprocessing"
+    cache = None
+    if cache_dir is not None:
+        from .cache import FH_Dist_Cache, DEFAULT_CACHE_SIZE
+        cache = FH_Dist_Cache(cache_dir, cache_size or DEFAULT_CACHE_SIZE)
+    if any(value is not None for value in (start, stop, begin_ps, end_ps)) or step != 1:
+        import MDAnalysis as mda
+        from .calc_fh_dists import get_frame_range
+        start, stop, step = get_frame_range(mda.Universe(parm, crd).trajectory, start, stop,
+                                            step, begin_ps, end_ps)
+    frames, sum_r6 = calc_sum_r6(parm, crd, dist=dist, step=step, chunk_size=chunk_size,
+                                 cache=cache, include_water=include_water, skin=skin,
+                                 start=start, stop=stop,
+                                 n_workers=n_workers, backend=backend)
+    sweep = calc_sweep(sum_r6, tc, magnet, systems=systems, frames=frames,
+                       per_frame=per_frame)
+    sweep.metadata = {"dist" : dist, "start" : start, "stop" : stop, "step" : step,
+                      "n_frames" : len(frames),
+                      "include_water" : include_water}
+
+    if output_file is not None:
+        sweep.save(output_file, output_format)
+    return sweep
+
+
+def main(argv=None):
+    """
+    Command line entry point of the `fluorelax-sweep` console script.
+    """
+    args = handle_command_line(create_sweep_arguments(), argv)
+    from .log import setup_logging
+    setup_logging(args.log_level, args.log_format, args.log_file, args.progress_interval)
+    sweep = run_sweep(args.parm, args.crd, args.tc, args.magnet, systems=args.systems,
+                      step=args.step_size, chunk_size=args.chunk_size,
+                      n_workers=args.n_workers, per_frame=args.per_frame,
+                      output_file=args.output_file, output_format=args.output_format,
+                      cache_dir=args.cache_dir, cache_size=args.cache_size,
+                      start=args.start, stop=args.stop, begin_ps=args.begin_ps,
+                      end_ps=args.end_ps, dist=args.dist, include_water=args.include_water,
+                      skin=args.skin)
+
+    # time averaged rates of the first fluorine
+    for system in sweep.coords["system"]:
+        for tc in sweep.coords["tc"]:
+            for magnet in sweep.coords["magnet"]:
+                r1, r2 = sweep.sel(system=system, tc=tc, magnet=magnet)
+                if args.per_frame:
+                    r1, r2 = r1.mean(axis=0), r2.mean(axis=0)
+                print(f"{system}\ttc={tc}\tmagnet={magnet}\tR1-AVG={r1[0]}\tR2-AVG={r2[0]}")
+
+
+if __name__ == "__main__":
+    main()
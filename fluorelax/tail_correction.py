@@ -0,0 +1,188 @@
+"""
+Long-range r^-6 tail correction of the truncated F-H dipolar sums.
+
+The dd rates are linear in the sum of r^-6 over all protons, but
+Calc_FH_Dists only sums the protons within its cutoff (3 Angstroms by
+default). The protons beyond the cutoff add
+
+    sum_{r > rc} r^-6 = integral_rc^inf 4 pi r^2 rho g(r) r^-6 dr
+
+to each fluorine, with rho the proton number density and g(r) the F-H
+radial distribution function. Calc_FH_RDF samples g(r) (binned, along
+with the exact sum of r^-6 of each bin) out to r_max from a subset of
+frames, and beyond r_max g(r) = 1 gives the analytic 4 pi rho / (3 r_max^3).
+The per-frame search then only needs a small cutoff, and the time averaged
+tail of the protons beyond it is added to every frame as a constant.
+
+The correction is a mean field: the averaged R1 and R2 are corrected, but
+the frame to frame fluctuations of the far protons are not.
+"""
+
+import numpy as np
+from MDAnalysis.analysis.results import ResultsGroup
+
+from .calc_fh_dists import Calc_FH_Dists, check_frame_range
+
+
+def calc_analytic_tail(cutoff, density):
+    """
+    Sum of r^-6 beyond cutoff for a uniform proton density, g(r) = 1:
+    4 pi rho / (3 rc^3).
+
+    Parameters
+    ----------
+    cutoff : float or ndarray
+        Cutoff distance in Angstroms.
+    density : float
+        Proton number density in Angstroms^-3.
+
+    Returns
+    -------
+    tail_r6 : float or ndarray
+        In Angstroms^-6.
+    """
+    return 4 * np.pi * density / (3 * np.asarray(cutoff, dtype=float)**3)
+
+
+# subclass of Calc_FH_Dists, for the same selections and periodic search
+class Calc_FH_RDF(Calc_FH_Dists):
+    """
+    Histogram of the F-H distances of each fluorine out to r_max: the pair
+    counts and the sum of r^-6 of each bin, summed over the frames analyzed,
+    and the mean proton density of the periodic box. Only the histograms
+    are kept, not the pairs, so long cutoffs stay cheap in memory.
+    """
+
+    def __init__(self, atomgroup, verbose=False, r_max=10, bin_width=0.05, include_water=False,
+                 skin=None):
+        """
+        Parameters
+        ----------
+        atomgroup : mda Universe
+            Universe object from atom selection.
+        verbose : bool
+            Whether to show the progress bar or not.
+        r_max : float
+            Largest F-H distance sampled, default 10 Angstroms.
+        bin_width : float
+            Width of the distance bins in Angstroms, default 0.05.
+        include_water : bool
+            Include the water hydrogens as protons, default False.
+        skin : float
+            Verlet neighbor list skin in Angstroms, see Calc_FH_Dists.
+        """
+        super(Calc_FH_RDF, self).__init__(atomgroup, verbose=verbose, dist=r_max,
+                                          include_water=include_water, skin=skin)
+        self.r_max = r_max
+        self.bin_width = bin_width
+        self.n_bins = int(np.ceil(r_max / bin_width))
+        self.edges = np.arange(self.n_bins + 1) * bin_width
+
+    def _prepare(self):
+        self.results.clear()
+        self.results.counts = np.zeros((len(self.fluorine), self.n_bins))
+        self.results.sum_r6 = np.zeros((len(self.fluorine), self.n_bins))
+        self.results.n_samples = 0
+        self.results.sum_density = 0.
+        self.results.n_rebuilds = 0
+        self._reference = None
+        self._neighbors = None
+
+    def _single_frame(self):
+        pairs, fh_dists = self._find_fh_pairs(self._ts)
+        bins = np.minimum((fh_dists / self.bin_width).astype(int), self.n_bins - 1)
+        index = pairs[:, 0] * self.n_bins + bins
+        size = len(self.fluorine) * self.n_bins
+        self.results.counts += np.bincount(index, minlength=size).reshape(-1, self.n_bins)
+        self.results.sum_r6 += np.bincount(index, weights=fh_dists**-6.0,
+                                           minlength=size).reshape(-1, self.n_bins)
+        self.results.n_samples += 1
+        if self._ts.dimensions is not None:
+            self.results.sum_density += len(self.protons) / self._ts.volume
+
+    def _get_aggregator(self):
+        return ResultsGroup(lookup={"counts" : ResultsGroup.ndarray_sum,
+                                    "sum_r6" : ResultsGroup.ndarray_sum,
+                                    "n_samples" : ResultsGroup.ndarray_sum,
+                                    "sum_density" : ResultsGroup.ndarray_sum,
+                                    "n_rebuilds" : ResultsGroup.ndarray_sum})
+
+    def _conclude(self):
+        # mean proton number density, None without a periodic box
+        self.results.density = None
+        if self.results.sum_density > 0:
+            self.results.density = self.results.sum_density / self.results.n_samples
+
+    @property
+    def rdf(self):
+        """
+        g(r) of each fluorine at the bin centers, (n_fluorine x n_bins).
+        Needs a periodic box for the proton density.
+        """
+        if self.results.density is None:
+            raise ValueError("The RDF needs a periodic box for the proton density.")
+        shell_volume = 4 / 3 * np.pi * np.diff(self.edges**3)
+        return self.results.counts / (self.results.n_samples * self.results.density
+                                      * shell_volume)
+
+    def calc_tail_r6(self, cutoff):
+        """
+        Time averaged sum of r^-6 of the protons beyond cutoff, for each
+        fluorine: the sampled bins beyond cutoff (the bin containing the
+        cutoff is split linearly) plus the analytic tail beyond r_max when
+        there is a periodic box.
+
+        Parameters
+        ----------
+        cutoff : float
+            Cutoff distance of the truncated sums in Angstroms.
+
+        Returns
+        -------
+        tail_r6 : ndarray
+            (n_fluorine) array in Angstroms^-6.
+        """
+        mean_r6 = self.results.sum_r6 / self.results.n_samples
+        # fraction of each bin beyond the cutoff
+        above = np.clip((self.edges[1:] - cutoff) / self.bin_width, 0, 1)
+        tail_r6 = mean_r6 @ above
+        if self.results.density is not None:
+            tail_r6 = tail_r6 + calc_analytic_tail(max(cutoff, self.r_max), self.results.density)
+        return tail_r6
+
+
+def calc_tail_r6(universe, cutoff=3, r_max=10, n_samples=50, include_water=False, skin=None,
+                 start=None, stop=None, step=None, **kwargs):
+    """
+    The r^-6 tail correction of each fluorine for sums truncated at cutoff,
+    from Calc_FH_RDF over n_samples frames evenly spread over the frames
+    analyzed.
+
+    Parameters
+    ----------
+    universe : mda Universe
+    cutoff : float
+        Cutoff distance of the truncated sums in Angstroms.
+    r_max : float
+        Largest F-H distance sampled, beyond it g(r) = 1.
+    n_samples : int
+        Number of frames sampled for the RDF.
+    include_water : bool
+        Include the water hydrogens as protons, default False.
+    skin : float
+        Verlet neighbor list skin in Angstroms, see Calc_FH_Dists.
+    start, stop, step : int
+        Frame slice of the trajectory analyzed, as in run().
+    **kwargs
+        Passed on to run(), e.g. n_workers and backend.
+
+    Returns
+    -------
+    tail_r6 : ndarray
+        (n_fluorine) array in Angstroms^-6, added to the per-frame sums.
+    """
+    check_frame_range(universe.trajectory.n_frames, start, stop, step)
+    frames = np.arange(universe.trajectory.n_frames)[start:stop:step]
+    frames = frames[np.unique(np.linspace(0, len(frames) - 1, n_samples).astype(int))]
+    rdf = Calc_FH_RDF(universe, r_max=r_max, include_water=include_water, skin=skin)
+    return rdf.run(frames=frames, **kwargs).calc_tail_r6(cutoff)
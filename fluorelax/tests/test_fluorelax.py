@@ -8,6 +8,32 @@ import pytest
 
 import numpy as np
 import sys
+import os
+import json
+import subprocess
+
+import MDAnalysis as mda
+from MDAnalysis.analysis import distances
+from MDAnalysis.coordinates.memory import MemoryReader
+from MDAnalysis.lib.distances import apply_PBC
+from fluorelax.calc_fh_dists import Calc_FH_Dists
+from fluorelax import ensemble
+from fluorelax import relax_io
+from fluorelax import calc_tcf
+from fluorelax.calc_relax import calc_csa_params, calc_csa_constant
+from fluorelax import sweep
+from fluorelax import cache
+from fluorelax import incremental
+from fluorelax import segments
+from fluorelax import tail_correction
+from fluorelax import profiling
+from fluorelax import log
+from fluorelax.stats import Running_Stats
+
+# example 4F-Trp CypA simulation data shipped with the package
+data_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data")
+parm = os.path.join(data_dir, "3k0n_w4f_dry.prmtop")
+crd = os.path.join(data_dir, "3k0n_w4f_frame_198ns_dry.nc")
 
 # look at file coverage for testing
 # pytest -v --cov=fluorelax
@@ -64,3 +90,1018 @@ class Test_Calc_19F_Relaxation():
         expected_r2 = 111.8102
         assert pytest.approx((expected_r1, expected_r2), rel=1e-3) == (calculated_r1, calculated_r2)
 
+class Test_Calc_19F_Relaxation_Array():
+    """
+    Test the vectorized relaxation methods against the per-distance methods.
+    """
+
+    magnet = 14.0911
+    tc = 8.2e-9
+    sgm11 = 11.2
+    sgm22 = -48.3
+    sgm33 = -112.8
+
+    # 3 frames of zero and NaN padded distances
+    fh_dists = np.array([[2.3, 2.8, 0],
+                         [2.5, np.nan, 0],
+                         [0, 0, 0]])
+
+    calc_relax = fluorelax.Calc_19F_Relaxation(tc, magnet, sgm11, sgm22, sgm33)
+
+    def loop_r1_r2(self, dists):
+        r1 = self.calc_relax.calc_csa_r1()
+        r2 = self.calc_relax.calc_csa_r2()
+        for fh_dist in dists:
+            if fh_dist == 0 or np.isnan(fh_dist):
+                continue
+            single = fluorelax.Calc_19F_Relaxation(self.tc, self.magnet, self.sgm11,
+                                                   self.sgm22, self.sgm33, fh_dist)
+            r1 += single.calc_dd_r1()
+            r2 += single.calc_dd_r2()
+        return r1, r2
+
+    def test_calc_r1_r2_array(self):
+        calculated_r1, calculated_r2 = self.calc_relax.calc_r1_r2_array(self.fh_dists)
+        expected = np.array([self.loop_r1_r2(dists) for dists in self.fh_dists])
+        np.testing.assert_allclose(calculated_r1, expected[:, 0], rtol=1e-12)
+        np.testing.assert_allclose(calculated_r2, expected[:, 1], rtol=1e-12)
+
+    def test_calc_r1_r2_array_mask(self):
+        mask = np.array([[True, False, False]] * 3)
+        dists = np.full((3, 3), 2.3)
+        calculated_r1, calculated_r2 = self.calc_relax.calc_r1_r2_array(dists, mask=mask)
+        expected_r1, expected_r2 = self.loop_r1_r2([2.3])
+        np.testing.assert_allclose(calculated_r1, expected_r1, rtol=1e-12)
+        np.testing.assert_allclose(calculated_r2, expected_r2, rtol=1e-12)
+
+class Test_Spectral_Density():
+    """
+    Test the spectral density models, their limits and batched evaluation.
+    """
+
+    tc = 8.2e-9
+    params = (14.0911, 11.2, -48.3, -112.8)
+    omega = np.array([0, 3.5e8, 3.8e9, 7.3e9])
+
+    def test_rigid_rotor_default(self):
+        default = fluorelax.Calc_19F_Relaxation(self.tc, *self.params, fh_dist=2.3)
+        rigid = fluorelax.Calc_19F_Relaxation(self.tc, *self.params, fh_dist=2.3,
+                                              spectral_density=fluorelax.Rigid_Rotor(self.tc))
+        assert default.calc_overall_r1_r2() == pytest.approx(rigid.calc_overall_r1_r2())
+
+    def test_model_free_limits(self):
+        rigid = fluorelax.Rigid_Rotor(self.tc)(self.omega)
+        # no internal motion
+        np.testing.assert_allclose(fluorelax.Lipari_Szabo(self.tc, 1, 50e-12)(self.omega), rigid)
+        np.testing.assert_allclose(fluorelax.Extended_Model_Free(
+            self.tc, 1, 1, 50e-12, 2e-9)(self.omega), rigid)
+        np.testing.assert_allclose(fluorelax.Anisotropic_Diffusion.from_tc(
+            self.tc, 1, 0.7)(self.omega), rigid)
+        # S2s = 1 reduces the extended model-free to Lipari-Szabo
+        np.testing.assert_allclose(
+            fluorelax.Extended_Model_Free(self.tc, 0.8, 1, 50e-12, 2e-9)(self.omega),
+            fluorelax.Lipari_Szabo(self.tc, 0.8, 50e-12)(self.omega))
+
+    def test_abstract_model(self):
+        from fluorelax.spectral_density import Spectral_Density
+
+        class No_J(Spectral_Density):
+            pass
+        # fails when created, not on the first evaluation
+        with pytest.raises(TypeError):
+            No_J()
+
+    def test_batched_sites(self):
+        # one S^2 and te per site, evaluated at once and against a loop of single sites
+        s2 = np.linspace(0.3, 1, 5)
+        te = np.linspace(10e-12, 500e-12, 5)
+        fh_dists = np.array([[2.3, 2.6, 3.1, 2.4, 2.9]] * 4)
+        batched = fluorelax.Calc_19F_Relaxation(
+            self.tc, *self.params, spectral_density=fluorelax.Lipari_Szabo(self.tc, s2, te))
+        r1, r2 = batched.kernel.calc_r1_r2_from_r6(fh_dists**-6)
+        assert r1.shape == (4, 5)
+
+        for site in range(5):
+            single = fluorelax.Calc_19F_Relaxation(
+                self.tc, *self.params, fh_dist=fh_dists[0, site],
+                spectral_density=fluorelax.Lipari_Szabo(self.tc, s2[site], te[site]))
+            np.testing.assert_allclose([r1[0, site], r2[0, site]],
+                                       single.calc_overall_r1_r2(), rtol=1e-12)
+
+class Test_Relaxation_Kernel():
+    """
+    Test the precomputed relaxation kernel and its parameter cache.
+    """
+
+    fh_dist = 2.3
+    params = (8.2e-9, 14.0911, 11.2, -48.3, -112.8)
+
+    def test_kernel_dd(self):
+        kernel = fluorelax.get_relaxation_kernel(*self.params)
+        calc_relax = fluorelax.Calc_19F_Relaxation(*self.params, self.fh_dist)
+        dists = np.array([self.fh_dist, 0])
+        np.testing.assert_allclose(kernel.calc_dd_r1(dists), [calc_relax.calc_dd_r1(), 0])
+        np.testing.assert_allclose(kernel.calc_dd_r2(dists), [calc_relax.calc_dd_r2(), 0])
+        np.testing.assert_allclose(kernel.calc_r1_r2_from_r6(self.fh_dist**-6),
+                                   calc_relax.calc_overall_r1_r2())
+
+    def test_kernel_cache(self):
+        kernel = fluorelax.get_relaxation_kernel(*self.params)
+        assert fluorelax.get_relaxation_kernel(*self.params) is kernel
+        assert fluorelax.get_relaxation_kernel(9e-9, *self.params[1:]) is not kernel
+
+class Test_Calc_FH_Dists():
+    """
+    Test the F-H distance analysis on the example 4F-Trp trajectory.
+    """
+
+    calc_relax = fluorelax.Calc_19F_Relaxation(8.2e-9, 14.1, 11.2, -48.3, -112.8)
+
+    def test_run_chunked(self):
+        traj = mda.Universe(parm, crd)
+        r1_r2 = Calc_FH_Dists(traj).run(step=2).calc_r1_r2(self.calc_relax)
+
+        # chunk size that does not divide the number of frames
+        chunked = Calc_FH_Dists(traj).run_chunked(self.calc_relax, chunk_size=7, step=2)
+        np.testing.assert_array_equal(chunked.r1_r2[:, 0], np.arange(0, 101, 2))
+        np.testing.assert_allclose(chunked.r1_r2, r1_r2)
+
+    def test_calc_r1_r2_without_calc_relax(self):
+        fh_dists = Calc_FH_Dists(mda.Universe(parm, crd)).run(stop=5)
+        with pytest.raises(ValueError, match="calc_relax"):
+            fh_dists.calc_r1_r2()
+
+    def test_fh_pairs_match_around_selection(self):
+        traj = mda.Universe(parm, crd)
+        fh_dists = Calc_FH_Dists(traj).run(stop=5)
+        for num, ts in enumerate(traj.trajectory[:5]):
+            # previous per-frame selection based path
+            protons = traj.select_atoms("around 3 name F*").select_atoms("name H*")
+            expected = distances.distance_array(fh_dists.fluorine.positions, protons.positions,
+                                                box=ts.dimensions)[0]
+            frame_pairs = slice(fh_dists.results.indptr[num], fh_dists.results.indptr[num + 1])
+            np.testing.assert_allclose(fh_dists.results.distances[frame_pairs], expected, rtol=1e-5)
+            np.testing.assert_array_equal(
+                fh_dists.protons[fh_dists.results.proton_index[frame_pairs]].ix, protons.ix)
+
+    def test_multiple_fluorine(self):
+        # 2 fluorines with 2 and 1 protons within 3A, 1 proton out of range
+        universe = mda.Universe.empty(6, trajectory=True)
+        universe.add_TopologyAttr("names", ["F1", "H1", "H2", "F2", "H3", "H4"])
+        universe.atoms.positions = [[0, 0, 0], [1, 0, 0], [0, 2, 0],
+                                    [10, 0, 0], [10, 0, 2.5], [10, 5, 0]]
+        fh_dists = Calc_FH_Dists(universe).run()
+
+        np.testing.assert_array_equal(fh_dists.results.indptr, [0, 3])
+        np.testing.assert_array_equal(fh_dists.results.fluorine_index, [0, 0, 1])
+        np.testing.assert_array_equal(fh_dists.results.proton_index, [0, 1, 2])
+        np.testing.assert_allclose(fh_dists.results.distances, [1, 2, 2.5], rtol=1e-6)
+        np.testing.assert_allclose(fh_dists.calc_sum_r6(), [[1 + 2**-6, 2.5**-6]], rtol=1e-5)
+
+        r1_r2 = fh_dists.calc_r1_r2(self.calc_relax)
+        r1, r2 = self.calc_relax.calc_r1_r2_array([[1, 2], [2.5, 0]])
+        np.testing.assert_allclose(r1_r2, [[0, r1[0], r2[0], r1[1], r2[1]]], rtol=1e-5)
+
+    def solvated_universe(self):
+        # fluorine at the box edge, a protein proton and a water across the boundary
+        u = mda.Universe.empty(4, n_residues=2, atom_resindex=[0, 0, 1, 1], trajectory=True)
+        u.add_TopologyAttr("names", ["FZ", "HZ", "H1", "OW"])
+        u.add_TopologyAttr("resnames", ["TRP", "WAT"])
+        u.atoms.positions = [[0.5, 50, 50], [98.5, 50, 50], [0.5, 48, 50], [0.5, 47, 50]]
+        u.dimensions = [100, 100, 100, 90, 90, 90]
+        return u
+
+    def test_minimum_image(self):
+        fh_dists = Calc_FH_Dists(self.solvated_universe()).run()
+        np.testing.assert_allclose(fh_dists.results.distances, [2], rtol=1e-5)
+
+    def test_include_water(self):
+        fh_dists = Calc_FH_Dists(self.solvated_universe(), include_water=True).run()
+        assert fh_dists.protons.names.tolist() == ["HZ", "H1"]
+        np.testing.assert_allclose(fh_dists.results.distances, [2, 2], rtol=1e-5)
+
+    @pytest.mark.parametrize("angles", [[90, 90, 90], [70, 80, 100]])
+    def test_periodic_search_matches_capped_distance(self, angles):
+        # fluorine images (orthorhombic) and capped_distance (triclinic) paths
+        rng = np.random.default_rng(2)
+        u = mda.Universe.empty(2000, trajectory=True)
+        u.add_TopologyAttr("names", ["FZ"] * 20 + ["HZ"] * 1980)
+        u.atoms.positions = rng.uniform(-20, 40, (2000, 3))
+        u.dimensions = [20, 17, 23] + angles
+        fh_dists = Calc_FH_Dists(u).run()
+
+        pairs, expected = distances.capped_distance(fh_dists.fluorine.positions,
+                                                    fh_dists.protons.positions, 3,
+                                                    box=u.dimensions)
+        order = np.lexsort((pairs[:, 1], pairs[:, 0]))
+        np.testing.assert_array_equal(fh_dists.results.proton_index, pairs[order, 1])
+        np.testing.assert_allclose(fh_dists.results.distances, expected[order], rtol=1e-5)
+
+    @pytest.mark.parametrize("angles", [[90, 90, 90], [70, 80, 100]])
+    def test_skin_matches_full_search(self, angles):
+        # random walk across the periodic boundaries, the neighbor list is rebuilt a few times
+        rng = np.random.default_rng(3)
+        u = mda.Universe.empty(2000, trajectory=False)
+        u.add_TopologyAttr("names", ["FZ"] * 20 + ["HZ"] * 1980)
+        coords = rng.uniform(0, 20, (2000, 3)) + np.cumsum(rng.normal(scale=0.05, size=(50, 2000, 3)),
+                                                           axis=0)
+        box = np.array([20, 20, 20] + angles, dtype=np.float32)
+        coords = np.array([apply_PBC(frame.astype(np.float32), box) for frame in coords])
+        u.load_new(coords, format=MemoryReader, dimensions=box)
+
+        full = Calc_FH_Dists(u).run().get_table()
+        skin = Calc_FH_Dists(u, skin=1.5).run()
+        assert 1 < skin.results.n_rebuilds < 50
+        for key, value in skin.get_table().items():
+            np.testing.assert_array_equal(value, full[key])
+
+    def test_skin_tracks_fluorine_and_protons(self):
+        # only a heavy atom moves, so the neighbor list is built once
+        u = mda.Universe.empty(3, trajectory=False)
+        u.add_TopologyAttr("names", ["FZ", "HZ", "OZ"])
+        coords = np.tile(np.array([[0, 0, 0], [2, 0, 0], [5, 5, 5]], dtype=np.float32), (10, 1, 1))
+        coords[:, 2] += np.arange(10, dtype=np.float32)[:, None]
+        u.load_new(coords, format=MemoryReader)
+        fh_dists = Calc_FH_Dists(u, skin=1).run()
+        assert fh_dists.results.n_rebuilds == 1
+        np.testing.assert_array_equal(fh_dists.results.n_pairs, 1)
+
+    @pytest.mark.parametrize("n_workers", [1, 2])
+    def test_sum_only(self, n_workers):
+        traj = mda.Universe(parm, crd)
+        full = Calc_FH_Dists(traj).run(step=3)
+        sums = Calc_FH_Dists(traj, sum_only=True, calc_relax=self.calc_relax).run(
+               step=3, n_workers=n_workers, backend="multiprocessing")
+        assert sums.results.sum_r6.shape == (34, 1)
+        assert "distances" not in sums.results
+        np.testing.assert_allclose(sums.calc_sum_r6(), full.calc_sum_r6())
+        np.testing.assert_array_equal(sums.results.n_pairs, full.results.n_pairs)
+        np.testing.assert_allclose(sums.calc_r1_r2(), full.calc_r1_r2(self.calc_relax))
+        with pytest.raises(ValueError):
+            sums.get_table()
+
+    def test_angular(self):
+        # 2 protons at 90 degrees of F1 (P2 = -1/2), 1 proton of F2
+        universe = mda.Universe.empty(6, trajectory=True)
+        universe.add_TopologyAttr("names", ["F1", "H1", "H2", "F2", "H3", "H4"])
+        universe.atoms.positions = [[0, 0, 0], [1, 0, 0], [0, 2, 0],
+                                    [10, 0, 0], [10, 0, 2.5], [10, 5, 0]]
+        fh_dists = Calc_FH_Dists(universe, sum_only=True, angular=True).run()
+        expected = [1 + 2**-6 - 2 * 0.5 * 2**-3, 2.5**-6]
+        np.testing.assert_allclose(fh_dists.results.sum_p2_r6, [expected], rtol=1e-5)
+
+    def test_angular_minimum_image(self):
+        # double sum over the proton pairs, minimum image vectors in the triclinic box
+        from MDAnalysis.lib.distances import minimize_vectors
+        traj = mda.Universe(parm, crd)
+        fh_dists = Calc_FH_Dists(traj, dist=5, angular=True).run(stop=3)
+        for num, ts in enumerate(traj.trajectory[:3]):
+            frame_pairs = slice(fh_dists.results.indptr[num], fh_dists.results.indptr[num + 1])
+            protons = fh_dists.protons[fh_dists.results.proton_index[frame_pairs]]
+            vectors = minimize_vectors(protons.positions - fh_dists.fluorine.positions[0],
+                                       ts.dimensions)
+            r = np.linalg.norm(vectors, axis=1)
+            cos = (vectors @ vectors.T) / np.outer(r, r)
+            expected = np.sum((1.5 * cos**2 - 0.5) / np.outer(r**3, r**3))
+            np.testing.assert_allclose(fh_dists.results.sum_p2_r6[num, 0], expected, rtol=1e-4)
+
+    def test_parallel_run(self):
+        traj = mda.Universe(parm, crd)
+        serial = Calc_FH_Dists(traj, calc_relax=self.calc_relax).run()
+        parallel = Calc_FH_Dists(traj, calc_relax=self.calc_relax).run(n_workers=2,
+                                                                       backend="multiprocessing")
+        np.testing.assert_array_equal(parallel.frames, serial.frames)
+        for key in ["indptr", "fluorine_index", "proton_index", "distances", "r1_r2"]:
+            np.testing.assert_array_equal(parallel.results[key], serial.results[key])
+        np.testing.assert_allclose(parallel.calc_r1_r2(), serial.calc_r1_r2(self.calc_relax))
+
+class Test_Calc_19F_TCF():
+    """
+    Test the FFT time correlation function relaxation engine.
+    """
+
+    params = (8.2e-9, 14.0911, 11.2, -48.3, -112.8)
+
+    def test_calc_acf_fft(self):
+        x = np.random.default_rng(0).random((50, 2))
+        direct = [[np.mean(x[:50 - lag, num] * x[lag:, num]) for num in range(2)]
+                  for lag in range(50)]
+        np.testing.assert_allclose(calc_tcf.calc_acf_fft(x), direct, atol=1e-12)
+
+    def test_rigid_matches_kernel(self):
+        # rigid C-F with two protons: constant TCFs, so with tc the
+        # spectral densities are the rigid-rotor Lorentzians of the kernel
+        u = mda.Universe.empty(4, trajectory=True)
+        u.add_TopologyAttr("names", ["CZ", "FZ", "H1", "H2"])
+        u.add_TopologyAttr("bonds", [(0, 1)])
+        positions = np.array([[0, 0, 0], [1.35, 0, 0], [2, 2, 0], [1.35, 0, -2.5]])
+        u.load_new(np.tile(positions, (200, 1, 1)).astype(np.float32),
+                   format=mda.coordinates.memory.MemoryReader, dt=1)
+
+        tcf = calc_tcf.Calc_19F_TCF(u).run()
+        assert len(tcf.pair_protons) == 2
+        r1, r2 = tcf.calc_r1_r2(*self.params[1:], tc=self.params[0])
+
+        fh_dists = np.linalg.norm(positions[2:] - positions[1], axis=1)
+        kernel = fluorelax.get_relaxation_kernel(*self.params)
+        np.testing.assert_allclose([r1[0], r2[0]],
+                                   kernel.calc_r1_r2_from_r6(np.sum(fh_dists**-6)), rtol=1e-4)
+
+        # without tc, the TCFs are integrated without the overall tumbling
+        r1, r2 = tcf.calc_r1_r2(*self.params[1:], max_lag=50)
+        assert np.all(np.isfinite([r1, r2])) and np.all(r1 > 0)
+
+    def test_csa_constant(self):
+        calc_relax = fluorelax.Calc_19F_Relaxation(*self.params)
+        csa = calc_relax.calc_csa_r1() / calc_relax.J_csa_f
+        np.testing.assert_allclose(calc_csa_constant(
+            calc_relax.omegaF, *calc_csa_params(*self.params[2:])), csa)
+
+    def test_missing_bonds(self):
+        u = mda.Universe.empty(2, trajectory=True)
+        u.add_TopologyAttr("names", ["CZ", "FZ"])
+        with pytest.raises(ValueError):
+            calc_tcf.Calc_19F_TCF(u)
+
+class Test_Sweep():
+    """
+    Test the tc x magnet x CSA parameter sweep against single kernels.
+    """
+
+    tc = [6e-9, 8.2e-9]
+    magnet = [11.7, 14.1, 23.5]
+    sum_r6 = np.array([[0.01, 0.002], [0.02, 0.004], [0.015, 0.0]])
+
+    def test_calc_sweep(self):
+        for per_frame in (False, True):
+            cube = sweep.calc_sweep(self.sum_r6, self.tc, self.magnet, systems=["w4f", "w7f"],
+                                    per_frame=per_frame)
+            assert cube.r1.shape == (2, 2, 3) + (self.sum_r6.shape if per_frame else (2,))
+            kernel = fluorelax.get_relaxation_kernel(8.2e-9, 23.5,
+                                                     *fluorelax.CSA_TENSORS["w7f"])
+            r1, r2 = kernel.calc_r1_r2_from_r6(self.sum_r6)
+            if not per_frame:
+                r1, r2 = r1.mean(axis=0), r2.mean(axis=0)
+            np.testing.assert_allclose(cube.sel(system="w7f", tc=8.2e-9, magnet=23.5),
+                                       (r1, r2), rtol=1e-12)
+
+    def test_unknown_system(self):
+        with pytest.raises(ValueError):
+            sweep.calc_sweep(self.sum_r6, self.tc, self.magnet, systems=["w9f"])
+
+    @pytest.mark.parametrize("filename", ["sweep.tsv", "sweep.npz"])
+    def test_save_load(self, tmp_path, filename):
+        cube = sweep.calc_sweep(self.sum_r6, self.tc, self.magnet, per_frame=True)
+        cube.save(str(tmp_path / filename))
+        loaded = sweep.Relax_Sweep.load(str(tmp_path / filename))
+        assert loaded.dims == cube.dims
+        np.testing.assert_allclose(loaded.sel(system="w5f", magnet=14.1),
+                                   cube.sel(system="w5f", magnet=14.1))
+
+    def test_run_sweep(self):
+        cube = sweep.run_sweep(parm, crd, [8.2e-9], [14.1], systems=["w4f"], step=10,
+                               per_frame=True)
+        r1_r2 = fluorelax.run_pipeline(parm, crd, system="w4f", step=10)
+        np.testing.assert_allclose(cube.sel(system="w4f", tc=8.2e-9, magnet=14.1)[0][:, 0],
+                                   r1_r2[:, 1], rtol=1e-5)
+
+    def test_calc_sum_r6_cache(self, tmp_path):
+        frames, sum_r6 = sweep.calc_sum_r6(parm, crd, dist=4, start=5, step=7, chunk_size=6)
+        cached = sweep.calc_sum_r6(parm, crd, dist=4, start=5, step=7, chunk_size=6,
+                                   cache=cache.FH_Dist_Cache(str(tmp_path)))
+        np.testing.assert_array_equal(frames, np.arange(5, 101, 7))
+        np.testing.assert_array_equal(cached[0], frames)
+        np.testing.assert_allclose(cached[1], sum_r6)
+
+    def test_main_search_options(self, tmp_path, capsys, fluorelax_logger):
+        output_file = str(tmp_path / "sweep.npz")
+        sweep.main(["-c", crd, "-p", parm, "--sys", "w4f", "--step", "10", "--dist", "4",
+                    "--water", "-o", output_file])
+        loaded = sweep.Relax_Sweep.load(output_file)
+        assert loaded.metadata["dist"] == 4 and loaded.metadata["include_water"]
+        r1_r2 = fluorelax.run_pipeline(parm, crd, system="w4f", step=10, dist=4)
+        np.testing.assert_allclose(loaded.sel(system="w4f", tc=8.2e-9, magnet=14.1)[0],
+                                   r1_r2[:, 1].mean(), rtol=1e-5)
+
+class Test_FH_Dist_Cache():
+    """
+    Test the on-disk pair table cache and its LRU eviction.
+    """
+
+    def test_run_pipeline_cached(self, tmp_path, monkeypatch):
+        expected = fluorelax.run_pipeline(parm, crd, system="w4f", chunk_size=50)
+        cached = fluorelax.run_pipeline(parm, crd, system="w4f", cache_dir=str(tmp_path))
+        np.testing.assert_allclose(cached, expected)
+        assert len(os.listdir(tmp_path)) == 1
+
+        # a cache hit with new NMR parameters must not open the trajectory
+        def no_universe(*args, **kwargs):
+            raise AssertionError("trajectory was read")
+        monkeypatch.setattr(mda, "Universe", no_universe)
+        cached = fluorelax.run_pipeline(parm, crd, system="w5f", magnet=18.8,
+                                        cache_dir=str(tmp_path))
+        monkeypatch.undo()
+        expected = fluorelax.run_pipeline(parm, crd, system="w5f", magnet=18.8, chunk_size=50)
+        np.testing.assert_allclose(cached, expected)
+
+    def test_make_key(self, tmp_path):
+        selections = ["name F*", "name H*"]
+        key = cache.FH_Dist_Cache.make_key(parm, crd, 3, {"step" : 1}, selections)
+        assert key == cache.FH_Dist_Cache.make_key(parm, [crd], 3, {"step" : 1}, selections)
+        assert key != cache.FH_Dist_Cache.make_key(parm, crd, 4, {"step" : 1}, selections)
+        assert key != cache.FH_Dist_Cache.make_key(parm, crd, 3, {"step" : 2}, selections)
+
+    def test_lru_eviction(self, tmp_path):
+        table = {"frames" : np.arange(1000), "n_fluorine" : 1}
+        fh_cache = cache.FH_Dist_Cache(str(tmp_path), max_size=10**9)
+        for key in "abc":
+            fh_cache.save(key, table)
+            os.utime(tmp_path / f"{key}.npz", ns=(0, ord(key) * 10**9))
+        # reading a marks it as recently used, so b is the oldest
+        assert fh_cache.load("a") is not None
+        entry_size = os.path.getsize(tmp_path / "a.npz")
+        fh_cache.max_size = 2 * entry_size
+        fh_cache.evict()
+        assert sorted(os.listdir(tmp_path)) == ["a.npz", "c.npz"]
+        assert fh_cache.load("b") is None
+
+    def test_corrupt_entries(self, tmp_path):
+        fh_cache = cache.FH_Dist_Cache(str(tmp_path))
+        (tmp_path / "truncated.npz").write_bytes(b"PK\x03\x04 not a zip file")
+        np.savez(tmp_path / "incomplete.npz", frames=np.arange(3))
+        for key in ("truncated", "incomplete"):
+            assert fh_cache.load(key) is None
+            assert not (tmp_path / f"{key}.npz").exists()
+
+    def test_stale_tmp_files(self, tmp_path):
+        fh_cache = cache.FH_Dist_Cache(str(tmp_path))
+        stale = tmp_path / "a.npz.123.tmp"
+        fresh = tmp_path / "b.npz.456.tmp"
+        stale.write_bytes(b"0" * 100)
+        fresh.write_bytes(b"0" * 100)
+        os.utime(stale, (0, 0))
+        fh_cache.save("c", {"frames" : np.arange(10), "n_fluorine" : 1})
+        assert not stale.exists() and fresh.exists()
+        # the temporary files being written count towards max_size
+        fh_cache.max_size = os.path.getsize(tmp_path / "c.npz") + 50
+        fh_cache.evict()
+        assert not (tmp_path / "c.npz").exists()
+
+class Test_Tail_Correction():
+    """
+    Test the RDF based r^-6 tail correction of the truncated F-H sums.
+    """
+
+    def test_cutoffs_agree(self):
+        # over the same frames, truncated sum + tail does not depend on the cutoff
+        traj = mda.Universe(parm, crd)
+        rdf = tail_correction.Calc_FH_RDF(traj, r_max=12).run()
+        corrected = [Calc_FH_Dists(traj, dist=cutoff, tail_r6=rdf.calc_tail_r6(cutoff)).run()
+                     .calc_sum_r6().mean(axis=0) for cutoff in (2.5, 3, 6, 12)]
+        np.testing.assert_allclose(corrected, [corrected[-1]] * 4, rtol=1e-6)
+        assert rdf.calc_tail_r6(3)[0] > 0.1 * corrected[0][0]
+
+    def test_uniform_density(self):
+        # protons placed at random: g(r) = 1, the sampled tail is the analytic one
+        rng = np.random.default_rng(4)
+        u = mda.Universe.empty(20000, trajectory=False)
+        u.add_TopologyAttr("names", ["FZ"] * 100 + ["HZ"] * 19900)
+        u.load_new(rng.uniform(0, 60, (10, 20000, 3)).astype(np.float32), format=MemoryReader,
+                   dimensions=[60, 60, 60, 90, 90, 90])
+        rdf = tail_correction.Calc_FH_RDF(u, r_max=8).run()
+        assert rdf.results.density == pytest.approx(19900 / 60**3)
+        np.testing.assert_allclose(rdf.rdf.mean(axis=0)[60:], 1, atol=0.1)
+        np.testing.assert_allclose(rdf.calc_tail_r6(3).mean(),
+                                   tail_correction.calc_analytic_tail(3, rdf.results.density),
+                                   rtol=0.05)
+
+    def test_run_pipeline_tail(self, tmp_path):
+        truncated = fluorelax.run_pipeline(parm, crd, system="w4f")
+        corrected = fluorelax.run_pipeline(parm, crd, system="w4f", tail_correction=True)
+        assert np.all(corrected[:, 1:] > truncated[:, 1:])
+        cached = fluorelax.run_pipeline(parm, crd, system="w4f", tail_correction=True,
+                                        cache_dir=str(tmp_path))
+        np.testing.assert_allclose(cached, corrected)
+
+class Test_Running_Stats():
+    """
+    Test the online mean, variance and block averaged standard error.
+    """
+
+    # AR(1) series, correlated from frame to frame
+    rng = np.random.default_rng(1)
+    phi = 0.9
+    data = np.zeros((2**16, 2))
+    noise = rng.normal(size=data.shape)
+    for i in range(1, len(data)):
+        data[i] = phi * data[i - 1] + noise[i]
+
+    def test_moments(self):
+        stats = Running_Stats()
+        for chunk in np.array_split(self.data, 7):
+            stats.update(chunk)
+        assert stats.n == len(self.data)
+        np.testing.assert_allclose(stats.mean, self.data.mean(axis=0))
+        np.testing.assert_allclose(stats.stdev, self.data.std(axis=0, ddof=1))
+        assert len(stats.trace) == 7
+
+    def test_blocking_chunk_independent(self):
+        whole = Running_Stats().update(self.data)
+        chunked = Running_Stats()
+        for chunk in np.array_split(self.data, 13):
+            chunked.update(chunk)
+        np.testing.assert_allclose(chunked.block_sems, whole.block_sems)
+
+    def test_correlated_sem(self):
+        stats = Running_Stats().update(self.data)
+        # sem of the mean of an AR(1) series
+        expected = np.sqrt(1 / (1 - self.phi**2) / len(self.data)
+                           * (1 + self.phi) / (1 - self.phi))
+        np.testing.assert_allclose(stats.sem, expected, rtol=0.25)
+        assert np.all(stats.sem > 3 * stats.naive_sem)
+
+    def test_checkpoint_state(self):
+        stats = Running_Stats().update(self.data[:1001])
+        restored = Running_Stats.from_dict(json.loads(json.dumps(stats.to_dict())))
+        stats.update(self.data[1001:])
+        restored.update(self.data[1001:])
+        np.testing.assert_allclose(restored.block_sems, stats.block_sems)
+        np.testing.assert_allclose(restored.trace, stats.trace)
+
+    def test_run_pipeline_stats(self):
+        stats = Running_Stats()
+        r1_r2 = fluorelax.run_pipeline(parm, crd, system="w4f", chunk_size=20, stats=stats)
+        assert len(stats.trace) == 6
+        np.testing.assert_allclose(stats.mean, r1_r2[:, 1:].mean(axis=0))
+
+    def test_update_blocks(self):
+        stats = Running_Stats().update_blocks(self.data)
+        assert len(stats.trace) == Running_Stats.trace_points
+        np.testing.assert_allclose(stats.block_sems, Running_Stats().update(self.data).block_sems)
+        assert len(Running_Stats().update_blocks(self.data[:101], 20).trace) == 6
+
+    def test_main_convergence(self, tmp_path, fluorelax_logger):
+        from fluorelax.fluorelax import main
+        # without --chunk, and from the cached F-H pairs
+        for argv in ([], ["--cache_dir", str(tmp_path / "cache")]):
+            convergence_file = str(tmp_path / "convergence.tsv")
+            main(["-c", crd, "-p", parm, "--sys", "w4f", "--no_plot",
+                  "--convergence", convergence_file, *argv])
+            trace = np.loadtxt(convergence_file)
+            assert len(trace) > 1
+            assert trace[-1, 0] == 101
+
+class Test_Incremental():
+    """
+    Test appending the frames of a growing trajectory.
+    """
+
+    def write_frames(self, filename, frames):
+        u = mda.Universe(parm, crd)
+        with mda.Writer(filename, u.atoms.n_atoms) as writer:
+            for ts in u.trajectory[frames]:
+                writer.write(u.atoms)
+
+    def test_run_incremental(self, tmp_path):
+        seg1 = str(tmp_path / "seg1.dcd")
+        seg2 = str(tmp_path / "seg2.dcd")
+        output_file = str(tmp_path / "r1_r2.tsv")
+        self.write_frames(seg1, slice(0, 40))
+        self.write_frames(seg2, slice(40, None))
+        expected = fluorelax.run_pipeline(parm, [seg1, seg2], system="w4f", step=3,
+                                          chunk_size=1000)
+
+        new, stats = incremental.run_incremental(parm, [seg1], output_file, system="w4f",
+                                                 step=3, chunk_size=5)
+        assert len(new) == 14
+        # nothing new to process
+        new, stats = incremental.run_incremental(parm, [seg1], output_file, system="w4f",
+                                                 step=3, chunk_size=5)
+        assert len(new) == 0
+        # rows written by an interrupted run are dropped
+        with open(output_file, "a") as f:
+            f.write("1\t2\t3\n")
+        new, stats = incremental.run_incremental(parm, [seg1, seg2], output_file,
+                                                 system="w4f", step=3, chunk_size=5)
+
+        np.testing.assert_allclose(np.loadtxt(output_file), expected)
+        assert stats.n == len(expected)
+        np.testing.assert_allclose(stats.mean, expected[:, 1:].mean(axis=0))
+        np.testing.assert_allclose(stats.stdev, expected[:, 1:].std(axis=0, ddof=1))
+
+    def test_changed_parameters(self, tmp_path):
+        output_file = str(tmp_path / "r1_r2.tsv")
+        incremental.run_incremental(parm, crd, output_file, system="w4f", step=50)
+        with pytest.raises(ValueError):
+            incremental.run_incremental(parm, crd, output_file, system="w4f", tc=9e-9, step=50)
+        with pytest.raises(ValueError):
+            incremental.run_incremental(parm, crd, output_file, system="w4f", step=50,
+                                        include_water=True)
+
+    def test_missing_checkpoint(self, tmp_path):
+        output_file = str(tmp_path / "r1_r2.tsv")
+        incremental.run_incremental(parm, crd, output_file, system="w4f", step=50)
+        os.remove(incremental.get_checkpoint_file(output_file))
+        with open(output_file) as f:
+            rows = f.read()
+        # the earlier results are kept, not truncated
+        with pytest.raises(ValueError, match="no checkpoint"):
+            incremental.run_incremental(parm, crd, output_file, system="w4f", step=50)
+        with open(output_file) as f:
+            assert f.read() == rows
+
+    def test_main_append_options(self, tmp_path, capsys, fluorelax_logger):
+        from fluorelax.fluorelax import main
+        output_file = str(tmp_path / "r1_r2.tsv")
+        argv = ["-c", crd, "-p", parm, "--sys", "w4f", "--step", "50", "--no_plot",
+                "--append", "-o", output_file]
+        main(argv + ["--water", "--skin", "2"])
+        assert incremental.read_checkpoint(output_file)["params"]["include_water"]
+        for options in (["--format", "npz"], ["--cache_dir", str(tmp_path / "cache")]):
+            with pytest.raises(SystemExit):
+                main(argv + options)
+            assert "--append" in capsys.readouterr().err
+
+class Test_Segments():
+    """
+    Test the per-segment parallel analysis, its checkpoints and stitching.
+    """
+
+    def write_segments(self, tmp_path, bounds):
+        filenames = []
+        u = mda.Universe(parm, crd)
+        for num, (start, stop) in enumerate(zip(bounds[:-1], bounds[1:])):
+            filenames.append(str(tmp_path / f"seg{num}.dcd"))
+            with mda.Writer(filenames[-1], u.atoms.n_atoms) as writer:
+                for ts in u.trajectory[start:stop]:
+                    writer.write(u.atoms)
+        return filenames
+
+    def test_get_local_frames(self):
+        segment = {"frame_offset" : 30, "n_frames" : 35}
+        # global frames 32, 35, ... 62
+        assert segments.get_local_frames(segment, 5, 101, 3) == (2, 35, 3)
+        assert segments.get_local_frames(segment, 40, 50, 1) == (10, 20, 1)
+        # no frames in the segment
+        start, stop, step = segments.get_local_frames(segment, 70, 101, 1)
+        assert len(range(start, stop, step)) == 0
+
+    def test_run_segments(self, tmp_path):
+        filenames = self.write_segments(tmp_path, [0, 30, 65, 101])
+        work_dir = str(tmp_path / "segments")
+        expected = fluorelax.run_pipeline(parm, filenames, system="w4f", start=5, step=3)
+
+        r1_r2 = segments.run_segments(parm, filenames[:2], work_dir, system="w4f", start=5,
+                                      step=3, n_workers=2, chunk_size=7)
+        np.testing.assert_allclose(r1_r2, expected[:20])
+        done = [os.path.getmtime(os.path.join(work_dir, f"segment_{num:04d}.npz"))
+                for num in range(2)]
+
+        # only the added segment is analyzed
+        stats = Running_Stats()
+        output_file = str(tmp_path / "r1_r2.npz")
+        r1_r2 = segments.run_segments(parm, filenames, work_dir, system="w4f", start=5,
+                                      step=3, n_workers=2, output_file=output_file,
+                                      stats=stats)
+        np.testing.assert_allclose(r1_r2, expected)
+        assert done == [os.path.getmtime(os.path.join(work_dir, f"segment_{num:04d}.npz"))
+                        for num in range(2)]
+        assert stats.n == len(expected)
+        data = relax_io.load_r1_r2(output_file)
+        assert [segment["frame_offset"] for segment in data.metadata["segments"]] == [0, 30, 65]
+
+        # new parameters redo every segment
+        r1_r2 = segments.run_segments(parm, filenames, work_dir, system="w4f", tc=9e-9,
+                                      start=5, step=3)
+        np.testing.assert_allclose(r1_r2, fluorelax.run_pipeline(parm, filenames, system="w4f",
+                                                                 tc=9e-9, start=5, step=3))
+
+    def test_run_segments_time_window(self, tmp_path):
+        filenames = self.write_segments(tmp_path, [0, 30, 65, 101])
+        work_dir = str(tmp_path / "segments")
+        trajectory = mda.Universe(parm, filenames[0]).trajectory
+        t0, dt = trajectory[0].time, trajectory.dt
+        # begin in the last segment, past the end of the first one
+        r1_r2 = segments.run_segments(parm, filenames, work_dir, system="w4f",
+                                      begin_ps=t0 + 80 * dt, step=3)
+        np.testing.assert_allclose(r1_r2, fluorelax.run_pipeline(parm, crd, system="w4f",
+                                                                 start=80, step=3))
+        # still checked against the frames of all segments
+        with pytest.raises(ValueError, match="No frames selected"):
+            segments.run_segments(parm, filenames, work_dir, system="w4f",
+                                  begin_ps=t0 + 101 * dt)
+
+    def test_main_segments(self, tmp_path, capsys, fluorelax_logger):
+        from fluorelax.fluorelax import main
+        filenames = self.write_segments(tmp_path, [0, 50, 101])
+        output_file = str(tmp_path / "r1_r2.tsv")
+        main(["-c", *filenames, "-p", parm, "--sys", "w4f", "--step", "10", "--no_plot",
+              "--segments", str(tmp_path / "segments"), "-o", output_file])
+        np.testing.assert_allclose(np.loadtxt(output_file),
+                                   fluorelax.run_pipeline(parm, crd, system="w4f", step=10))
+        assert "R1-AVG" in capsys.readouterr().out
+
+class Test_Ensemble():
+    """
+    Test the multi-replicate ensemble driver.
+    """
+
+    def test_calc_ensemble_stats(self, tmp_path, caplog):
+        files = []
+        # replicates of different lengths, the last frame is dropped from the
+        # per-frame table, but not from the time average of the replicate
+        for num, r1_r2 in enumerate([[[0, 1, 10], [1, 2, 20], [2, 9, 9]],
+                                     [[0, 3, 30], [1, 4, 40]]]):
+            files.append(str(tmp_path / f"v{num:02d}.tsv"))
+            np.savetxt(files[-1], r1_r2, delimiter="\t")
+
+        with caplog.at_level("WARNING", logger="fluorelax"):
+            per_frame, overall = ensemble.calc_ensemble_stats(files)
+        assert "Replicates of 3, 2 frames" in caplog.text
+        np.testing.assert_allclose(per_frame[:, 0], [0, 1])
+        np.testing.assert_allclose(per_frame[:, 1:3], [[2, 20], [3, 30]])
+        np.testing.assert_allclose(per_frame[:, 3:5], [[np.sqrt(2), 10 * np.sqrt(2)]] * 2)
+        np.testing.assert_allclose(per_frame[:, 5:7], [[1, 10]] * 2)
+        # replicate averages (4, 13) and (3.5, 35)
+        np.testing.assert_allclose(overall, [[3.75, 24], [0.5 / np.sqrt(2), 22 / np.sqrt(2)],
+                                             [0.25, 11]])
+
+    def test_run_ensemble(self, tmp_path):
+        replicates = {"w4f" : [(parm, [crd]), (parm, [crd])]}
+        summary = ensemble.run_ensemble(replicates, output_dir=str(tmp_path), step=10)
+
+        r1_r2 = np.loadtxt(tmp_path / "w4f_v01_R1_R2.tsv")
+        assert len(r1_r2) == 11
+        np.testing.assert_allclose(summary["w4f"][0], np.mean(r1_r2[:, 1:], axis=0))
+        np.testing.assert_allclose(summary["w4f"][1:], 0)
+        with open(tmp_path / "w4f_R1_R2_avg.tsv") as f:
+            assert f.readline().split() == ["#", "frame", "R1", "R2", "R1_stdev", "R2_stdev",
+                                            "R1_sem", "R2_sem"]
+        assert (tmp_path / "ensemble_summary.tsv").exists()
+
+    def test_unknown_system(self, tmp_path):
+        ensemble_file = tmp_path / "ensemble.txt"
+        ensemble_file.write_text(f"w4f {parm} {crd}\nw9f {parm} {crd}\n")
+        with pytest.raises(ValueError, match="No CSA tensor for system 'w9f'"):
+            ensemble.read_ensemble_file(str(ensemble_file))
+
+    def test_main_parameters(self, tmp_path, capsys, fluorelax_logger):
+        ensemble_file = tmp_path / "ensemble.txt"
+        ensemble_file.write_text(f"w4f {parm} {crd}\n")
+        ensemble.main(["-e", str(ensemble_file), "-o", str(tmp_path), "--step", "10",
+                       "--tc", "9e-9", "--magnet", "11.7", "--dist", "4"])
+        expected = fluorelax.run_pipeline(parm, crd, system="w4f", step=10, tc=9e-9,
+                                          magnet=11.7, dist=4)
+        np.testing.assert_allclose(np.loadtxt(tmp_path / "w4f_v00_R1_R2.tsv"), expected)
+
+class Test_Relax_IO():
+    """
+    Test saving and lazily loading the per-frame R1 and R2 data.
+    """
+
+    # frame, R1, R2 of 2 fluorines
+    r1_r2 = np.column_stack([np.arange(5), np.random.default_rng(0).random((5, 4))])
+    metadata = {"tc" : 8.2e-9, "magnet" : 14.1, "system" : "w4f", "dist" : 3}
+
+    @pytest.mark.parametrize("filename", ["r1_r2.tsv", "r1_r2.npz", "r1_r2.h5"])
+    def test_save_load(self, tmp_path, filename):
+        if filename.endswith(".h5"):
+            pytest.importorskip("h5py")
+        relax_io.save_r1_r2(str(tmp_path / filename), self.r1_r2, metadata=self.metadata)
+        data = relax_io.load_r1_r2(str(tmp_path / filename))
+
+        np.testing.assert_array_equal(data[:, 0], self.r1_r2[:, 0])
+        np.testing.assert_array_equal(data[:, 1:], self.r1_r2[:, 1:])
+        np.testing.assert_array_equal(data[1:3, 2], self.r1_r2[1:3, 2])
+        np.testing.assert_array_equal(np.asarray(data), self.r1_r2)
+        if not filename.endswith(".tsv"):
+            assert data.metadata == self.metadata
+            assert data.columns == ["frame", "R1", "R2", "R1_1", "R2_1"]
+
+    @pytest.mark.parametrize("filename", ["r1_r2.npz", "r1_r2.h5"])
+    def test_close(self, tmp_path, filename):
+        if filename.endswith(".h5"):
+            pytest.importorskip("h5py")
+        relax_io.save_r1_r2(str(tmp_path / filename), self.r1_r2)
+        with relax_io.load_r1_r2(str(tmp_path / filename)) as data:
+            np.testing.assert_array_equal(data[:, 1], self.r1_r2[:, 1])
+        if filename.endswith(".h5"):
+            assert not data.store.id.valid
+        else:
+            assert data.store.fid is None
+        with pytest.raises((ValueError, AttributeError, KeyError)):
+            data[:, 2]
+
+    def test_plot_relaxation_from_file(self, tmp_path):
+        from fluorelax.plot_relax import Plot_Relaxation
+        relax_io.save_r1_r2(str(tmp_path / "r1_r2.dat"), self.r1_r2[:, :3], fmt="npz")
+        with Plot_Relaxation(str(tmp_path / "r1_r2.dat"), "dist", data_from_file=True,
+                             data_format="npz") as plotter:
+            # lazy, only the plotted columns are read
+            np.testing.assert_array_equal(plotter.data[:, 2], self.r1_r2[:, 2])
+            assert list(plotter.data._cache) == ["R2"]
+            store = plotter.data.store
+            # e.g. by pre_processing(), the file is still closed
+            plotter.data = np.asarray(plotter.data)
+        assert store.fid is None
+
+class Test_Run_Pipeline():
+    """
+    Test the in-process pipeline and the command line entry point.
+    """
+
+    def test_run_pipeline(self, tmp_path):
+        r1_r2 = fluorelax.run_pipeline(parm, crd, system="w4f", step=10,
+                                       output_file=str(tmp_path / "r1_r2.npz"))
+        kernel = fluorelax.get_relaxation_kernel(8.2e-9, 14.1, *fluorelax.CSA_TENSORS["w4f"])
+        # trajectory frame indices in the frame column
+        expected = Calc_FH_Dists(mda.Universe(parm, crd)).run(step=10).calc_r1_r2(kernel)
+        np.testing.assert_allclose(r1_r2, expected)
+
+        data = relax_io.load_r1_r2(str(tmp_path / "r1_r2.npz"))
+        np.testing.assert_array_equal(np.asarray(data), r1_r2)
+        assert data.metadata["system"] == "w4f"
+
+    @pytest.mark.parametrize("chunk_size", [None, 7])
+    def test_frame_range(self, chunk_size):
+        full = fluorelax.run_pipeline(parm, crd, system="w4f")
+        r1_r2 = fluorelax.run_pipeline(parm, crd, system="w4f", start=20, stop=61, step=4,
+                                       chunk_size=chunk_size)
+        np.testing.assert_allclose(r1_r2, full[20:61:4])
+        # frames 200220 to 200620 ps, 10 ps apart
+        r1_r2 = fluorelax.run_pipeline(parm, crd, system="w4f", begin_ps=200215,
+                                       end_ps=200620, step=4, chunk_size=chunk_size)
+        np.testing.assert_allclose(r1_r2, full[20:61:4])
+
+    def test_get_frame_range(self):
+        from fluorelax.calc_fh_dists import get_frame_range
+        trajectory = mda.Universe(parm, crd).trajectory
+        assert get_frame_range(trajectory, 5, None, 2) == (5, None, 2)
+        assert get_frame_range(trajectory, begin_ps=200020, end_ps=200030) == (0, 2, None)
+        assert get_frame_range(trajectory, begin_ps=0) == (0, None, None)
+        with pytest.raises(ValueError):
+            get_frame_range(trajectory, start=1, end_ps=200030)
+
+    def test_empty_frame_range(self, tmp_path, capsys, fluorelax_logger):
+        from fluorelax.fluorelax import main
+        for kwargs in ({"start" : 50, "stop" : 10}, {"begin_ps" : 300000},
+                       {"chunk_size" : 20, "start" : 200}):
+            with pytest.raises(ValueError, match="No frames selected"):
+                fluorelax.run_pipeline(parm, crd, system="w4f", **kwargs)
+        with pytest.raises(ValueError, match="No frames selected"):
+            tail_correction.calc_tail_r6(mda.Universe(parm, crd), start=50, stop=10)
+        with pytest.raises(ValueError, match="No frames selected"):
+            cache.get_fh_table(parm, crd, start=50, stop=10)
+        for argv in (["--start", "50", "--stop", "10"], ["--chunk", "20", "--start", "200"],
+                     ["--step", "0"]):
+            with pytest.raises((SystemExit, ValueError)):
+                main(["-c", crd, "-p", parm, "--sys", "w4f", "--no_plot", *argv])
+        assert "--stop 10 is not after --start 50" in capsys.readouterr().err
+
+    def test_main_system(self, capsys):
+        from fluorelax.fluorelax import main
+        for argv in ([], ["--sys", "w8f"], ["--append", "-o", "r1_r2.tsv"],
+                     ["--segments", "segments"]):
+            with pytest.raises(SystemExit):
+                main(["-c", crd, "-p", parm, "--no_plot", *argv])
+            assert "--sys needs one of the systems" in capsys.readouterr().err
+
+    def test_frame_arguments(self, capsys):
+        from fluorelax.command_line import create_cmd_arguments, handle_command_line
+        args = handle_command_line(create_cmd_arguments(),
+                                   ["-c", crd, "-p", parm, "--stride", "5", "--start", "3"])
+        assert (args.start, args.stop, args.step_size) == (3, None, 5)
+        with pytest.raises(SystemExit):
+            handle_command_line(create_cmd_arguments(),
+                                ["-c", crd, "-p", parm, "--start", "3", "--end_ps", "1e5"])
+        assert "not both" in capsys.readouterr().err
+
+    def test_run_pipeline_csa(self):
+        r1_r2 = fluorelax.run_pipeline(parm, crd, csa=fluorelax.CSA_TENSORS["w5f"], step=50)
+        expected = fluorelax.run_pipeline(parm, crd, system="w5f", step=50)
+        np.testing.assert_array_equal(r1_r2, expected)
+        with pytest.raises(ValueError):
+            fluorelax.run_pipeline(parm, crd, system="w8f")
+
+    @pytest.mark.parametrize("code, not_imported", [
+        ("import fluorelax", ["numpy", "MDAnalysis", "matplotlib"]),
+        ("from fluorelax.fluorelax import main\n"
+         "try:\n    main(['--help'])\nexcept SystemExit:\n    pass",
+         ["numpy", "MDAnalysis", "matplotlib", "pandas"]),
+        ("from fluorelax.fluorelax import main\n"
+         f"main(['-c', {crd!r}, '-p', {parm!r}, '--sys', 'w4f', '--step', '50', '--no_plot'])",
+         ["matplotlib", "pandas"]),
+    ])
+    def test_lazy_imports(self, code, not_imported):
+        # fresh interpreter, since the test suite itself already imported everything
+        check = f"\nimport sys\nassert not [m for m in {not_imported!r} if m in sys.modules]"
+        env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(data_dir)))
+        subprocess.run([sys.executable, "-c", code + check], env=env, check=True)
+
+
+class Test_Profiler():
+    """
+    Test the per-stage profiler of the pipeline and its --profile report.
+    """
+
+    @pytest.mark.parametrize("chunk_size", [None, 30])
+    def test_run_pipeline_profile(self, chunk_size, tmp_path):
+        profiler = profiling.Profiler()
+        r1_r2 = fluorelax.run_pipeline(parm, crd, system="w4f", chunk_size=chunk_size,
+                                       output_file=str(tmp_path / "r1_r2.tsv"),
+                                       profiler=profiler)
+        assert list(profiler.stages) == ["kernel", "load", "fh_dists", "output"]
+        report = profiler.to_dict()["stages"]
+        assert report["fh_dists"]["n_frames"] == len(r1_r2)
+        assert report["fh_dists"]["frames_per_s"] > 0
+        assert sum(report["fh_dists"]["latency"]["counts"]) == len(r1_r2)
+        assert "fh_dists per-frame latency" in profiler.summary()
+
+    def test_disabled(self):
+        profiler = profiling.Profiler(enabled=False)
+        fluorelax.run_pipeline(parm, crd, system="w4f", step=50, profiler=profiler)
+        assert profiler.stages == {}
+        fh_dists = Calc_FH_Dists(mda.Universe(parm, crd)).run(stop=5)
+        assert "frame_times" not in fh_dists.results
+
+    def test_parallel_frame_times(self):
+        fh_dists = Calc_FH_Dists(mda.Universe(parm, crd), time_frames=True).run(
+                   n_workers=2, backend="multiprocessing")
+        assert fh_dists.results.frame_times.shape == (101,)
+        assert np.all(fh_dists.results.frame_times > 0)
+
+    def test_profile_json(self, tmp_path, capsys, fluorelax_logger):
+        from fluorelax.fluorelax import main
+        main(["-c", crd, "-p", parm, "--sys", "w4f", "--step", "10", "--no_plot",
+              "--profile_json", str(tmp_path / "profile.json")])
+        assert "frames/s" in capsys.readouterr().out
+        with open(tmp_path / "profile.json") as f:
+            report = json.load(f)
+        assert report["stages"]["fh_dists"]["n_frames"] == 11
+
+@pytest.fixture
+def fluorelax_logger():
+    """
+    Restore the "fluorelax" logger after a test configures it, e.g. through main().
+    """
+    logger = log.logger
+    handlers, level, interval = list(logger.handlers), logger.level, log.progress_interval
+    yield logger
+    for handler in logger.handlers:
+        if handler not in handlers:
+            handler.close()
+    logger.handlers, log.progress_interval = handlers, interval
+    logger.setLevel(level)
+
+class Test_Logging():
+    """
+    Test the structured log records and the progress reports of the frame loops.
+    """
+
+    def test_json_formatter(self):
+        record = log.logger.makeRecord("fluorelax.test", 20, __file__, 1, "%d frames", (10,),
+                                       None, extra={"per_s" : 5.})
+        entry = json.loads(log.JSON_Formatter().format(record))
+        assert entry["level"] == "INFO"
+        assert entry["logger"] == "fluorelax.test"
+        assert entry["message"] == "10 frames"
+        assert entry["per_s"] == 5.
+        assert "args" not in entry
+
+    @pytest.mark.parametrize("chunk_size", [None, 30])
+    def test_progress(self, chunk_size, caplog, fluorelax_logger):
+        log.progress_interval = 0
+        fh_dists = Calc_FH_Dists(mda.Universe(parm, crd))
+        with caplog.at_level("INFO", logger="fluorelax"):
+            if chunk_size is None:
+                fh_dists.run()
+            else:
+                kernel = fluorelax.get_relaxation_kernel(8.2e-9, 14.1, 11.2, -48.3, -112.8)
+                fh_dists.run_chunked(kernel, chunk_size=chunk_size)
+        records = [record for record in caplog.records if hasattr(record, "n_done")]
+        assert records[-1].n_done == records[-1].total == 101
+        assert len(records) == (101 if chunk_size is None else 4)
+
+    def test_no_progress(self, caplog):
+        with caplog.at_level("WARNING", logger="fluorelax"):
+            fh_dists = Calc_FH_Dists(mda.Universe(parm, crd)).run(stop=5)
+        assert fh_dists._progress is None
+        assert not caplog.records
+
+    def test_overall_r1_r2_print(self, caplog):
+        calc_relax = fluorelax.Calc_19F_Relaxation(8.2e-9, 14.1, 11.2, -48.3, -112.8, 2.3)
+        with caplog.at_level("INFO", logger="fluorelax"):
+            with pytest.deprecated_call():
+                r1_r2 = calc_relax.calc_overall_r1_r2(print=True)
+        assert r1_r2 == calc_relax.calc_overall_r1_r2()
+        assert [record.message.split(":")[0] for record in caplog.records] == ["R1dd"]
+
+    def test_main_json_log(self, tmp_path, fluorelax_logger):
+        from fluorelax.fluorelax import main
+        log_file = tmp_path / "fluorelax.log"
+        main(["-c", crd, "-p", parm, "--sys", "w4f", "--step", "10", "--no_plot",
+              "--log_format", "json", "--log_file", str(log_file)])
+        with open(log_file) as f:
+            entries = [json.loads(line) for line in f]
+        assert entries[-1]["n_frames"] == 11
+        assert any(entry.get("n_done") == 11 for entry in entries)
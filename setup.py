@@ -33,7 +33,7 @@ setup(
     # Which Python importable modules should be included when your package is installed
     # Handled automatically by setuptools. Use 'exclude' to prevent some specific
     # subpackage(s) from being added, if needed
-    packages=find_packages(),
+    packages=find_packages(exclude=["benchmarks", "benchmarks.*"]),
 
     # Optional include package data to ship with your package
     # Customize MANIFEST.in if the general case does not suit your needs
@@ -43,14 +43,26 @@ setup(
     # Allows `setup.py test` to work correctly with pytest
     setup_requires=[] + pytest_runner,
 
+    # Same as requirements.txt, the parallel analysis needs MDAnalysis >= 2.8
+    # (and MDAnalysis 2.8 needs Python >= 3.10)
+    install_requires=["numpy", "matplotlib", "MDAnalysis>=2.8", "pandas", "scipy"],
+    python_requires=">=3.10",
+
+    # Command line programs installed with the package
+    entry_points={
+        "console_scripts": [
+            "fluorelax = fluorelax.fluorelax:main",
+            "fluorelax-ensemble = fluorelax.ensemble:main",
+            "fluorelax-sweep = fluorelax.sweep:main",
+        ],
+    },
+
     # Additional entries you may want simply uncomment the lines you want and fill in the data
     # url='http://www.my_package.com',  # Website
-    # install_requires=[],              # Required packages, pulls from pip if needed; do not use for Conda deployment
     # platforms=['Linux',
     #            'Mac OS-X',
     #            'Unix',
     #            'Windows'],            # Valid platforms your code works on, adjust to your flavor
-    # python_requires=">=3.5",          # Python version restrictions
 
     # Manual control if final package is compressible or not, set False to prevent the .egg from being made
     # zip_safe=False,